@@ -6,6 +6,7 @@
 from flask import Flask, request
 import traceback
 from extensions import get_db, close_db, money, format_date
+import metrics
 from routes.auth import auth_bp
 from routes.client import client_bp
 from routes.case import case_bp
@@ -39,6 +40,7 @@ def create_app():
     app.secret_key = 'supersecretkey'  # TODO: move to env var
 
     app.teardown_appcontext(close_db)
+    metrics.init_app(app)
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(client_bp)
@@ -0,0 +1,79 @@
+# =============================================================================
+#  BENCHMARK - CASE BALANCES: PER-CASE LOOP vs LEDGER GROUPED QUERY
+#  Usage:  DATABASE_URL=... python benchmarks/case_balances.py --client-id 1
+#  Prints query count and latency for the old per-case loop (one money query
+#  per case) and for ledger.case_balances (one grouped query), and checks
+#  both give the same balances.
+# =============================================================================
+
+import argparse
+import os
+import sys
+import time
+from decimal import Decimal
+
+import psycopg
+from psycopg.rows import dict_row
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ledger import case_balances  # noqa: E402
+
+
+def legacy_balances(c, case_ids):
+    # The loop routes/case.py and routes/client.py used before the ledger module.
+    balances = {}
+    for case_id in case_ids:
+        c.execute("SELECT type, amount, recoverable FROM money WHERE case_id = %s", (case_id,))
+        balance = Decimal('0')
+        for t in c.fetchall():
+            amt = Decimal(str(t['amount'] or 0))
+            if t['type'] == 'Payment':
+                balance -= amt
+            elif t['type'] in ['Invoice', 'Interest']:
+                balance += amt
+            elif t['type'] == 'Charge' and t['recoverable']:
+                balance += amt
+        balances[case_id] = balance.quantize(Decimal('0.01'))
+    return balances, len(case_ids)
+
+
+def ledger_balances(c, case_ids):
+    return case_balances(c, case_ids), 1
+
+
+def timed(fn, c, case_ids, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result, queries = fn(c, case_ids)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, queries, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-case balance loop vs ledger.case_balances")
+    parser.add_argument('--client-id', type=int, required=True)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with psycopg.connect(os.environ['DATABASE_URL'], row_factory=dict_row) as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM cases WHERE client_id = %s ORDER BY id", (args.client_id,))
+        case_ids = [row['id'] for row in c.fetchall()]
+
+        old, old_queries, old_time = timed(legacy_balances, c, case_ids, args.repeat)
+        new, new_queries, new_time = timed(ledger_balances, c, case_ids, args.repeat)
+
+    mismatches = [case_id for case_id in case_ids if abs(old[case_id] - new[case_id]) > Decimal('0.01')]
+    print(f"cases:            {len(case_ids)}")
+    print(f"per-case loop:    {old_queries:>7} queries  {old_time * 1000:10.1f} ms")
+    print(f"ledger grouped:   {new_queries:>7} queries  {new_time * 1000:10.1f} ms")
+    if new_time:
+        print(f"speed-up:         {old_time / new_time:10.1f}x")
+    print(f"mismatched cases: {len(mismatches)}")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
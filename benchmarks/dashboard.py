@@ -0,0 +1,129 @@
+# =============================================================================
+#  BENCHMARK - CASE DASHBOARD: SEQUENTIAL vs PIPELINED QUERIES
+#  Usage:  DATABASE_URL=... python benchmarks/dashboard.py --case-id 2 --latency-ms 5
+#  Runs the real /dashboard view through the Flask test client against a
+#  local TCP proxy that delays every client->server packet by --latency-ms,
+#  standing in for a database on the far side of a network. Reports, for
+#  DASHBOARD_PIPELINE off and on, round trips per view (packets the proxy
+#  forwarded to Postgres) and p50/p95 latency.
+# =============================================================================
+
+import argparse
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import psycopg
+
+
+class LatencyProxy:
+    """TCP proxy to Postgres that sleeps before forwarding each client packet."""
+
+    def __init__(self, conninfo, latency):
+        params = psycopg.conninfo.conninfo_to_dict(conninfo)
+        host = params.get('host') or '/tmp'
+        port = int(params.get('port') or 5432)
+        self.target = (socket.AF_UNIX, f"{host}/.s.PGSQL.{port}") if host.startswith('/') \
+            else (socket.AF_INET, (host, port))
+        self.latency = latency
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(64)
+        self.port = self.listener.getsockname()[1]
+        self.conninfo = psycopg.conninfo.make_conninfo(conninfo, host='127.0.0.1', port=self.port)
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            client, _ = self.listener.accept()
+            server = socket.socket(self.target[0])
+            server.connect(self.target[1])
+            threading.Thread(target=self._pipe, args=(client, server, True), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(server, client, False), daemon=True).start()
+
+    def _pipe(self, src, dst, upstream):
+        try:
+            while True:
+                data = src.recv(65536)
+                if not data:
+                    break
+                if upstream:
+                    with self._lock:
+                        self.round_trips += 1
+                    time.sleep(self.latency)
+                dst.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (src, dst):
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dashboard latency with and without pipelining")
+    parser.add_argument('--case-id', type=int, required=True)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help="delay added per client->server packet")
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--username', default='bench')
+    parser.add_argument('--password', default='bench')
+    args = parser.parse_args()
+
+    proxy = LatencyProxy(os.environ['DATABASE_URL'], args.latency_ms / 1000)
+    os.environ['DATABASE_URL'] = proxy.conninfo
+    os.environ.setdefault('DB_POOL_MIN_SIZE', '1')
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path.insert(0, root)
+    os.chdir(root)
+    from app import app
+    import routes.case
+
+    app.config['TESTING'] = True
+    client = app.test_client()
+    response = client.post('/login', data={'username': args.username, 'password': args.password})
+    if response.status_code != 302:
+        raise SystemExit(f"Login as {args.username} failed ({response.status_code})")
+
+    url = f"/dashboard?case_id={args.case_id}"
+    results = {}
+    for label, pipelined in (('sequential', False), ('pipelined', True)):
+        routes.case.DASHBOARD_PIPELINE = pipelined
+        client.get(url)  # warm the pool and caches
+        latencies = []
+        start_trips = proxy.round_trips
+        for _ in range(args.requests):
+            start = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                raise SystemExit(f"{url} returned {response.status_code}")
+        results[label] = {
+            'round_trips': (proxy.round_trips - start_trips) / args.requests,
+            'p50': statistics.median(latencies),
+            'p95': percentile(latencies, 95),
+        }
+
+    print(f"/dashboard case {args.case_id}, {args.requests} requests, +{args.latency_ms:g} ms per round trip")
+    for label, r in results.items():
+        print(f"  {label:<11} {r['round_trips']:5.1f} round trips/view   p50 {r['p50']:7.1f} ms   p95 {r['p95']:7.1f} ms")
+    seq, pipe = results['sequential'], results['pipelined']
+    print(f"  round trips -{seq['round_trips'] - pipe['round_trips']:.1f}, "
+          f"p95 {pipe['p95'] / seq['p95'] * 100 - 100:+.0f}%")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,296 @@
+# =============================================================================
+#  BENCHMARK - CONCURRENT LOAD TEST UNDER GUNICORN
+#  Usage:  DATABASE_URL=.../harbour_bench python benchmarks/loadtest.py \
+#              [--workers 1 2 4] [--threads 1 4] [--agents 16] [--duration 30]
+#  Run benchmarks/seed.py against the same database first. For every
+#  workers x threads combination this starts `gunicorn app:app` locally,
+#  logs --agents simulated users in (each on its own keep-alive connection)
+#  and replays a weighted traffic mix against it, closed loop:
+#      dashboard views, /search typeahead bursts (one request per keystroke),
+#      add_note / add_transaction posts, report page and Excel exports
+#  Reports throughput, p50/p95/p99 latency (overall and per action), errors
+#  and Postgres connections (pg_stat_activity, sampled every 0.5s), prints a
+#  table and writes everything to JSON (default benchmarks/results/).
+#  Writes are real: notes and transactions land on the benchmark database.
+# =============================================================================
+
+import argparse
+import http.client
+import json
+import os
+import random
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+import psycopg
+from psycopg.rows import dict_row
+
+from run import ROOT, git_revision, percentile, pick_targets
+
+# action -> weight in the traffic mix
+TRAFFIC_MIX = {
+    'dashboard': 40,
+    'search_burst': 20,
+    'add_note': 15,
+    'add_transaction': 10,
+    'report_page': 10,
+    'export_excel': 5,
+}
+
+
+class Agent:
+    """One simulated user: a logged-in session on a persistent HTTP connection."""
+
+    def __init__(self, port, rng, targets):
+        self.port = port
+        self.rng = rng
+        self.targets = targets
+        self.cookies = {}
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+
+    def request(self, method, path, form=None):
+        headers = {'Cookie': '; '.join(f"{k}={v}" for k, v in self.cookies.items())}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.conn.request(method, path, body=body, headers=headers)
+            response = self.conn.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=120)
+            raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            for name, morsel in SimpleCookie(header).items():
+                self.cookies[name] = morsel.value
+        return response.status
+
+    def login(self, username, password):
+        status = self.request('POST', '/login', {'username': username, 'password': password})
+        if status != 302:
+            raise SystemExit(f"Login as {username} failed ({status}) - run benchmarks/seed.py")
+
+    def actions(self, action):
+        """Yield (label, method, path, form) for one action; a search burst is several requests."""
+        case_id = self.rng.choice(self.targets['case_ids'])
+        client_id = self.targets['client_id']
+        if action == 'dashboard':
+            yield 'dashboard', 'GET', f"/dashboard?case_id={case_id}", None
+        elif action == 'search_burst':
+            term = self.rng.choice(self.targets['terms'])
+            for n in range(2, len(term) + 1):
+                yield 'search', 'GET', f"/search?{urlencode({'q': term[:n]})}", None
+        elif action == 'add_note':
+            yield 'add_note', 'POST', '/add_note', {
+                'case_id': case_id, 'type': 'Outbound Call', 'note': 'Load test call, no answer.'}
+        elif action == 'add_transaction':
+            yield 'add_transaction', 'POST', '/add_transaction', {
+                'case_id': case_id, 'type': 'Payment', 'amount': f"{self.rng.uniform(5, 200):.2f}",
+                'note': 'Load test payment'}
+        elif action == 'report_page':
+            yield 'report_page', 'GET', f"/report?client_id={client_id}", None
+        elif action == 'export_excel':
+            yield 'export_excel', 'GET', f"/export_excel?client_id={client_id}", None
+
+
+def load_targets(database_url):
+    with psycopg.connect(database_url, row_factory=dict_row) as conn:
+        c = conn.cursor()
+        client_id, _, _ = pick_targets(c)
+        c.execute("SELECT id FROM cases WHERE client_id = %s ORDER BY id LIMIT 500", (client_id,))
+        case_ids = [row['id'] for row in c.fetchall()]
+        c.execute("""
+            SELECT DISTINCT lower(COALESCE(debtor_business_name, debtor_last)) AS name
+            FROM cases WHERE client_id = %s LIMIT 200
+        """, (client_id,))
+        terms = [row['name'].split()[0][:6] for row in c.fetchall() if row['name']]
+    return {'client_id': client_id, 'case_ids': case_ids, 'terms': terms or ['ltd']}
+
+
+def start_gunicorn(workers, threads, port, log, timeout=60):
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:app', '--workers', str(workers), '--threads', str(threads),
+           '--bind', f"127.0.0.1:{port}", '--log-level', 'warning', '--timeout', '120']
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=os.environ.copy(), stdout=log, stderr=log)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"gunicorn exited with {proc.returncode} (see {log.name})")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/login')
+            if conn.getresponse().status == 200:
+                return proc
+        except OSError:
+            time.sleep(0.2)
+    stop_gunicorn(proc)
+    raise SystemExit(f"gunicorn did not answer on port {port} within {timeout}s")
+
+
+def stop_gunicorn(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+class ConnectionSampler(threading.Thread):
+    """Samples this database's backends in pg_stat_activity every `interval` seconds."""
+
+    def __init__(self, database_url, interval=0.5):
+        super().__init__(daemon=True)
+        self.database_url = database_url
+        self.interval = interval
+        self.samples = []
+        self.stopping = threading.Event()
+
+    def run(self):
+        with psycopg.connect(self.database_url, autocommit=True, row_factory=dict_row) as conn:
+            while not self.stopping.is_set():
+                rows = conn.execute("""
+                    SELECT COALESCE(state, 'unknown') AS state, COUNT(*) AS n
+                    FROM pg_stat_activity
+                    WHERE datname = current_database() AND pid <> pg_backend_pid()
+                    GROUP BY 1
+                """).fetchall()
+                by_state = {row['state']: row['n'] for row in rows}
+                self.samples.append((sum(by_state.values()), by_state.get('active', 0)))
+                self.stopping.wait(self.interval)
+
+    def summary(self):
+        if not self.samples:
+            return {}
+        totals = [total for total, _ in self.samples]
+        active = [a for _, a in self.samples]
+        return {
+            'pg_connections_max': max(totals),
+            'pg_connections_mean': round(statistics.fmean(totals), 1),
+            'pg_active_max': max(active),
+            'pg_active_mean': round(statistics.fmean(active), 1),
+        }
+
+
+def run_config(workers, threads, args, targets, log):
+    proc = start_gunicorn(workers, threads, args.port, log)
+    sampler = ConnectionSampler(os.environ['DATABASE_URL'])
+    records = []  # (label, latency_ms, ok, finished_at)
+    records_lock = threading.Lock()
+    start_at = time.monotonic() + args.warmup
+    stop_at = start_at + args.duration
+    actions, weights = zip(*TRAFFIC_MIX.items())
+
+    def agent_loop(seed):
+        rng = random.Random(seed)
+        agent = Agent(args.port, rng, targets)
+        agent.login(args.username, args.password)
+        while time.monotonic() < stop_at:
+            for label, method, path, form in agent.actions(rng.choices(actions, weights)[0]):
+                began = time.monotonic()
+                try:
+                    ok = agent.request(method, path, form) < 400
+                except (OSError, http.client.HTTPException):
+                    ok = False
+                finished = time.monotonic()
+                with records_lock:
+                    records.append((label, (finished - began) * 1000, ok, finished))
+                if args.think_ms:
+                    time.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+    try:
+        sampler.start()
+        agents = [threading.Thread(target=agent_loop, args=(args.seed + i,), daemon=True)
+                  for i in range(args.agents)]
+        for t in agents:
+            t.start()
+        for t in agents:
+            t.join()
+    finally:
+        sampler.stopping.set()
+        sampler.join()
+        stop_gunicorn(proc)
+
+    measured = [r for r in records if start_at <= r[3] <= stop_at]
+    result = {'workers': workers, 'threads': threads, 'agents': args.agents, **summarize(measured, args.duration),
+              **sampler.summary(), 'actions': {}}
+    for label in sorted({r[0] for r in measured}):
+        result['actions'][label] = summarize([r for r in measured if r[0] == label], args.duration)
+    return result
+
+
+def summarize(records, duration):
+    latencies = [r[1] for r in records if r[2]]
+    summary = {'requests': len(records), 'errors': sum(1 for r in records if not r[2]),
+               'throughput_rps': round(len(latencies) / duration, 1)}
+    if latencies:
+        summary.update({
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+        })
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the app under gunicorn across worker/thread counts")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4])
+    parser.add_argument('--agents', type=int, default=16, help="concurrent simulated users")
+    parser.add_argument('--duration', type=float, default=30, help="measured seconds per configuration")
+    parser.add_argument('--warmup', type=float, default=5, help="unmeasured seconds before each measurement")
+    parser.add_argument('--think-ms', type=float, default=0, help="mean pause between requests per agent")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--out', help="JSON output path")
+    parser.add_argument('--server-log', default=os.path.join(tempfile.gettempdir(), 'harbour_loadtest_server.log'),
+                        help="gunicorn output, including the slow request log")
+    parser.add_argument('--username', default='bench')
+    parser.add_argument('--password', default='bench')
+    args = parser.parse_args()
+
+    targets = load_targets(os.environ['DATABASE_URL'])
+    print(f"client {targets['client_id']}, {len(targets['case_ids'])} cases, {args.agents} agents, "
+          f"{args.duration:g}s per configuration")
+    print(f"{'workers':>7} {'threads':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>6} {'pg conn':>7} {'pg active':>9}")
+
+    results = []
+    log = open(args.server_log, 'a')
+    for workers in args.workers:
+        for threads in args.threads:
+            r = run_config(workers, threads, args, targets, log)
+            results.append(r)
+            print(f"{workers:>7} {threads:>7} {r['throughput_rps']:>8} {r.get('p50_ms', '-'):>8} "
+                  f"{r.get('p95_ms', '-'):>8} {r.get('p99_ms', '-'):>8} {r['errors']:>6} "
+                  f"{r.get('pg_connections_max', '-'):>7} {r.get('pg_active_max', '-'):>9}")
+
+    revision = git_revision()
+    out = args.out or os.path.join(ROOT, 'benchmarks', 'results',
+                                   f"loadtest-{datetime.now():%Y%m%d-%H%M%S}-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump({
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'git_revision': revision,
+            'traffic_mix': TRAFFIC_MIX,
+            'duration': args.duration,
+            'think_ms': args.think_ms,
+            'runs': results,
+        }, f, indent=2)
+    log.close()
+    print(f"Wrote {out} (server log: {args.server_log})")
+    return 1 if any(r['errors'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,235 @@
+# =============================================================================
+#  BENCHMARK - KEY PAGES THROUGH THE FLASK TEST CLIENT
+#  Usage:  DATABASE_URL=.../harbour_bench python benchmarks/run.py \
+#              [--repeat 20] [--out results.json] [--baseline old.json]
+#  Run benchmarks/seed.py against the same database first. Times the pages
+#  agents and clients hit hardest, in-process (no network, no gunicorn):
+#      dashboard (case selected), client_dashboard, /search, report_page,
+#      export_excel, export_pdf (cold render: submit, poll, download)
+#  Each page gets --warmup untimed requests, then --repeat timed ones. SQL
+#  query count and DB time per request come from the metrics module.
+#  Results (p50/p95/min/max ms, queries, DB ms, bytes) plus the git revision
+#  and data set size are written as JSON, by default to
+#  benchmarks/results/<timestamp>-<rev>.json. With --baseline, pages whose
+#  p95 grew by more than --tolerance are listed and the exit code is 1.
+# =============================================================================
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def pick_targets(c):
+    """The busiest client, its case with the longest ledger, and a search term from that case."""
+    c.execute("SELECT client_id FROM cases GROUP BY client_id ORDER BY COUNT(*) DESC, client_id LIMIT 1")
+    row = c.fetchone()
+    if not row:
+        raise SystemExit("No cases found - run benchmarks/seed.py first")
+    client_id = row['client_id']
+    c.execute("""
+        SELECT s.id, COALESCE(s.debtor_business_name, s.debtor_last) AS debtor
+        FROM cases s
+        LEFT JOIN money m ON m.case_id = s.id
+        WHERE s.client_id = %s
+        GROUP BY s.id
+        ORDER BY COUNT(m.id) DESC, s.id
+        LIMIT 1
+    """, (client_id,))
+    case = c.fetchone()
+    term = (case['debtor'] or 'ltd').split()[0][:4]
+    return client_id, case['id'], term
+
+
+def dataset_size(c):
+    sizes = {}
+    for table in ('clients', 'cases', 'money', 'notes', 'case_custom_values'):
+        c.execute(f"SELECT COUNT(*) AS n FROM {table}")
+        sizes[table] = c.fetchone()['n']
+    c.execute("SHOW server_version")
+    sizes['postgres'] = c.fetchone()['server_version']
+    return sizes
+
+
+def export_pdf_cold(client, client_id, cache_dir, timeout=300):
+    """One cold PDF export: clear the cache, submit, poll until done, download."""
+    for name in os.listdir(cache_dir):
+        os.remove(os.path.join(cache_dir, name))
+    response = client.post('/export_pdf/jobs', data={'client_id': client_id})
+    if response.status_code != 202:
+        return response
+    job = response.get_json()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(job['status_url']).get_json()
+        if status['status'] == 'done':
+            return client.get(job['download_url'])
+        if status['status'] != 'running':
+            raise RuntimeError(f"PDF job {job['job_id']} {status['status']}: {status.get('error')}")
+        time.sleep(0.05)
+    raise RuntimeError(f"PDF job {job['job_id']} did not finish in {timeout}s")
+
+
+def measure(client, request_fn, repeat, warmup, last_request):
+    for _ in range(warmup):
+        request_fn()
+    latencies, queries, db_ms = [], [], []
+    size = status = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = request_fn()
+        latencies.append((time.perf_counter() - start) * 1000)
+        status, size = response.status_code, len(response.get_data())
+        if status >= 400:
+            raise RuntimeError(f"returned {status}")
+        queries.append(last_request['queries'])
+        db_ms.append(last_request['seconds'] * 1000)
+    return {
+        'status': status,
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'min_ms': round(min(latencies), 2),
+        'max_ms': round(max(latencies), 2),
+        'mean_ms': round(statistics.fmean(latencies), 2),
+        'queries': round(statistics.fmean(queries), 1),
+        'db_ms': round(statistics.fmean(db_ms), 2),
+        'bytes': size,
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    regressions = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if not old or 'p95_ms' not in old or 'p95_ms' not in result:
+            continue
+        change = result['p95_ms'] / old['p95_ms'] - 1 if old['p95_ms'] else 0
+        marker = '  REGRESSION' if change > tolerance else ''
+        print(f"  {name:<18} p95 {old['p95_ms']:9.1f} -> {result['p95_ms']:9.1f} ms ({change * 100:+.0f}%)"
+              f"  queries {old['queries']} -> {result['queries']}{marker}")
+        if change > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the key pages against a seeded database")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--pdf-repeat', type=int, default=3, help="cold PDF renders are slow; fewer by default")
+    parser.add_argument('--only', nargs='*', help="page names to run (default: all)")
+    parser.add_argument('--out', help="JSON output path")
+    parser.add_argument('--baseline', help="earlier results JSON to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="allowed p95 growth vs baseline (0.2 = 20%%)")
+    parser.add_argument('--username', default='bench')
+    parser.add_argument('--password', default='bench')
+    args = parser.parse_args()
+
+    # Fresh PDF cache so export_pdf is always measured cold.
+    cache_dir = tempfile.mkdtemp(prefix='harbour_bench_pdf_')
+    os.environ['PDF_CACHE_DIR'] = cache_dir
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from flask import g
+    from app import app
+    from extensions import get_pool
+
+    app.config['TESTING'] = True
+    last_request = {}
+
+    @app.after_request
+    def _capture_sql(response):
+        last_request.update(g.get('sql_stats') or {'queries': 0, 'seconds': 0.0})
+        return response
+
+    client = app.test_client()
+    response = client.post('/login', data={'username': args.username, 'password': args.password})
+    if response.status_code != 302:
+        raise SystemExit(f"Login as {args.username} failed ({response.status_code}) - run benchmarks/seed.py")
+
+    with get_pool().connection() as conn:
+        c = conn.cursor()
+        client_id, case_id, term = pick_targets(c)
+        dataset = dataset_size(c)
+
+    pages = {
+        'dashboard': lambda: client.get(f"/dashboard?case_id={case_id}"),
+        'client_dashboard': lambda: client.get(f"/client/{client_id}"),
+        'search': lambda: client.get(f"/search?q={term}"),
+        'report_page': lambda: client.get(f"/report?client_id={client_id}"),
+        'export_excel': lambda: client.get(f"/export_excel?client_id={client_id}"),
+        'export_pdf': lambda: export_pdf_cold(client, client_id, cache_dir),
+    }
+    print(f"client {client_id}, case {case_id}, search '{term}'; "
+          f"{dataset['cases']:,} cases, {dataset['money']:,} money rows, {dataset['notes']:,} notes")
+
+    results = {}
+    try:
+        for name, request_fn in pages.items():
+            if args.only and name not in args.only:
+                continue
+            repeat = args.pdf_repeat if name == 'export_pdf' else args.repeat
+            warmup = 0 if name == 'export_pdf' else args.warmup
+            try:
+                results[name] = measure(client, request_fn, repeat, warmup, last_request)
+            except RuntimeError as e:
+                results[name] = {'error': str(e)}
+                print(f"  {name:<18} FAILED: {e}")
+                continue
+            r = results[name]
+            print(f"  {name:<18} p50 {r['p50_ms']:9.1f} ms  p95 {r['p95_ms']:9.1f} ms  "
+                  f"{r['queries']:5.1f} queries  db {r['db_ms']:8.1f} ms  {r['bytes']:>10,} bytes")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    revision = git_revision()
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': revision,
+        'python': platform.python_version(),
+        'repeat': args.repeat,
+        'targets': {'client_id': client_id, 'case_id': case_id, 'search': term},
+        'dataset': dataset,
+        'results': results,
+    }
+    out = args.out or os.path.join(ROOT, 'benchmarks', 'results',
+                                   f"{datetime.now():%Y%m%d-%H%M%S}-{revision}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {out}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        if regressions:
+            print(f"p95 regressions over {args.tolerance:.0%}: {', '.join(regressions)}")
+            return 1
+    return 1 if any('error' in r for r in results.values()) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
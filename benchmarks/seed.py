@@ -0,0 +1,230 @@
+# =============================================================================
+#  BENCHMARK - SYNTHETIC DATA SET
+#  Usage:  DATABASE_URL=postgresql://.../harbour_bench python benchmarks/seed.py \
+#              [--recreate] [--clients 20] [--cases-per-client 500]
+#              [--money-per-case 8] [--notes-per-case 5] [--custom-fields 8]
+#  Builds the schema with init_db.init_db and streams realistic-looking
+#  clients, cases, ledger rows, notes and custom field values in with COPY.
+#  Output is deterministic for a given --seed, so runs are comparable.
+#  --recreate drops and re-creates the database named in DATABASE_URL first;
+#  without it rows are appended to whatever is there.
+#  Also creates the login the runner uses (bench / bench).
+# =============================================================================
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+import bcrypt
+import psycopg
+from psycopg import sql
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from init_db import init_db  # noqa: E402
+
+BENCH_USER = 'bench'
+BENCH_PASSWORD = 'bench'
+
+WORDS = ('Harbour', 'Anchor', 'North', 'Bridge', 'Oak', 'Summit', 'Crown', 'Vale', 'River', 'Castle',
+         'Granite', 'Meadow', 'Atlas', 'Beacon', 'Cedar', 'Falcon', 'Willow', 'Kestrel', 'Orchard', 'Quay')
+TRADES = ('Logistics', 'Builders', 'Dental', 'Motors', 'Catering', 'Plumbing', 'Print', 'Estates',
+          'Engineering', 'Fitness', 'Legal', 'Supplies', 'Textiles', 'Media', 'Care')
+SUFFIXES = ('Ltd', 'Limited', 'LLP', '& Sons', 'Group', 'Services')
+FIRST_NAMES = ('James', 'Olivia', 'Amelia', 'Jack', 'Isla', 'Harry', 'Mia', 'George', 'Ava', 'Noah',
+               'Sophie', 'Leo', 'Grace', 'Oscar', 'Freya', 'Arthur', 'Ella', 'Henry', 'Lily', 'Ravi')
+LAST_NAMES = ('Smith', 'Jones', 'Taylor', 'Brown', 'Williams', 'Wilson', 'Johnson', 'Davies', 'Patel',
+              'Robinson', 'Wright', 'Thompson', 'Evans', 'Walker', 'White', 'Roberts', 'Green', 'Hall',
+              'Khan', 'Clarke')
+AREAS = ('AB', 'B', 'BS', 'CF', 'DE', 'EH', 'G', 'L', 'LS', 'M', 'N', 'NE', 'NG', 'S', 'SW', 'W')
+STATUSES = (('Open', 60), ('Closed', 15), ('On Hold', 10), ('Payment Plan', 10), ('Legal', 5))
+NOTE_TYPES = ('General', 'Inbound Call', 'Outbound Call', 'Email Sent', 'Email Received', 'Letter Sent')
+NOTE_TEXT = ('Called debtor, no answer.', 'Debtor promised payment by end of month.',
+             'Letter before action sent.', 'Email received disputing part of the balance.',
+             'Left voicemail.', 'Payment plan agreed at monthly instalments.',
+             'Client asked for an update.', 'Address confirmed by phone.')
+FIELD_TYPES = ('text', 'date', 'number')
+
+
+def company(rng):
+    return f"{rng.choice(WORDS)} {rng.choice(TRADES)} {rng.choice(SUFFIXES)}"
+
+
+def postcode(rng):
+    return f"{rng.choice(AREAS)}{rng.randint(1, 29)} {rng.randint(1, 9)}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}" \
+           f"{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}"
+
+
+def recreate_database(url):
+    params = psycopg.conninfo.conninfo_to_dict(url)
+    name = params.get('dbname')
+    if not name:
+        raise SystemExit("DATABASE_URL must name the benchmark database")
+    admin_url = psycopg.conninfo.make_conninfo(url, dbname='postgres')
+    with psycopg.connect(admin_url, autocommit=True) as conn:
+        conn.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+        conn.execute(sql.SQL("CREATE DATABASE {} ENCODING 'UTF8' TEMPLATE template0").format(sql.Identifier(name)))
+
+
+def _next_id(c, table):
+    c.execute(sql.SQL("SELECT COALESCE(MAX(id), 0) + 1 FROM {}").format(sql.Identifier(table)))
+    return c.fetchone()[0]
+
+
+def _sync_sequence(c, table):
+    c.execute(sql.SQL("SELECT setval(pg_get_serial_sequence(%s, 'id'), (SELECT MAX(id) FROM {}))")
+              .format(sql.Identifier(table)), (table,))
+
+
+def seed(conn, clients, cases_per_client, money_per_case, notes_per_case, custom_fields, rng):
+    c = conn.cursor()
+    counts = {}
+
+    c.execute("""
+        INSERT INTO users (username, password_hash, role) VALUES (%s, %s, 'admin')
+        ON CONFLICT (username) DO NOTHING
+    """, (BENCH_USER, bcrypt.hashpw(BENCH_PASSWORD.encode(), bcrypt.gensalt())))
+    c.execute("SELECT id FROM users WHERE username = %s", (BENCH_USER,))
+    user_id = c.fetchone()[0]
+
+    field_ids = []
+    for i in range(1, custom_fields + 1):
+        c.execute("""
+            INSERT INTO custom_field_definitions (field_name, field_type) VALUES (%s, %s)
+            ON CONFLICT (field_name) DO UPDATE SET field_type = EXCLUDED.field_type
+            RETURNING id
+        """, (f"Bench Field {i}", FIELD_TYPES[i % len(FIELD_TYPES)]))
+        field_ids.append(c.fetchone()[0])
+    slot_fields = field_ids[:16]
+
+    first_client = _next_id(c, 'clients')
+    client_ids = range(first_client, first_client + clients)
+    with c.copy("COPY clients (id, business_type, business_name, contact_first, contact_last, phone, email, "
+                "bacs_details, default_interest_rate) FROM STDIN") as copy:
+        for client_id in client_ids:
+            name = f"{company(rng)} {client_id}"
+            copy.write_row((client_id, 'Limited Company', name, rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES),
+                            f"01{rng.randint(100000000, 999999999)}", f"accounts{client_id}@example.com",
+                            f"{rng.randint(10, 99)}-{rng.randint(10, 99)}-{rng.randint(10, 99)} "
+                            f"{rng.randint(10000000, 99999999)}", rng.choice((0, 4, 8))))
+    _sync_sequence(c, 'clients')
+    counts['clients'] = clients
+
+    with c.copy("COPY client_custom_field_link (client_id, field_id) FROM STDIN") as copy:
+        for client_id in client_ids:
+            for field_id in slot_fields:
+                copy.write_row((client_id, field_id))
+    with c.copy("COPY client_custom_field_slots (client_id, slot_no, field_id) FROM STDIN") as copy:
+        for client_id in client_ids:
+            for slot_no, field_id in enumerate(slot_fields, start=1):
+                copy.write_row((client_id, slot_no, field_id))
+
+    statuses = [status for status, weight in STATUSES for _ in range(weight)]
+    today = date.today()
+    first_case = _next_id(c, 'cases')
+    total_cases = clients * cases_per_client
+    case_ids = range(first_case, first_case + total_cases)
+    open_dates = {}
+    with c.copy("COPY cases (id, client_id, debtor_business_type, debtor_business_name, debtor_first, "
+                "debtor_last, phone, email, postcode, status, next_action_date, open_date) FROM STDIN") as copy:
+        for n, case_id in enumerate(case_ids):
+            client_id = first_client + n // cases_per_client
+            opened = today - timedelta(days=rng.randint(0, 3 * 365))
+            open_dates[case_id] = opened
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            if rng.random() < 0.6:
+                business_type, business_name, first, last = 'Limited Company', company(rng), None, None
+                email = f"ap{case_id}@example.co.uk"
+            else:
+                business_type, business_name = 'Individual', None
+                email = f"{first}.{last}{case_id}@example.com".lower()
+            next_action = today + timedelta(days=rng.randint(-30, 60))
+            copy.write_row((case_id, client_id, business_type, business_name, first, last,
+                            f"07{rng.randint(100000000, 999999999)}", email, postcode(rng),
+                            rng.choice(statuses), next_action.isoformat(), opened))
+    _sync_sequence(c, 'cases')
+    counts['cases'] = total_cases
+
+    money_rows = 0
+    with c.copy("COPY money (case_id, type, amount, transaction_date, created_by, description, recoverable, "
+                "vat_amount) FROM STDIN") as copy:
+        for case_id in case_ids:
+            opened = open_dates[case_id]
+            span = max((today - opened).days, 1)
+            invoice = round(rng.uniform(150, 25000), 2)
+            copy.write_row((case_id, 'Invoice', invoice, opened, user_id, f"Invoice INV{case_id:07d}", 0, 0))
+            money_rows += 1
+            for _ in range(money_per_case - 1):
+                kind = rng.choices(('Payment', 'Charge', 'Interest'), (70, 15, 15))[0]
+                when = opened + timedelta(days=rng.randint(0, span))
+                if kind == 'Payment':
+                    amount, description, recoverable, vat = round(rng.uniform(10, invoice / 4), 2), 'Payment received', 0, 0
+                elif kind == 'Charge':
+                    amount = rng.choice((40, 70, 100, 150))
+                    description, recoverable, vat = 'Late payment compensation', int(rng.random() < 0.8), 0
+                else:
+                    amount, description, recoverable, vat = round(invoice * 0.008, 2), 'Statutory interest', 0, 0
+                copy.write_row((case_id, kind, amount, when, user_id, description, recoverable, vat))
+                money_rows += 1
+    counts['money'] = money_rows
+
+    with c.copy("COPY notes (case_id, type, created_by, note, created_at) FROM STDIN") as copy:
+        for case_id in case_ids:
+            opened = datetime.combine(open_dates[case_id], datetime.min.time())
+            span = max(int((datetime.now() - opened).total_seconds()), 1)
+            for _ in range(notes_per_case):
+                copy.write_row((case_id, rng.choice(NOTE_TYPES), user_id, rng.choice(NOTE_TEXT),
+                                opened + timedelta(seconds=rng.randint(0, span))))
+    counts['notes'] = total_cases * notes_per_case
+
+    values = 0
+    with c.copy("COPY case_custom_values (case_id, field_id, field_value) FROM STDIN") as copy:
+        for case_id in case_ids:
+            for i, field_id in enumerate(slot_fields):
+                if rng.random() < 0.7:
+                    kind = FIELD_TYPES[(i + 1) % len(FIELD_TYPES)]
+                    if kind == 'date':
+                        value = (open_dates[case_id] + timedelta(days=rng.randint(0, 90))).isoformat()
+                    elif kind == 'number':
+                        value = str(rng.randint(1, 99999))
+                    else:
+                        value = f"REF-{rng.randint(10000, 99999)}"
+                    copy.write_row((case_id, field_id, value))
+                    values += 1
+    counts['custom_values'] = values
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a benchmark database with synthetic data")
+    parser.add_argument('--recreate', action='store_true', help="drop and re-create the database first")
+    parser.add_argument('--clients', type=int, default=20)
+    parser.add_argument('--cases-per-client', type=int, default=500)
+    parser.add_argument('--money-per-case', type=int, default=8, help="ledger rows per case (first is the invoice)")
+    parser.add_argument('--notes-per-case', type=int, default=5)
+    parser.add_argument('--custom-fields', type=int, default=8, help="custom fields per client (max 16 slotted)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    url = os.environ['DATABASE_URL']
+    start = time.perf_counter()
+    if args.recreate:
+        recreate_database(url)
+    init_db(url)
+
+    with psycopg.connect(url) as conn:
+        counts = seed(conn, args.clients, args.cases_per_client, max(args.money_per_case, 1),
+                      args.notes_per_case, args.custom_fields, random.Random(args.seed))
+        conn.commit()
+        conn.autocommit = True
+        conn.execute("ANALYZE")
+
+    print(f"Seeded {', '.join(f'{n:,} {name}' for name, n in counts.items())} "
+          f"in {time.perf_counter() - start:.1f}s (login {BENCH_USER}/{BENCH_PASSWORD})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,307 @@
+# =============================================================================
+#  CASE IMPORT - BULK LOAD DEBTOR FILES (CSV / XLSX)
+#  • Rows are validated and normalized in Python, then streamed into a temp
+#    staging table with COPY - bad rows are reported by line, never loaded
+#  • Case ids are pre-allocated from the cases sequence as rows are staged,
+#    so cases, case_strategy rows (client's default strategy), opening notes
+#    and optional opening Invoice transactions are each one INSERT ... SELECT
+#  • The whole import is one transaction: the caller commits (or rolls back
+#    for a dry run)
+#
+#  Columns (header row, case-insensitive; client_id may come from --client):
+#    client_id, debtor_business_type, debtor_business_name, debtor_first,
+#    debtor_last, phone, email, postcode, next_action_date,
+#    invoice_amount, invoice_date, invoice_description
+#
+#  CLI:  python case_import.py debtors.csv [--client 12] [--user system]
+#                              [--errors errors.csv] [--dry-run]
+# =============================================================================
+
+import argparse
+import csv
+import io
+import os
+import sys
+import time
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+IMPORT_COLUMNS = (
+    'client_id', 'debtor_business_type', 'debtor_business_name', 'debtor_first',
+    'debtor_last', 'phone', 'email', 'postcode', 'next_action_date',
+    'invoice_amount', 'invoice_date', 'invoice_description',
+)
+
+# Staging layout (after validation): source line number plus typed values.
+STAGING_COLUMNS = ('line_no',) + IMPORT_COLUMNS
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y')
+
+# Largest value money.amount (NUMERIC(14, 2)) holds.
+MAX_AMOUNT = Decimal('999999999999.99')
+
+
+# ----------------------------------------------------------------------
+#  READING
+# ----------------------------------------------------------------------
+def _header_key(name):
+    return '_'.join(str(name or '').strip().lower().split())
+
+
+def read_rows(fileobj, filename):
+    """Yield (line_no, {column: raw value}) from a CSV or XLSX file object."""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+    else:
+        if isinstance(fileobj, io.TextIOBase):
+            text = fileobj
+        else:
+            text = io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')
+        rows = csv.reader(text)
+
+    header = None
+    for line_no, values in enumerate(rows, start=1):
+        if header is None:
+            header = [_header_key(v) for v in values]
+            continue
+        if not any(v not in (None, '') for v in values):
+            continue
+        yield line_no, dict(zip(header, values))
+
+
+# ----------------------------------------------------------------------
+#  VALIDATION / NORMALIZATION
+# ----------------------------------------------------------------------
+def clean_text(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def parse_date(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    value = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            pass
+    raise ValueError(f"'{value}' is not a date (use YYYY-MM-DD or DD/MM/YYYY)")
+
+
+def parse_amount(value):
+    """Positive amount to the penny that fits money.amount (NUMERIC(14, 2)), None if blank; else ValueError."""
+    if value is None or value == '':
+        return None
+    try:
+        amount = Decimal(str(value).strip().replace('£', '').replace(',', ''))
+    except InvalidOperation:
+        raise ValueError(f"'{value}' is not an amount")
+    if not amount.is_finite() or amount <= 0:
+        raise ValueError(f"'{value}' must be a positive amount")
+    if amount > MAX_AMOUNT:
+        raise ValueError(f"'{value}' is more than {MAX_AMOUNT:,}")
+    amount = amount.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if not amount:
+        raise ValueError(f"'{value}' rounds to 0.00")
+    return amount
+
+
+def normalize_row(raw, clients, default_client_id=None):
+    """Return the staging tuple for one raw row, or raise ValueError with the reason."""
+    client_id = clean_text(raw.get('client_id')) or default_client_id
+    if client_id is None:
+        raise ValueError("client_id is required")
+    try:
+        client_id = int(float(client_id))
+    except (TypeError, ValueError):
+        raise ValueError(f"client_id '{client_id}' is not a number")
+    if client_id not in clients:
+        raise ValueError(f"client {client_id} does not exist")
+
+    business_name = clean_text(raw.get('debtor_business_name'))
+    first, last = clean_text(raw.get('debtor_first')), clean_text(raw.get('debtor_last'))
+    if not (business_name or first or last):
+        raise ValueError("debtor_business_name or debtor_first/debtor_last is required")
+
+    email = clean_text(raw.get('email'))
+    if email:
+        email = email.lower()
+        if '@' not in email:
+            raise ValueError(f"email '{email}' is not valid")
+    postcode = clean_text(raw.get('postcode'))
+    if postcode:
+        postcode = ' '.join(postcode.upper().split())
+
+    return (
+        client_id,
+        clean_text(raw.get('debtor_business_type')),
+        business_name,
+        first,
+        last,
+        clean_text(raw.get('phone')),
+        email,
+        postcode,
+        parse_date(raw.get('next_action_date')),
+        parse_amount(raw.get('invoice_amount')),
+        parse_date(raw.get('invoice_date')),
+        clean_text(raw.get('invoice_description')),
+    )
+
+
+# ----------------------------------------------------------------------
+#  IMPORT
+# ----------------------------------------------------------------------
+def import_cases(c, rows, user_id, default_client_id=None, source='import'):
+    """Validate, stage and insert rows from read_rows(). The caller commits.
+
+    Returns {'rows', 'imported', 'enrolled', 'invoices', 'errors': [(line_no, message)],
+    'seconds', 'rows_per_sec'}.
+    """
+    start = time.perf_counter()
+    c.execute("SELECT id FROM clients")
+    clients = {row['id'] for row in c.fetchall()}
+
+    c.execute("""
+        CREATE TEMP TABLE case_import_staging (
+            line_no INTEGER NOT NULL,
+            client_id INTEGER NOT NULL,
+            debtor_business_type TEXT,
+            debtor_business_name TEXT,
+            debtor_first TEXT,
+            debtor_last TEXT,
+            phone TEXT,
+            email TEXT,
+            postcode TEXT,
+            next_action_date DATE,
+            invoice_amount NUMERIC(14, 2),
+            invoice_date DATE,
+            invoice_description TEXT,
+            -- Pre-allocated while copying, so every follow-up insert joins on it.
+            case_id INTEGER NOT NULL DEFAULT nextval(pg_get_serial_sequence('cases', 'id'))
+        ) ON COMMIT DROP
+    """)
+
+    total = imported = 0
+    errors = []
+    with c.copy(f"COPY case_import_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN") as copy:
+        for line_no, raw in rows:
+            total += 1
+            try:
+                staged = (line_no,) + normalize_row(raw, clients, default_client_id)
+            except ValueError as e:
+                errors.append((line_no, str(e)))
+                continue
+            copy.write_row(staged)
+            imported += 1
+
+    c.execute("""
+        INSERT INTO cases (id, client_id, debtor_business_type, debtor_business_name, debtor_first,
+                           debtor_last, phone, email, postcode, next_action_date)
+        SELECT case_id, client_id, debtor_business_type, debtor_business_name, debtor_first,
+               debtor_last, phone, email, postcode, next_action_date::text
+        FROM case_import_staging
+        ORDER BY line_no
+    """)
+
+    c.execute("""
+        INSERT INTO case_strategy (case_id, strategy_id, step_index, next_action_date)
+        SELECT stg.case_id, cl.default_strategy_id, 0, COALESCE(stg.next_action_date, CURRENT_DATE)
+        FROM case_import_staging stg
+        JOIN clients cl ON cl.id = stg.client_id
+        WHERE cl.default_strategy_id IS NOT NULL
+        ON CONFLICT (case_id) DO NOTHING
+    """)
+    enrolled = c.rowcount
+
+    c.execute("""
+        INSERT INTO notes (case_id, type, note, created_by)
+        SELECT stg.case_id, 'General', format('Case imported from %%s (line %%s).', %s::text, stg.line_no), %s
+        FROM case_import_staging stg
+        UNION ALL
+        SELECT stg.case_id, 'Strategy', format('Case entered strategy ''%%s'' at step 0.', st.name), %s
+        FROM case_import_staging stg
+        JOIN clients cl ON cl.id = stg.client_id
+        JOIN strategies st ON st.id = cl.default_strategy_id
+    """, (source, user_id, user_id))
+
+    c.execute("""
+        INSERT INTO money (case_id, type, amount, transaction_date, created_by, description)
+        SELECT case_id, 'Invoice', invoice_amount, COALESCE(invoice_date, CURRENT_DATE), %s,
+               COALESCE(invoice_description, 'Opening balance')
+        FROM case_import_staging
+        WHERE invoice_amount IS NOT NULL
+    """, (user_id,))
+    invoices = c.rowcount
+
+    seconds = time.perf_counter() - start
+    return {
+        'rows': total,
+        'imported': imported,
+        'enrolled': enrolled,
+        'invoices': invoices,
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'rows_per_sec': round(total / seconds) if seconds else None,
+    }
+
+
+def write_error_report(errors, fileobj):
+    writer = csv.writer(fileobj)
+    writer.writerow(['line', 'error'])
+    writer.writerows(errors)
+
+
+def main():
+    import psycopg
+    from psycopg.rows import dict_row
+    from extensions import job_user_id
+
+    parser = argparse.ArgumentParser(description="Bulk import cases from a CSV or XLSX file")
+    parser.add_argument('path')
+    parser.add_argument('--client', type=int, help="client id for rows without a client_id column")
+    parser.add_argument('--user', default=os.environ.get('JOB_USER', 'system'),
+                        help="username recorded on notes and transactions")
+    parser.add_argument('--errors', help="write the per-row error report to this CSV file")
+    parser.add_argument('--dry-run', action='store_true', help="validate and stage, then roll back")
+    args = parser.parse_args()
+
+    with psycopg.connect(os.environ['DATABASE_URL'], row_factory=dict_row) as conn:
+        c = conn.cursor()
+        try:
+            user_id = job_user_id(c, args.user)
+        except LookupError as e:
+            parser.error(str(e))
+        with open(args.path, 'rb') as f:
+            result = import_cases(c, read_rows(f, args.path), user_id, args.client,
+                                  source=os.path.basename(args.path))
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+
+    for line_no, message in result['errors'][:20]:
+        print(f"line {line_no}: {message}")
+    if len(result['errors']) > 20:
+        print(f"... {len(result['errors']) - 20} more")
+    if args.errors:
+        with open(args.errors, 'w', newline='') as f:
+            write_error_report(result['errors'], f)
+
+    print(f"{'Validated' if args.dry_run else 'Imported'} {result['imported']} of {result['rows']} rows "
+          f"({len(result['errors'])} rejected, {result['enrolled']} enrolled in a strategy, "
+          f"{result['invoices']} opening invoices) in {result['seconds']:.2f}s "
+          f"({result['rows_per_sec'] or 0:,} rows/s)")
+    return 1 if result['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
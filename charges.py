@@ -0,0 +1,114 @@
+# =============================================================================
+#  CHARGES - APPLY A CHARGE CODE TO ONE CASE OR MANY
+#  A charge code (charges table) is either
+#      flat     default_amount, or an amount given when applying it
+#      percent  percent_rate of the case balance (case_balances), clamped to
+#               min_amount / max_amount; cases with no balance are skipped
+#  VAT at the code's vat_rate goes into money.vat_amount next to the net
+#  amount; recoverable is copied from the code. Each application is one
+#  set-based statement over the selected cases (ids and/or all of a
+#  client's cases; only active ones are charged) that inserts the Charge
+#  rows with charge_id, so the case_balances trigger fires once for the
+#  lot. preview runs the same pricing and reports totals, writing nothing.
+# =============================================================================
+
+from datetime import date
+
+# Selected cases and the net charge for each active one (NULL = skip).
+PRICING_CTES = """
+    charge AS (
+        SELECT id, description, charge_type, default_amount, percent_rate,
+               min_amount, max_amount, vat_rate, recoverable
+        FROM charges
+        WHERE id = %(charge_id)s
+    ),
+    target AS (
+        SELECT s.id AS case_id, s.lifecycle_state, COALESCE(cb.balance, 0) AS balance
+        FROM cases s
+        LEFT JOIN case_balances cb ON cb.case_id = s.id
+        WHERE s.id = ANY(%(case_ids)s::int[]) OR s.client_id = %(client_id)s::int
+    ),
+    priced AS (
+        SELECT t.case_id, ch.id AS charge_id, ch.description, ch.vat_rate, ch.recoverable,
+               CASE
+                   WHEN ch.charge_type = 'percent' THEN
+                       -- LEAST / GREATEST ignore a NULL cap
+                       CASE WHEN t.balance > 0 THEN
+                           LEAST(GREATEST(ROUND(t.balance * ch.percent_rate / 100, 2), ch.min_amount), ch.max_amount)
+                       END
+                   ELSE ROUND(COALESCE(%(amount)s::numeric, ch.default_amount), 2)
+               END AS amount
+        FROM target t
+        CROSS JOIN charge ch
+        WHERE t.lifecycle_state = 'active'
+    ),
+    chargeable AS (
+        SELECT priced.*, ROUND(amount * vat_rate / 100, 2) AS vat_amount
+        FROM priced
+        WHERE amount > 0
+    )
+"""
+
+TOTALS = """
+    SELECT (SELECT COUNT(*) FROM target) AS cases,
+           COUNT(*) AS charged,
+           COALESCE(SUM(amount), 0) AS total_amount,
+           COALESCE(SUM(vat_amount), 0) AS total_vat,
+           MIN(amount) AS min_charge,
+           MAX(amount) AS max_charge
+"""
+
+PREVIEW_SQL = f"""
+    WITH {PRICING_CTES}
+    {TOTALS}
+    FROM chargeable
+"""
+
+APPLY_SQL = f"""
+    WITH {PRICING_CTES},
+    posted AS (
+        INSERT INTO money (case_id, type, amount, vat_amount, charge_id, recoverable,
+                           created_by, description, transaction_date)
+        SELECT case_id, 'Charge', amount, vat_amount, charge_id, recoverable,
+               %(user_id)s, description, %(transaction_date)s
+        FROM chargeable
+        RETURNING amount, vat_amount
+    )
+    {TOTALS}
+    FROM posted
+"""
+
+
+def get_charge(c, charge_id=None, code=None):
+    """The charge with this id, or when no id is given, this code. None if there is none."""
+    column, value = ('id', charge_id) if charge_id is not None else ('code', code)
+    c.execute(f"""
+        SELECT id, code, description, charge_type, default_amount, percent_rate,
+               min_amount, max_amount, vat_rate, recoverable, category
+        FROM charges
+        WHERE {column} = %s
+    """, (value,))
+    return c.fetchone()
+
+
+def apply_charge(c, charge_id, user_id, case_ids=(), client_id=None, amount=None,
+                 transaction_date=None, preview=False):
+    """Price (and unless preview, post) a charge on the given cases. The caller commits.
+
+    Returns {'cases', 'charged', 'skipped', 'total_amount', 'total_vat', 'min_charge',
+    'max_charge', 'preview'}; skipped counts selected cases that got no charge
+    (not active, no balance for a percent charge, zero amount).
+    """
+    case_ids = sorted({int(i) for i in case_ids})
+    c.execute(PREVIEW_SQL if preview else APPLY_SQL, {
+        'charge_id': charge_id,
+        'case_ids': case_ids,
+        'client_id': client_id,
+        'amount': amount,
+        'user_id': user_id,
+        'transaction_date': transaction_date or date.today(),
+    })
+    result = dict(c.fetchone())
+    result['skipped'] = result['cases'] - result['charged']
+    result['preview'] = preview
+    return result
@@ -0,0 +1,142 @@
+# =============================================================================
+#  CLIENT INDEX - IN-MEMORY CLIENT NAME LOOKUP FOR AUTOCOMPLETE
+#  • One suffix array over every client name per gunicorn worker, so
+#    /client_search and the report page picker answer substring queries
+#    with two binary searches instead of a LIKE against the clients table
+#  • Loaded lazily in a background thread; until it is warm, callers get
+#    None back and use the database (search.search_clients) instead
+#  • Ranking is exact > prefix > substring, then name. The database path
+#    also adds trigram similarity when pg_trgm is installed, so the two can
+#    order substring matches differently
+#  • add_client / rename_client call invalidate(); other workers pick the
+#    change up when their copy expires (CLIENT_INDEX_TTL seconds)
+# =============================================================================
+
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+from extensions import get_pool
+
+CLIENT_INDEX_TTL = float(os.environ.get('CLIENT_INDEX_TTL', 60))
+
+# Suffixes are compared on at most this many characters; longer queries are
+# checked against the full name after the binary search.
+_KEY_CHARS = 64
+_SEPARATOR = '\x00'
+
+
+class ClientNameIndex:
+    def __init__(self, rows):
+        # rows: (id, business_name) sorted by business_name
+        self.clients = [(row[0], row[1]) for row in rows]
+        self.lowered = [(name or '').lower() for _, name in self.clients]
+        self.text = _SEPARATOR.join(self.lowered)
+
+        # Start offset of each name inside self.text, to map a suffix back to its client.
+        self.starts = array('I')
+        pos = 0
+        for name in self.lowered:
+            self.starts.append(pos)
+            pos += len(name) + 1
+
+        text = self.text
+        offsets = [i for i, ch in enumerate(text) if ch != _SEPARATOR]
+        offsets.sort(key=lambda i: text[i:i + _KEY_CHARS])
+        self.suffixes = array('I', offsets)
+        self.loaded_at = time.monotonic()
+
+    def _key(self, offset, width):
+        return self.text[offset:offset + width]
+
+    def search(self, q, limit=20):
+        """Clients whose name contains q, ranked exact > prefix > substring, then by name."""
+        q = q.strip().lower()
+        if not q:
+            return []
+        width = min(len(q), _KEY_CHARS)
+        probe = q[:width]
+        lo = bisect_left(self.suffixes, probe, key=lambda off: self._key(off, width))
+        hi = bisect_right(self.suffixes, probe, key=lambda off: self._key(off, width))
+
+        ranked = {}
+        for off in self.suffixes[lo:hi]:
+            pos = bisect_right(self.starts, off) - 1
+            name = self.lowered[pos]
+            if pos in ranked or q not in name:
+                continue
+            if name == q:
+                ranked[pos] = 0
+            elif name.startswith(q):
+                ranked[pos] = 1
+            else:
+                ranked[pos] = 2
+
+        # self.clients is already in name order, so position breaks ties alphabetically.
+        best = sorted(ranked, key=lambda pos: (ranked[pos], pos))[:limit]
+        return [{'id': self.clients[pos][0], 'name': self.clients[pos][1]} for pos in best]
+
+
+_index = None
+_loading = False
+_generation = 0
+_lock = threading.Lock()
+
+
+def _load():
+    global _index, _loading
+    with _lock:
+        generation = _generation
+    try:
+        with get_pool().connection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, business_name FROM clients ORDER BY business_name")
+            rows = [(row['id'], row['business_name']) for row in c.fetchall()]
+        index = ClientNameIndex(rows)
+        # Drop the result if a client changed while we were reading. Compared and
+        # swapped under the lock so an invalidate() cannot slip in between.
+        with _lock:
+            if generation == _generation:
+                _index = index
+    finally:
+        with _lock:
+            _loading = False
+
+
+def _start_load():
+    global _loading
+    with _lock:
+        if not _loading:
+            _loading = True
+            threading.Thread(target=_load, name='client-index-load', daemon=True).start()
+
+
+def get_index():
+    """Return the index, or None (and start loading it) when it is cold.
+
+    An expired index keeps answering while its replacement loads."""
+    index = _index
+    if index is None or time.monotonic() - index.loaded_at >= CLIENT_INDEX_TTL:
+        _start_load()
+    return index
+
+
+def invalidate():
+    global _index, _generation
+    with _lock:
+        _generation += 1
+        _index = None
+
+
+def search(q, limit=20):
+    """Answer from memory, or None so the caller falls back to the database."""
+    index = get_index()
+    return index.search(q, limit) if index is not None else None
+
+
+def all_clients():
+    """Every (id, business_name) ordered by name, or None when the index is cold."""
+    index = get_index()
+    return index.clients if index is not None else None
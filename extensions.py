@@ -1,39 +1,119 @@
 # =============================================================================
 #  EXTENSIONS - SHARED STUFF USED BY THE WHOLE APP
-#  • Database connection (get_db / close_db)
+#  • Database connection pool (get_db / close_db / pool_stats), handing out
+#    metrics.InstrumentedCursor so every request's SQL is timed
+#  • Batch job helpers (job_user_id)
 #  • Jinja filters: money formatting and date formatting
 #  • Imported in app.py and used everywhere
 #  DO NOT TOUCH unless you know what you're doing
 # =============================================================================
 
 import os
+import threading
 from flask import g
 import psycopg
 from psycopg.rows import dict_row
+from psycopg_pool import ConnectionPool
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from metrics import InstrumentedCursor
 
 DATABASE_URL = os.environ['DATABASE_URL']
 
+# Pool sizing is per gunicorn worker, so max size x workers must stay under
+# Postgres max_connections. All values can be overridden from the environment.
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 5))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))          # seconds to wait for a free connection
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 1800))  # recycle connections after this
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 300))        # close idle connections above min size
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    # Created lazily and re-created after fork, so every gunicorn worker owns
+    # its own pool even when the app is loaded with --preload.
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    kwargs={'row_factory': dict_row, 'cursor_factory': InstrumentedCursor},
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_lifetime=DB_POOL_MAX_LIFETIME,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    check=ConnectionPool.check_connection,  # health check on checkout (not counted by metrics)
+                    name=f"harbour-{os.getpid()}",
+                    open=True,
+                )
+                _pool_pid = os.getpid()
+    return _pool
+
+
 def get_db():
     if 'db' not in g:
-        g.db = psycopg.connect(DATABASE_URL, row_factory=dict_row)
+        g.db = get_pool().getconn()
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
     if db is not None:
-        db.close()
+        # Anything not committed by the route is thrown away, same as closing did.
+        if db.info.transaction_status in (psycopg.pq.TransactionStatus.INTRANS,
+                                          psycopg.pq.TransactionStatus.INERROR):
+            db.rollback()
+        get_pool().putconn(db)
+
+
+def pool_stats():
+    stats = get_pool().get_stats()
+    return {
+        'pool_min': stats.get('pool_min', 0),
+        'pool_max': stats.get('pool_max', 0),
+        'pool_size': stats.get('pool_size', 0),
+        'pool_available': stats.get('pool_available', 0),
+        'checkouts': stats.get('requests_num', 0),
+        'waits': stats.get('requests_queued', 0),
+        'wait_ms': stats.get('requests_wait_ms', 0),
+        'waiting_now': stats.get('requests_waiting', 0),
+        'exhausted': stats.get('requests_errors', 0),  # timed out waiting for a connection
+        'bad_returns': stats.get('returns_bad', 0),
+        'connections_opened': stats.get('connections_num', 0),
+        'connections_lost': stats.get('connections_lost', 0),
+    }
+
+# =============================================================================
+#  BATCH JOB HELPERS - FOR CLI WORKERS THAT RUN OUTSIDE A REQUEST
+# =============================================================================
+
+def job_user_id(c, username):
+    """Id of the user batch jobs record as created_by / changed_by. LookupError if there is no such user."""
+    c.execute("SELECT id FROM users WHERE username = %s", (username,))
+    row = c.fetchone()
+    if not row:
+        raise LookupError(f"User '{username}' not found – create it or pass --user <existing username>")
+    return row['id']
 
 # =============================================================================
 #  JINJA FILTERS - USED IN TEMPLATES FOR £ AND DATES
 # =============================================================================
 
+PENNY = Decimal('0.01')
+
 def money(value):
+    """Format pounds. Ledger values arrive as Decimal; anything else goes via str() so no float rounding creeps in."""
     if value is None or value == '':
         return "£0.00"
     try:
-        return f"£{float(value):,.2f}"
-    except (TypeError, ValueError):
+        amount = value if isinstance(value, Decimal) else Decimal(str(value))
+        return f"£{amount.quantize(PENNY, rounding=ROUND_HALF_UP):,.2f}"
+    except (TypeError, ValueError, InvalidOperation):
         return str(value)
 
 def format_date(date_obj):
@@ -0,0 +1,248 @@
+# =============================================================================
+#  INTEREST ACCRUAL - BATCH DAILY INTEREST ON OUTSTANDING PRINCIPAL
+#  For every active case of an active client with default_interest_rate > 0:
+#  • the period runs from the day after the case's last accrual (or its
+#    open_date) to --date (default yesterday), both inclusive
+#  • each day earns principal at the end of that day x annual rate / 365,
+#    where principal is the balance without Interest rows (see
+#    ledger.PRINCIPAL_EXPR) and never below zero
+#      simple     the client's default_interest_rate
+#      statutory  STATUTORY_MARGIN + --base-rate (late payment style
+#                 8% over the reference rate), for the same cases
+#  • the ledger comes out with one COPY TO (grouped per case per day), the
+#    day-by-day sums are done over the whole portfolio at once in pandas,
+#    in integer pence, and the results go back with one COPY FROM
+#  • one transaction posts an Interest money row per case (amount > 0) and
+#    an interest_accruals row per case (including zero periods); the
+#    (case_id, period_end) key means running a period twice posts nothing
+#
+#  CLI:  python interest_accrual.py [--date YYYY-MM-DD] [--method simple|statutory]
+#                                   [--base-rate 5.25] [--dry-run] [--user system]
+# =============================================================================
+
+import argparse
+import io
+import os
+import sys
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pandas as pd
+
+from ledger import PRINCIPAL_EXPR
+
+STATUTORY_MARGIN = 8  # percentage points over the reference rate
+
+# Rates are carried as integer ten-thousandths of a percent (NUMERIC(9, 4)),
+# so interest in pence = pence_days * rate_e4 / DAY_COUNT_DIVISOR, exactly.
+DAY_COUNT_DIVISOR = 365 * 100 * 10_000
+
+# Arbitrary constant for pg_advisory_xact_lock so only one run happens at a time.
+ACCRUAL_LOCK_KEY = 7301002
+
+EPOCH = date(1970, 1, 1)
+
+TARGETS_SQL = """
+    CREATE TEMP TABLE interest_accrual_targets ON COMMIT DROP AS
+    SELECT s.id AS case_id,
+           COALESCE(last.period_end + 1, s.open_date, %(end)s::date) AS first_day,
+           {rate} AS rate
+    FROM cases s
+    JOIN clients cl ON cl.id = s.client_id
+    LEFT JOIN LATERAL (
+        SELECT a.period_end FROM interest_accruals a
+        WHERE a.case_id = s.id
+        ORDER BY a.period_end DESC
+        LIMIT 1
+    ) last ON TRUE
+    WHERE s.lifecycle_state = 'active'
+      AND cl.lifecycle_state = 'active'
+      AND cl.default_interest_rate > 0
+"""
+
+RATE_SQL = {
+    'simple': "cl.default_interest_rate",
+    'statutory': "%(margin)s::numeric + %(base_rate)s::numeric",
+}
+
+# Principal movements per case per day in pence; everything before the
+# period collapses onto its first day as the opening principal.
+LEDGER_COPY_SQL = f"""
+    COPY (
+        SELECT t.case_id,
+               GREATEST(m.transaction_date, t.first_day) - DATE '1970-01-01' AS day,
+               SUM({PRINCIPAL_EXPR} * 100)::bigint AS delta
+        FROM interest_accrual_targets t
+        JOIN money m ON m.case_id = t.case_id
+        WHERE m.transaction_date <= %(end)s
+        GROUP BY t.case_id, 2
+        ORDER BY t.case_id, 2
+    ) TO STDOUT
+"""
+
+TARGETS_COPY_SQL = """
+    COPY (
+        SELECT case_id, first_day - DATE '1970-01-01', (rate * 10000)::bigint
+        FROM interest_accrual_targets
+        WHERE first_day <= %(end)s
+        ORDER BY case_id
+    ) TO STDOUT
+"""
+
+POST_SQL = """
+    WITH fresh AS (
+        SELECT st.*, DATE '1970-01-01' + st.first_day AS period_start,
+               st.rate_e4 / 10000.0 AS rate, st.amount_pence / 100.0 AS amount
+        FROM interest_accrual_staging st
+        WHERE NOT EXISTS (
+            SELECT 1 FROM interest_accruals a
+            WHERE a.case_id = st.case_id AND a.period_end = %(end)s::date
+        )
+    ),
+    posted AS (
+        INSERT INTO money (case_id, type, amount, transaction_date, created_by, description)
+        SELECT case_id, 'Interest', amount, %(end)s::date, %(user_id)s,
+               format('Interest %%s%%%% p.a. (%%s), %%s to %%s', rate::numeric(9, 2), %(method)s::text,
+                      to_char(period_start, 'DD/MM/YYYY'), to_char(%(end)s::date, 'DD/MM/YYYY'))
+        FROM fresh
+        WHERE amount_pence > 0
+        RETURNING id, case_id
+    ),
+    recorded AS (
+        INSERT INTO interest_accruals
+            (case_id, period_start, period_end, method, rate, principal_pence_days, amount, money_id)
+        SELECT fresh.case_id, fresh.period_start, %(end)s::date, %(method)s::text, fresh.rate,
+               fresh.pence_days, fresh.amount, posted.id
+        FROM fresh
+        LEFT JOIN posted ON posted.case_id = fresh.case_id
+        RETURNING amount
+    )
+    SELECT COUNT(*) AS periods, COUNT(*) FILTER (WHERE amount > 0) AS posted,
+           COALESCE(SUM(amount), 0) AS total
+    FROM recorded
+"""
+
+
+def _copy_frame(c, query, params, columns):
+    """Run a COPY ... TO STDOUT and load it into a DataFrame of int64 columns."""
+    buf = io.BytesIO()
+    with c.copy(query, params) as copy:
+        for data in copy:
+            buf.write(data)
+    buf.seek(0)
+    if not buf.getbuffer().nbytes:
+        return pd.DataFrame({col: pd.Series(dtype='int64') for col in columns})
+    return pd.read_csv(buf, sep='\t', header=None, names=columns, dtype='int64')
+
+
+def compute_interest(targets, ledger, end_day):
+    """Interest per target case in integer pence.
+
+    targets: case_id, first_day, rate_e4 (days as integers since 1970-01-01)
+    ledger:  case_id, day, delta (pence), sorted by case_id then day
+    Returns targets with pence_days and amount_pence added.
+    """
+    by_case = ledger.groupby('case_id', sort=False)
+    # Each movement's principal holds until the next movement (or the period end).
+    next_day = by_case['day'].shift(-1).fillna(end_day + 1).astype('int64')
+    principal = by_case['delta'].cumsum().clip(lower=0)
+    pence_days = (principal * (next_day - ledger['day'])).groupby(ledger['case_id'], sort=False).sum()
+
+    result = targets.copy()
+    result['pence_days'] = result['case_id'].map(pence_days).fillna(0).astype('int64')
+    numerator = result['pence_days'] * result['rate_e4']
+    # Round half up in integers: floor((2n + d) / 2d).
+    result['amount_pence'] = (2 * numerator + DAY_COUNT_DIVISOR) // (2 * DAY_COUNT_DIVISOR)
+    return result
+
+
+def run_accrual(c, user_id, period_end=None, method='simple', base_rate=None, dry_run=False):
+    """Accrue interest up to period_end (default yesterday). The caller commits (or rolls back a dry run).
+
+    Returns {'period_end', 'method', 'cases', 'posted', 'total', 'dry_run', 'seconds'}.
+    """
+    start = time.perf_counter()
+    period_end = period_end or date.today() - timedelta(days=1)
+    if method == 'statutory' and base_rate is None:
+        raise ValueError("statutory interest needs the reference base rate")
+
+    c.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (ACCRUAL_LOCK_KEY,))
+    if not c.fetchone()['locked']:
+        raise RuntimeError("Another interest accrual run is in progress")
+
+    params = {'end': period_end, 'margin': STATUTORY_MARGIN, 'base_rate': base_rate}
+    c.execute(TARGETS_SQL.format(rate=RATE_SQL[method]), params)
+    c.execute("ANALYZE interest_accrual_targets")
+
+    targets = _copy_frame(c, TARGETS_COPY_SQL, params, ['case_id', 'first_day', 'rate_e4'])
+    ledger = _copy_frame(c, LEDGER_COPY_SQL, params, ['case_id', 'day', 'delta'])
+    result = compute_interest(targets, ledger, (period_end - EPOCH).days)
+
+    summary = {
+        'period_end': period_end,
+        'method': method,
+        'cases': len(result),
+        'posted': int((result['amount_pence'] > 0).sum()),
+        'total': Decimal(int(result['amount_pence'].sum())) / 100,
+        'dry_run': dry_run,
+    }
+    if not dry_run and len(result):
+        c.execute("""
+            CREATE TEMP TABLE interest_accrual_staging (
+                case_id INTEGER PRIMARY KEY,
+                first_day INTEGER NOT NULL,
+                rate_e4 BIGINT NOT NULL,
+                pence_days BIGINT NOT NULL,
+                amount_pence BIGINT NOT NULL
+            ) ON COMMIT DROP
+        """)
+        buf = io.StringIO()
+        result[['case_id', 'first_day', 'rate_e4', 'pence_days', 'amount_pence']].to_csv(
+            buf, sep='\t', header=False, index=False)
+        with c.copy("COPY interest_accrual_staging FROM STDIN") as copy:
+            copy.write(buf.getvalue())
+        c.execute(POST_SQL, {'end': period_end, 'method': method, 'user_id': user_id})
+        row = c.fetchone()
+        summary.update(cases=row['periods'], posted=row['posted'], total=row['total'])
+
+    summary['seconds'] = round(time.perf_counter() - start, 3)
+    return summary
+
+
+def main():
+    import psycopg
+    from psycopg.rows import dict_row
+    from extensions import job_user_id
+
+    parser = argparse.ArgumentParser(description="Accrue daily interest on outstanding case principal")
+    parser.add_argument('--date', type=date.fromisoformat, help="last day to accrue (default yesterday)")
+    parser.add_argument('--method', choices=sorted(RATE_SQL), default='simple')
+    parser.add_argument('--base-rate', type=float, default=os.environ.get('STATUTORY_BASE_RATE'),
+                        help=f"reference rate %% for --method statutory (charged at {STATUTORY_MARGIN}%% over it)")
+    parser.add_argument('--dry-run', action='store_true', help="compute and report, post nothing")
+    parser.add_argument('--user', default=os.environ.get('JOB_USER', 'system'),
+                        help="username recorded on the Interest rows")
+    args = parser.parse_args()
+    if args.method == 'statutory' and args.base_rate is None:
+        parser.error("--method statutory needs --base-rate (or STATUTORY_BASE_RATE)")
+
+    with psycopg.connect(os.environ['DATABASE_URL'], row_factory=dict_row) as conn:
+        c = conn.cursor()
+        try:
+            user_id = job_user_id(c, args.user)
+        except LookupError as e:
+            parser.error(str(e))
+        result = run_accrual(c, user_id, args.date, args.method, args.base_rate, args.dry_run)
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    print(f"{'Dry run: would accrue' if result['dry_run'] else 'Accrued'} {result['method']} interest to "
+          f"{result['period_end']}: {result['cases']} cases, {result['posted']} Interest rows, "
+          f"£{result['total']:,.2f} in {result['seconds']:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
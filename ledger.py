@@ -0,0 +1,190 @@
+# =============================================================================
+#  LEDGER - CASE BALANCES FROM THE MONEY TABLE
+#  One place for the balance rules used across the app:
+#  • Invoice and Interest add to the balance
+#  • Charge adds to the balance only when it is recoverable
+#  • Payment reduces the balance
+#  Per-case totals live in the case_balances table, kept in step with money
+#  by statement-level triggers (see migrations/0001_baseline.py), so reads
+#  are one indexed lookup per case. rebuild/verify recompute everything
+#  from money.
+#  • money.amount / vat_amount are NUMERIC(14, 2) (migrations/0003) and
+#    totals are summed in SQL, so everything here comes back as Decimal -
+#    keep it that way up to the |money filter, no float() on the way
+#
+#  CLI:  python ledger.py verify   – report cases whose summary has drifted
+#        python ledger.py rebuild  – recompute case_balances from money
+# =============================================================================
+
+import argparse
+import os
+import sys
+from decimal import Decimal
+
+ZERO = Decimal('0.00')
+
+# Signed contribution of a single money row (aliased m) to its case balance.
+BALANCE_EXPR = """
+    CASE
+        WHEN m.type IN ('Invoice', 'Interest') THEN m.amount::numeric
+        WHEN m.type = 'Charge' AND m.recoverable <> 0 THEN m.amount::numeric
+        WHEN m.type = 'Payment' THEN -m.amount::numeric
+        ELSE 0
+    END
+"""
+
+# Contribution of a money row to the interest-bearing principal: the balance
+# without Interest rows, so accrued interest never earns interest itself
+# (interest_accrual.py). Payments reduce principal first.
+PRINCIPAL_EXPR = """
+    CASE
+        WHEN m.type = 'Invoice' THEN m.amount
+        WHEN m.type = 'Charge' AND m.recoverable <> 0 THEN m.amount
+        WHEN m.type = 'Payment' THEN -m.amount
+        ELSE 0
+    END
+"""
+
+TOTAL_COLUMNS = (
+    'invoice_total', 'payment_total', 'charge_total',
+    'recoverable_charge_total', 'interest_total', 'balance',
+)
+
+# Aggregates over money rows aliased m, in TOTAL_COLUMNS order. Shared by
+# rebuild and verify; the case_balances triggers carry a frozen copy
+# (migrations/0001_baseline.py), so changing the rules here needs a new
+# migration that recreates case_balances_apply_money().
+TOTALS_SELECT = f"""
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Invoice'), 0) AS invoice_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Payment'), 0) AS payment_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Charge'), 0) AS charge_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Charge' AND m.recoverable <> 0), 0) AS recoverable_charge_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Interest'), 0) AS interest_total,
+    COALESCE(SUM({BALANCE_EXPR}), 0) AS balance
+"""
+
+
+# Per-case columns for the client report / exports (s = cases, cb = case_balances).
+# Note the report balance counts every Charge, recoverable or not.
+REPORT_COLUMNS = """
+    s.id AS case_id,
+    COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last) AS debtor,
+    COALESCE(cb.invoice_total, 0) AS invoice,
+    COALESCE(cb.payment_total, 0) AS payment,
+    COALESCE(cb.charge_total, 0) AS charge,
+    COALESCE(cb.interest_total, 0) AS interest,
+    COALESCE(cb.invoice_total, 0) + COALESCE(cb.charge_total, 0)
+        + COALESCE(cb.interest_total, 0) - COALESCE(cb.payment_total, 0) AS balance
+"""
+
+# Whole-client totals over the same columns, for the report TOTALS row.
+REPORT_TOTALS = """
+    COUNT(*) AS case_count,
+    COALESCE(SUM(cb.invoice_total), 0) AS invoice,
+    COALESCE(SUM(cb.payment_total), 0) AS payment,
+    COALESCE(SUM(cb.charge_total), 0) AS charge,
+    COALESCE(SUM(cb.interest_total), 0) AS interest,
+    COALESCE(SUM(cb.invoice_total + cb.charge_total + cb.interest_total - cb.payment_total), 0) AS balance
+"""
+
+
+def case_balances(c, case_ids):
+    """Return {case_id: Decimal balance} for the given case ids (0.00 when a case has no money rows)."""
+    case_ids = [int(i) for i in case_ids]
+    if not case_ids:
+        return {}
+    c.execute("""
+        SELECT case_id, ROUND(balance, 2) AS balance
+        FROM case_balances
+        WHERE case_id = ANY(%s)
+    """, (case_ids,))
+    balances = {case_id: ZERO for case_id in case_ids}
+    for row in c.fetchall():
+        balances[row['case_id']] = row['balance']
+    return balances
+
+
+def attach_balances(c, cases, id_key='id'):
+    """Set case['balance'] on each case row in place and return the rows as dicts."""
+    cases = [dict(case) for case in cases]
+    balances = case_balances(c, [case[id_key] for case in cases])
+    for case in cases:
+        case['balance'] = balances.get(case[id_key], ZERO)
+    return cases
+
+
+# ----------------------------------------------------------------------
+#  REBUILD / VERIFY
+# ----------------------------------------------------------------------
+def rebuild_case_balances(c):
+    """Recompute case_balances from money. Blocks money writes until the caller commits."""
+    c.execute("LOCK TABLE money IN SHARE MODE")
+    c.execute("DELETE FROM case_balances")
+    c.execute(f"""
+        INSERT INTO case_balances (case_id, {', '.join(TOTAL_COLUMNS)}, last_transaction_date)
+        SELECT m.case_id, {TOTALS_SELECT}, MAX(m.transaction_date)
+        FROM money m
+        GROUP BY m.case_id
+    """)
+    return c.rowcount
+
+
+def verify_case_balances(c, limit=100):
+    """Return up to `limit` (case_id, column, stored, actual) tuples where the summary has drifted."""
+    diffs = ' OR '.join(
+        f"COALESCE(cb.{col}, 0) <> COALESCE(a.{col}, 0)" for col in TOTAL_COLUMNS
+    )
+    c.execute(f"""
+        WITH actual AS (
+            SELECT m.case_id, {TOTALS_SELECT}, MAX(m.transaction_date) AS last_transaction_date
+            FROM money m
+            GROUP BY m.case_id
+        )
+        SELECT COALESCE(cb.case_id, a.case_id) AS case_id,
+               {', '.join(f'cb.{col} AS stored_{col}, a.{col} AS actual_{col}' for col in TOTAL_COLUMNS)},
+               cb.last_transaction_date AS stored_last_transaction_date,
+               a.last_transaction_date AS actual_last_transaction_date
+        FROM case_balances cb
+        FULL OUTER JOIN actual a ON a.case_id = cb.case_id
+        WHERE {diffs}
+           OR cb.last_transaction_date IS DISTINCT FROM a.last_transaction_date
+        ORDER BY 1
+        LIMIT %s
+    """, (limit,))
+    drift = []
+    for row in c.fetchall():
+        for col in TOTAL_COLUMNS + ('last_transaction_date',):
+            stored, actual = row[f'stored_{col}'], row[f'actual_{col}']
+            if col != 'last_transaction_date':
+                stored, actual = stored or 0, actual or 0
+            if stored != actual:
+                drift.append((row['case_id'], col, stored, actual))
+    return drift
+
+
+def main():
+    import psycopg
+    from psycopg.rows import dict_row
+
+    parser = argparse.ArgumentParser(description="Maintain the case_balances summary table")
+    parser.add_argument('command', choices=['verify', 'rebuild'])
+    parser.add_argument('--limit', type=int, default=100, help="max drifted cases to list (verify)")
+    args = parser.parse_args()
+
+    with psycopg.connect(os.environ['DATABASE_URL'], row_factory=dict_row) as conn:
+        c = conn.cursor()
+        if args.command == 'rebuild':
+            count = rebuild_case_balances(c)
+            conn.commit()
+            print(f"Rebuilt case_balances for {count} cases")
+            return 0
+
+        drift = verify_case_balances(c, args.limit)
+        for case_id, col, stored, actual in drift:
+            print(f"case {case_id}: {col} stored={stored} actual={actual}")
+        print("case_balances OK" if not drift else f"{len(drift)} drifted values found")
+        return 1 if drift else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,206 @@
+# =============================================================================
+#  METRICS - PER-REQUEST SQL INSTRUMENTATION + PROMETHEUS TEXT ENDPOINT
+#  • Every pooled connection hands out InstrumentedCursor, which times each
+#    statement (execute + the fetches that wait on it, so pipelined queries
+#    are charged when their results arrive) into g.sql_stats
+#  • After each request: latency, DB time and query count are observed into
+#    histograms labelled by blueprint endpoint (e.g. case.dashboard)
+#  • Requests slower than SLOW_REQUEST_MS are written to the 'harbour.slow'
+#    log with their query count and slowest statement; a route that issues
+#    a query per row (N+1) shows up as a jump in harbour_request_queries
+#  • render() formats everything for GET /metrics (routes/admin.py)
+#  Counters are per gunicorn worker, like the pool stats; every sample
+#  carries a worker="<pid>" label so a scraper can tell them apart.
+# =============================================================================
+
+import logging
+import os
+import threading
+import time
+
+import psycopg
+from flask import g, has_request_context, request
+
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', 500))
+SLOW_LOG_FILE = os.environ.get('SLOW_LOG_FILE')  # default: stderr (gunicorn error log)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+slow_log = logging.getLogger('harbour.slow')
+if SLOW_LOG_FILE:
+    _handler = logging.FileHandler(SLOW_LOG_FILE)
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_log.addHandler(_handler)
+    slow_log.setLevel(logging.INFO)
+    slow_log.propagate = False
+
+
+# ----------------------------------------------------------------------
+#  CURSOR
+# ----------------------------------------------------------------------
+class InstrumentedCursor(psycopg.Cursor):
+    """Cursor that adds its time to the current request's g.sql_stats.
+
+    Outside a request (client index loader, schema registry) it is a plain cursor."""
+
+    _sql = None
+    _stmt_seconds = 0.0
+
+    def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, params, **kwargs)
+        finally:
+            self._record(query, time.perf_counter() - start)
+
+    def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, params_seq, **kwargs)
+        finally:
+            self._record(query, time.perf_counter() - start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._record(None, time.perf_counter() - start)
+
+    def fetchmany(self, size=0):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(size)
+        finally:
+            self._record(None, time.perf_counter() - start)
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._record(None, time.perf_counter() - start)
+
+    def _record(self, query, seconds):
+        if not has_request_context():
+            return
+        stats = g.get('sql_stats')
+        if stats is None:
+            return
+        if query == '':
+            return  # ConnectionPool.check_connection's ping on checkout, not request SQL
+        if query is not None:
+            stats['queries'] += 1
+            self._sql = query
+            self._stmt_seconds = 0.0
+        self._stmt_seconds += seconds
+        stats['seconds'] += seconds
+        if self._stmt_seconds > stats['slowest_seconds']:
+            stats['slowest_seconds'] = self._stmt_seconds
+            stats['slowest_sql'] = self._sql
+
+
+# ----------------------------------------------------------------------
+#  HISTOGRAMS
+# ----------------------------------------------------------------------
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # endpoint -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, endpoint, value):
+        series = self.series.get(endpoint)
+        if series is None:
+            series = self.series[endpoint] = [0] * (len(self.buckets) + 1) + [0.0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def lines(self, worker):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        for endpoint, series in sorted(self.series.items()):
+            labels = f'endpoint="{endpoint}",worker="{worker}"'
+            for bound, count in zip(self.buckets, series):
+                yield f'{self.name}_bucket{{{labels},le="{bound:g}"}} {count}'
+            yield f'{self.name}_bucket{{{labels},le="+Inf"}} {series[-2]}'
+            yield f"{self.name}_sum{{{labels}}} {series[-1]:.6f}"
+            yield f"{self.name}_count{{{labels}}} {series[-2]}"
+
+
+REQUEST_SECONDS = Histogram('harbour_request_seconds', "Request latency by endpoint.", LATENCY_BUCKETS)
+REQUEST_DB_SECONDS = Histogram('harbour_request_db_seconds', "Time spent in SQL per request.", LATENCY_BUCKETS)
+REQUEST_QUERIES = Histogram('harbour_request_queries', "SQL statements per request.", QUERY_BUCKETS)
+_slow_requests = {}
+_lock = threading.Lock()
+
+
+# ----------------------------------------------------------------------
+#  REQUEST HOOKS
+# ----------------------------------------------------------------------
+def _start_request():
+    g.request_started = time.perf_counter()
+    g.sql_stats = {'queries': 0, 'seconds': 0.0, 'slowest_seconds': 0.0, 'slowest_sql': None}
+
+
+def _sql_text(query):
+    if query is None or isinstance(query, str):
+        return ' '.join((query or '').split())
+    if isinstance(query, bytes):
+        return ' '.join(query.decode(errors='replace').split())
+    return repr(query)
+
+
+def _finish_request(response):
+    started = g.pop('request_started', None)
+    stats = g.get('sql_stats')
+    if started is None or stats is None:
+        return response
+    seconds = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'
+    with _lock:
+        REQUEST_SECONDS.observe(endpoint, seconds)
+        REQUEST_DB_SECONDS.observe(endpoint, stats['seconds'])
+        REQUEST_QUERIES.observe(endpoint, stats['queries'])
+        if seconds * 1000 >= SLOW_REQUEST_MS:
+            _slow_requests[endpoint] = _slow_requests.get(endpoint, 0) + 1
+
+    if seconds * 1000 >= SLOW_REQUEST_MS:
+        slow_log.warning(
+            "slow request %s %s endpoint=%s status=%s total_ms=%.1f queries=%d db_ms=%.1f "
+            "slowest_ms=%.1f slowest_sql=%.300s",
+            request.method, request.full_path.rstrip('?'), endpoint, response.status_code,
+            seconds * 1000, stats['queries'], stats['seconds'] * 1000,
+            stats['slowest_seconds'] * 1000, _sql_text(stats['slowest_sql']),
+        )
+    return response
+
+
+def init_app(app):
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+# ----------------------------------------------------------------------
+#  EXPOSITION
+# ----------------------------------------------------------------------
+def render(gauges=None):
+    """Prometheus text format for this worker. gauges: {name: value} extras (pool stats)."""
+    worker = os.getpid()
+    with _lock:
+        lines = []
+        for histogram in (REQUEST_SECONDS, REQUEST_DB_SECONDS, REQUEST_QUERIES):
+            lines.extend(histogram.lines(worker))
+        lines.append("# HELP harbour_slow_requests_total Requests over SLOW_REQUEST_MS.")
+        lines.append("# TYPE harbour_slow_requests_total counter")
+        for endpoint, count in sorted(_slow_requests.items()):
+            lines.append(f'harbour_slow_requests_total{{endpoint="{endpoint}",worker="{worker}"}} {count}')
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE harbour_{name} gauge")
+        lines.append(f'harbour_{name}{{worker="{worker}"}} {value}')
+    return '\n'.join(lines) + '\n'
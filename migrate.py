@@ -0,0 +1,208 @@
+# =============================================================================
+#  MIGRATE - VERSIONED SCHEMA MIGRATIONS
+#  • migrations/NNNN_name.py files, applied once each in version order;
+#    applied versions are recorded in schema_version, so a run only does
+#    the pending steps (init_db.init_db is now just "migrate to latest")
+#  • A migration module has a docstring (its description) and up(m):
+#        TRANSACTION = True   (default) up() runs in one transaction together
+#                             with its schema_version row - all or nothing
+#        TRANSACTION = False  autocommit, for CREATE INDEX CONCURRENTLY and
+#                             batched backfills; up() must be safe to re-run
+#                             because a failure leaves earlier steps applied
+#  • m.execute(sql), m.create_index(...) (CONCURRENTLY, replaces an invalid
+#    leftover from an interrupted build), m.backfill(...) (UPDATE in id-range
+#    batches, one transaction per batch)
+#  • One runner at a time (advisory lock); DDL gives up after
+#    MIGRATION_LOCK_TIMEOUT instead of queueing every request behind it
+#  • Running workers keep their schema registry: kill -HUP the gunicorn
+#    master after migrating (see schema.py)
+#
+#  CLI:  python migrate.py [--status] [--to VERSION]
+# =============================================================================
+
+import argparse
+import glob
+import importlib.util
+import os
+import re
+import sys
+import time
+
+import psycopg
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_LOCK_TIMEOUT = os.environ.get('MIGRATION_LOCK_TIMEOUT', '10s')
+BACKFILL_BATCH_SIZE = int(os.environ.get('BACKFILL_BATCH_SIZE', 10000))
+
+# pg_advisory_lock key shared by every migrate.py process.
+_ADVISORY_LOCK = 746_017_001
+
+_FILE_RE = re.compile(r'^(\d{4})_(\w+)\.py$')
+
+
+class MigrationContext:
+    """What a migration's up(m) gets: the connection, a cursor and DDL helpers."""
+
+    def __init__(self, conn, quiet=False):
+        self.conn = conn
+        self.c = conn.cursor()
+        self.quiet = quiet
+
+    def log(self, message):
+        if not self.quiet:
+            print(f"    {message}")
+
+    def execute(self, query, params=None):
+        self.c.execute(query, params)
+        return self.c
+
+    def create_index(self, name, table, definition, where=None, unique=False):
+        """CREATE INDEX CONCURRENTLY (needs TRANSACTION = False). Writes keep flowing while it builds.
+
+        An interrupted concurrent build leaves an INVALID index behind, which
+        IF NOT EXISTS would happily keep; that one is dropped and rebuilt."""
+        self.c.execute("""
+            SELECT i.indisvalid FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = 'public' AND c.relname = %s
+        """, (name,))
+        row = self.c.fetchone()
+        if row and row[0]:
+            return False
+        if row:
+            self.log(f"dropping invalid index {name}")
+            self.c.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        start = time.perf_counter()
+        self.c.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX CONCURRENTLY IF NOT EXISTS {name} "
+                       f"ON {table} ({definition}){f' WHERE {where}' if where else ''}")
+        self.log(f"built index {name} in {time.perf_counter() - start:.1f}s")
+        return True
+
+    def backfill(self, table, assignments, where='TRUE', params=(), batch_size=None):
+        """UPDATE table SET assignments WHERE where, id range by id range (needs TRANSACTION = False).
+
+        Each batch commits on its own, so locks are short and a restart picks
+        up where it stopped as long as `where` excludes rows already done."""
+        batch_size = batch_size or BACKFILL_BATCH_SIZE
+        self.c.execute(f"SELECT MIN(id), MAX(id) FROM {table}")
+        low, high = self.c.fetchone()
+        if low is None:
+            return 0
+        updated = 0
+        start = time.perf_counter()
+        for batch_start in range(low, high + 1, batch_size):
+            self.c.execute(f"UPDATE {table} SET {assignments} WHERE id >= %s AND id < %s AND ({where})",
+                           (*params, batch_start, batch_start + batch_size))
+            updated += self.c.rowcount
+        self.log(f"backfilled {updated} {table} rows in {time.perf_counter() - start:.1f}s")
+        return updated
+
+
+def discover(directory=MIGRATIONS_DIR):
+    """[(version, name, path)] for every migration file, in version order."""
+    found = []
+    for path in glob.glob(os.path.join(directory, '*.py')):
+        match = _FILE_RE.match(os.path.basename(path))
+        if match:
+            found.append((int(match.group(1)), match.group(2), path))
+    found.sort()
+    versions = [version for version, _, _ in found]
+    if len(versions) != len(set(versions)):
+        raise SystemExit(f"Duplicate migration versions in {directory}")
+    return found
+
+
+def load(version, name, path):
+    spec = importlib.util.spec_from_file_location(f"migration_{version:04d}_{name}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _ensure_version_table(c):
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT NOT NULL,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        duration_ms INTEGER
+    )
+    """)
+
+
+def applied_versions(c):
+    c.execute("SELECT version FROM schema_version")
+    return {row[0] for row in c.fetchall()}
+
+
+def migrate(database_url, target=None, quiet=False):
+    """Apply pending migrations up to `target` (default: all). Returns the versions applied."""
+    applied = []
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_advisory_lock(%s)", (_ADVISORY_LOCK,))
+        try:
+            c.execute("SELECT set_config('lock_timeout', %s, false)", (MIGRATION_LOCK_TIMEOUT,))
+            _ensure_version_table(c)
+            done = applied_versions(c)
+            for version, name, path in discover():
+                if version in done or (target is not None and version > target):
+                    continue
+                module = load(version, name, path)
+                if not quiet:
+                    description = (module.__doc__ or '').strip().splitlines()
+                    print(f"  {version:04d} {name}{' - ' + description[0] if description else ''}")
+                m = MigrationContext(conn, quiet)
+                start = time.perf_counter()
+                if getattr(module, 'TRANSACTION', True):
+                    with conn.transaction():
+                        module.up(m)
+                        _record(c, version, name, start)
+                else:
+                    module.up(m)
+                    _record(c, version, name, start)
+                applied.append(version)
+        finally:
+            c.execute("SELECT pg_advisory_unlock(%s)", (_ADVISORY_LOCK,))
+    return applied
+
+
+def _record(c, version, name, start):
+    c.execute("INSERT INTO schema_version (version, name, duration_ms) VALUES (%s, %s, %s)",
+              (version, name, round((time.perf_counter() - start) * 1000)))
+
+
+def status(database_url):
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        c = conn.cursor()
+        c.execute("SELECT to_regclass('public.schema_version') IS NOT NULL")
+        rows = {}
+        if c.fetchone()[0]:
+            c.execute("SELECT version, applied_at FROM schema_version")
+            rows = dict(c.fetchall())
+    return [(version, name, rows.get(version)) for version, name, _ in discover()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument('--status', action='store_true', help="list migrations and whether they are applied")
+    parser.add_argument('--to', type=int, dest='target', help="stop after this version")
+    args = parser.parse_args()
+    database_url = os.environ['DATABASE_URL']
+
+    if args.status:
+        for version, name, applied_at in status(database_url):
+            print(f"{version:04d} {name:<40} {applied_at:%Y-%m-%d %H:%M:%S}" if applied_at
+                  else f"{version:04d} {name:<40} pending")
+        return 0
+
+    start = time.perf_counter()
+    applied = migrate(database_url, args.target)
+    print(f"Applied {len(applied)} migration(s) in {time.perf_counter() - start:.1f}s" if applied
+          else "Schema is up to date")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
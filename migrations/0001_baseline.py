@@ -0,0 +1,498 @@
+"""Schema as built by init_db.py before versioned migrations.
+
+Every statement is idempotent, so this also adopts databases that init_db
+created earlier: it fills the gaps and records version 1.
+"""
+import re
+
+import psycopg
+
+# Frozen copies of the ledger (ledger.py), search (search.py) and payment
+# matching (payment_import.py) definitions this schema was built from. A
+# later change to those modules ships as a new migration, not an edit here.
+TOTAL_COLUMNS = (
+    'invoice_total', 'payment_total', 'charge_total',
+    'recoverable_charge_total', 'interest_total', 'balance',
+)
+
+# Signed contribution of a money row (aliased m) to its case balance.
+BALANCE_EXPR = """
+    CASE
+        WHEN m.type IN ('Invoice', 'Interest') THEN m.amount::numeric
+        WHEN m.type = 'Charge' AND m.recoverable <> 0 THEN m.amount::numeric
+        WHEN m.type = 'Payment' THEN -m.amount::numeric
+        ELSE 0
+    END
+"""
+
+# Aggregates over money rows aliased m, in TOTAL_COLUMNS order.
+TOTALS_SELECT = f"""
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Invoice'), 0) AS invoice_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Payment'), 0) AS payment_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Charge'), 0) AS charge_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Charge' AND m.recoverable <> 0), 0) AS recoverable_charge_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Interest'), 0) AS interest_total,
+    COALESCE(SUM({BALANCE_EXPR}), 0) AS balance
+"""
+
+SEARCH_FIELDS = {
+    'debtor': "lower(COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last))",
+    'client': "lower(c.business_name)",
+    'email': "lower(s.email)",
+    'phone': "regexp_replace(s.phone, '[^0-9]', '', 'g')",
+    'postcode': "upper(regexp_replace(s.postcode, '\\s', '', 'g'))",
+}
+
+# SEARCH_FIELDS payment_import.py matches by equality.
+PAYMENT_MATCH_FIELDS = ('debtor', 'postcode')
+
+
+def up(m):
+    conn, c = m.conn, m.c
+
+    # --- EXISTING TABLES (Preserved with IF NOT EXISTS) ---
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS clients (
+        id SERIAL PRIMARY KEY,
+        business_type TEXT NOT NULL,
+        business_name TEXT NOT NULL,
+        contact_first TEXT,
+        contact_last TEXT,
+        phone TEXT,
+        email TEXT,
+        bacs_details TEXT,
+        default_interest_rate REAL DEFAULT 0.0,
+        lifecycle_state TEXT NOT NULL DEFAULT 'active' CHECK (
+            lifecycle_state IN ('active', 'closed', 'archived')
+        )
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS cases (
+        id SERIAL PRIMARY KEY,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        debtor_business_type TEXT,
+        debtor_business_name TEXT,
+        debtor_first TEXT,
+        debtor_last TEXT,
+        phone TEXT,
+        email TEXT,
+        postcode TEXT,
+        status TEXT DEFAULT 'Open',
+        substatus TEXT,
+        next_action_date TEXT,
+        open_date DATE DEFAULT CURRENT_DATE,
+        mode TEXT NOT NULL DEFAULT 'automated' CHECK (
+            mode IN ('automated', 'manual', 'legal_hold')
+        ),
+        lifecycle_state TEXT NOT NULL DEFAULT 'active' CHECK (
+            lifecycle_state IN ('active', 'closed', 'archived')
+        )
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username TEXT UNIQUE NOT NULL,
+        password_hash BYTEA NOT NULL,
+        role TEXT DEFAULT 'user'
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS money (
+        id SERIAL PRIMARY KEY,
+        case_id INTEGER NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+        type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        transaction_date DATE DEFAULT CURRENT_DATE,
+        created_by INTEGER NOT NULL REFERENCES users(id),
+        description TEXT,
+        recoverable INTEGER DEFAULT 0,
+        billable INTEGER DEFAULT 0,
+        vat_amount REAL DEFAULT 0.0,
+        billed INTEGER DEFAULT 0,
+        billeddate DATE,
+        charge_id INTEGER
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS notes (
+        id SERIAL PRIMARY KEY,
+        case_id INTEGER NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+        type TEXT NOT NULL,
+        created_by INTEGER NOT NULL REFERENCES users(id),
+        note TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # Strategy definitions are reusable by any client.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS strategies (
+        id SERIAL PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        is_active INTEGER DEFAULT 1,
+        definition_json JSONB NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # Runtime pointer for a case's progress through its chosen strategy.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS case_strategy (
+        case_id INTEGER PRIMARY KEY REFERENCES cases(id) ON DELETE CASCADE,
+        strategy_id INTEGER NOT NULL REFERENCES strategies(id),
+        step_index INTEGER DEFAULT 0,
+        next_action_date DATE,
+        last_executed_at TIMESTAMP,
+        paused INTEGER DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS api_keys (
+        id SERIAL PRIMARY KEY,
+        client_id INTEGER NOT NULL REFERENCES clients(id),
+        key TEXT UNIQUE NOT NULL,
+        name TEXT,
+        active INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS case_status_history (
+        id SERIAL PRIMARY KEY,
+        case_id INTEGER NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+        old_status TEXT,
+        old_substatus TEXT,
+        new_status TEXT,
+        new_substatus TEXT,
+        changed_by INTEGER NOT NULL REFERENCES users(id),
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        old_next_action_date DATE
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS charges (
+        id SERIAL PRIMARY KEY,
+        code TEXT NOT NULL,
+        description TEXT NOT NULL,
+        charge_type TEXT NOT NULL DEFAULT 'flat' CHECK (
+            charge_type IN ('flat', 'percent')
+        ),
+        default_amount REAL,
+        percent_rate REAL,
+        min_amount REAL,
+        max_amount REAL,
+        category TEXT NOT NULL CHECK (
+            category IN (
+                'Commission', 'Ancillary', 'CCJ', 'defence',
+                'Insolvency', 'Enforcement'
+            )
+        ),
+        UNIQUE(code)
+    )
+    """)
+
+    # --- NEW CUSTOM FIELDS TABLES ---
+
+    # 1. Master list of available custom field types
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS custom_field_definitions (
+        id SERIAL PRIMARY KEY,
+        field_name TEXT NOT NULL UNIQUE,
+        field_type TEXT DEFAULT 'text' -- e.g., 'text', 'date', 'number'
+    )
+    """)
+
+    # 2. Link table: which clients use which custom fields?
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS client_custom_field_link (
+        client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE,
+        field_id INTEGER REFERENCES custom_field_definitions(id) ON DELETE CASCADE,
+        PRIMARY KEY (client_id, field_id)
+    )
+    """)
+
+    # Explicit slot mapping (1..16) for each client's 4x4 custom field grid.
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS client_custom_field_slots (
+        client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE,
+        slot_no INTEGER NOT NULL CHECK (slot_no BETWEEN 1 AND 16),
+        field_id INTEGER NOT NULL REFERENCES custom_field_definitions(id),
+        PRIMARY KEY (client_id, slot_no),
+        UNIQUE (client_id, field_id)
+    )
+    """)
+
+    # 3. Data table: the actual values for a specific case
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS case_custom_values (
+        case_id INTEGER REFERENCES cases(id) ON DELETE CASCADE,
+        field_id INTEGER REFERENCES custom_field_definitions(id) ON DELETE CASCADE,
+        field_value TEXT,
+        PRIMARY KEY (case_id, field_id)
+    )
+    """)
+
+    # --- SAFE MIGRATIONS (Column checking) ---
+    c.execute("""
+        SELECT 1 FROM information_schema.columns
+        WHERE table_name = 'money' AND column_name = 'note'
+    """)
+    if c.fetchone():
+        c.execute("ALTER TABLE money RENAME COLUMN note TO description")
+
+    # Add missing columns to existing tables if they don't exist
+    c.execute("ALTER TABLE money ADD COLUMN IF NOT EXISTS vat_amount REAL DEFAULT 0.0")
+    c.execute("ALTER TABLE money ADD COLUMN IF NOT EXISTS billed INTEGER DEFAULT 0")
+    c.execute("ALTER TABLE money ADD COLUMN IF NOT EXISTS billeddate DATE")
+    c.execute("ALTER TABLE money ADD COLUMN IF NOT EXISTS charge_id INTEGER REFERENCES charges(id)")
+    c.execute("ALTER TABLE case_status_history ADD COLUMN IF NOT EXISTS old_next_action_date DATE")
+    c.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS default_strategy_id INTEGER REFERENCES strategies(id)")
+    c.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS lifecycle_state TEXT NOT NULL DEFAULT 'active' CHECK (lifecycle_state IN ('active', 'closed', 'archived'))")
+    c.execute("ALTER TABLE cases ADD COLUMN IF NOT EXISTS mode TEXT NOT NULL DEFAULT 'automated' CHECK (mode IN ('automated', 'manual', 'legal_hold'))")
+    c.execute("ALTER TABLE cases ADD COLUMN IF NOT EXISTS lifecycle_state TEXT NOT NULL DEFAULT 'active' CHECK (lifecycle_state IN ('active', 'closed', 'archived'))")
+    c.execute("ALTER TABLE charges ADD COLUMN IF NOT EXISTS charge_type TEXT NOT NULL DEFAULT 'flat' CHECK (charge_type IN ('flat', 'percent'))")
+    c.execute("ALTER TABLE charges ADD COLUMN IF NOT EXISTS default_amount REAL")
+    c.execute("ALTER TABLE charges ADD COLUMN IF NOT EXISTS percent_rate REAL")
+    c.execute("ALTER TABLE charges ADD COLUMN IF NOT EXISTS min_amount REAL")
+    c.execute("ALTER TABLE charges ADD COLUMN IF NOT EXISTS max_amount REAL")
+    c.execute("ALTER TABLE strategies ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1")
+
+    # --- STRATEGY VERSION: bumped on every definition change (strategy_cache.py keys on it) ---
+    c.execute("""
+    CREATE OR REPLACE FUNCTION strategies_bump_version()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        IF NEW.definition_json IS DISTINCT FROM OLD.definition_json OR NEW.name IS DISTINCT FROM OLD.name THEN
+            NEW.version := OLD.version + 1;
+        END IF;
+        RETURN NEW;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+    c.execute("DROP TRIGGER IF EXISTS strategies_version ON strategies")
+    c.execute("""
+    CREATE TRIGGER strategies_version
+    BEFORE UPDATE ON strategies
+    FOR EACH ROW EXECUTE FUNCTION strategies_bump_version();
+    """)
+
+    # --- CASE BALANCE SUMMARY ---
+    # One row per case with per-type totals, kept in step with money by the
+    # statement-level triggers below (covers single edits and bulk loads alike).
+    c.execute("SELECT to_regclass('public.case_balances') IS NULL")
+    case_balances_is_new = c.fetchone()[0]
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS case_balances (
+        case_id INTEGER PRIMARY KEY REFERENCES cases(id) ON DELETE CASCADE,
+        invoice_total NUMERIC NOT NULL DEFAULT 0,
+        payment_total NUMERIC NOT NULL DEFAULT 0,
+        charge_total NUMERIC NOT NULL DEFAULT 0,
+        recoverable_charge_total NUMERIC NOT NULL DEFAULT 0,
+        interest_total NUMERIC NOT NULL DEFAULT 0,
+        balance NUMERIC NOT NULL DEFAULT 0,
+        last_transaction_date DATE,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    add_new = ",\n                ".join(f"{col} = cb.{col} + EXCLUDED.{col}" for col in TOTAL_COLUMNS)
+    subtract_old = ",\n                ".join(f"{col} = cb.{col} - d.{col}" for col in TOTAL_COLUMNS)
+    c.execute(f"""
+    CREATE OR REPLACE FUNCTION case_balances_apply_money()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO case_balances AS cb (case_id, {', '.join(TOTAL_COLUMNS)}, last_transaction_date, updated_at)
+            SELECT m.case_id, {TOTALS_SELECT}, MAX(m.transaction_date), CURRENT_TIMESTAMP
+            FROM new_rows m
+            GROUP BY m.case_id
+            ON CONFLICT (case_id) DO UPDATE SET
+                {add_new},
+                last_transaction_date = GREATEST(cb.last_transaction_date, EXCLUDED.last_transaction_date),
+                updated_at = EXCLUDED.updated_at;
+        END IF;
+
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE case_balances cb SET
+                {subtract_old},
+                updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT m.case_id, {TOTALS_SELECT}
+                FROM old_rows m
+                GROUP BY m.case_id
+            ) d
+            WHERE cb.case_id = d.case_id;
+
+            UPDATE case_balances cb
+            SET last_transaction_date = (SELECT MAX(transaction_date) FROM money WHERE case_id = cb.case_id)
+            WHERE cb.case_id IN (SELECT case_id FROM old_rows);
+        END IF;
+
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    c.execute("DROP TRIGGER IF EXISTS money_case_balances_insert ON money")
+    c.execute("""
+    CREATE TRIGGER money_case_balances_insert
+    AFTER INSERT ON money
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION case_balances_apply_money();
+    """)
+    c.execute("DROP TRIGGER IF EXISTS money_case_balances_update ON money")
+    c.execute("""
+    CREATE TRIGGER money_case_balances_update
+    AFTER UPDATE ON money
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION case_balances_apply_money();
+    """)
+    c.execute("DROP TRIGGER IF EXISTS money_case_balances_delete ON money")
+    c.execute("""
+    CREATE TRIGGER money_case_balances_delete
+    AFTER DELETE ON money
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION case_balances_apply_money();
+    """)
+
+    # First install on an existing ledger: fill the summary from history.
+    if case_balances_is_new:
+        c.execute("LOCK TABLE money IN SHARE MODE")
+        c.execute("DELETE FROM case_balances")
+        c.execute(f"""
+        INSERT INTO case_balances (case_id, {', '.join(TOTAL_COLUMNS)}, last_transaction_date)
+        SELECT m.case_id, {TOTALS_SELECT}, MAX(m.transaction_date)
+        FROM money m
+        GROUP BY m.case_id
+        """)
+
+    # Lets snapshots.py find cases whose ledger changed since its last run.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_case_balances_updated_at ON case_balances (updated_at)")
+
+    # --- PORTFOLIO SNAPSHOTS (filled by snapshots.py) ---
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS client_daily_snapshots (
+        snapshot_date DATE NOT NULL,
+        client_id INTEGER NOT NULL REFERENCES clients(id) ON DELETE CASCADE,
+        invoiced NUMERIC NOT NULL DEFAULT 0,
+        collected NUMERIC NOT NULL DEFAULT 0,
+        charges NUMERIC NOT NULL DEFAULT 0,
+        interest NUMERIC NOT NULL DEFAULT 0,
+        outstanding NUMERIC NOT NULL DEFAULT 0,
+        PRIMARY KEY (snapshot_date, client_id)
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_client_daily_snapshots_client ON client_daily_snapshots (client_id, snapshot_date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_client_daily_snapshots_outstanding ON client_daily_snapshots (snapshot_date, outstanding DESC)")
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS portfolio_daily_snapshots (
+        snapshot_date DATE PRIMARY KEY,
+        client_count INTEGER NOT NULL DEFAULT 0,
+        invoiced NUMERIC NOT NULL DEFAULT 0,
+        collected NUMERIC NOT NULL DEFAULT 0,
+        charges NUMERIC NOT NULL DEFAULT 0,
+        interest NUMERIC NOT NULL DEFAULT 0,
+        outstanding NUMERIC NOT NULL DEFAULT 0,
+        refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS snapshot_runs (
+        id SERIAL PRIMARY KEY,
+        snapshot_date DATE NOT NULL,
+        watermark TIMESTAMP NOT NULL,
+        full_run BOOLEAN NOT NULL DEFAULT FALSE,
+        clients_refreshed INTEGER,
+        finished_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # --- SEARCH INDEXES ---
+    # Trigram GIN indexes let the LIKE '%q%' lookups in search.py use an index.
+    # Built on exactly the expressions search.py queries. Skipped when the
+    # server does not ship pg_trgm (search still works, just unindexed).
+    try:
+        with conn.transaction():
+            c.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        trigram_available = True
+    except psycopg.Error:
+        trigram_available = False
+
+    if trigram_available:
+        for field, expr in SEARCH_FIELDS.items():
+            table = 'clients' if field == 'client' else 'cases'
+            column_expr = re.sub(r'\b[sc]\.', '', expr)
+            c.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_{table}_search_{field}_trgm
+            ON {table} USING GIN (({column_expr}) gin_trgm_ops)
+            """)
+
+    # Equality lookups used by payment_import.py to match statement lines.
+    for field in PAYMENT_MATCH_FIELDS:
+        column_expr = re.sub(r'\bs\.', '', SEARCH_FIELDS[field])
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_cases_match_{field} ON cases (({column_expr}))")
+    # The planner only has statistics for the indexed expressions after ANALYZE.
+    c.execute("ANALYZE cases")
+
+    # --- BANK STATEMENT INGESTION (payment_import.py) ---
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS bank_statements (
+        id SERIAL PRIMARY KEY,
+        file_hash TEXT NOT NULL UNIQUE,
+        filename TEXT,
+        lines INTEGER,
+        matched INTEGER,
+        queued INTEGER,
+        rejected INTEGER,
+        imported_by INTEGER REFERENCES users(id),
+        imported_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS payment_review_queue (
+        id SERIAL PRIMARY KEY,
+        statement_id INTEGER NOT NULL REFERENCES bank_statements(id),
+        line_no INTEGER NOT NULL,
+        transaction_date DATE NOT NULL,
+        amount NUMERIC(14, 2) NOT NULL,
+        reference TEXT,
+        payer_name TEXT,
+        postcode TEXT,
+        candidate_case_ids INTEGER[],
+        reason TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'posted', 'dismissed')),
+        resolved_case_id INTEGER REFERENCES cases(id),
+        money_id INTEGER REFERENCES money(id),
+        resolved_by INTEGER REFERENCES users(id),
+        resolved_at TIMESTAMP,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    c.execute("CREATE INDEX IF NOT EXISTS idx_payment_review_queue_open ON payment_review_queue (id) WHERE status = 'open'")
+
+    # Non-deletion policy: block hard deletes for core entities.
+    c.execute("""
+    CREATE OR REPLACE FUNCTION prevent_hard_delete()
+    RETURNS TRIGGER AS $$
+    BEGIN
+        RAISE EXCEPTION 'Hard delete disabled for %. Use lifecycle_state instead.', TG_TABLE_NAME;
+    END;
+    $$ LANGUAGE plpgsql;
+    """)
+
+    c.execute("DROP TRIGGER IF EXISTS prevent_clients_delete ON clients")
+    c.execute("""
+    CREATE TRIGGER prevent_clients_delete
+    BEFORE DELETE ON clients
+    FOR EACH ROW EXECUTE FUNCTION prevent_hard_delete();
+    """)
+
+    c.execute("DROP TRIGGER IF EXISTS prevent_cases_delete ON cases")
+    c.execute("""
+    CREATE TRIGGER prevent_cases_delete
+    BEFORE DELETE ON cases
+    FOR EACH ROW EXECUTE FUNCTION prevent_hard_delete();
+    """)
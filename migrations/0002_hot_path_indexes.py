@@ -0,0 +1,25 @@
+"""Hot-path indexes for the dashboard, client pages and strategy runner, built CONCURRENTLY.
+
+Databases initialised before this release built the first four inside
+init_db's transaction (locking writes for the duration); those are kept.
+"""
+
+TRANSACTION = False
+
+
+def up(m):
+    # Case dashboard: keyset paging / running balance per case.
+    m.create_index('idx_money_case_date', 'money', 'case_id, transaction_date, id')
+    m.create_index('idx_notes_case_created', 'notes', 'case_id, created_at, id')
+    m.create_index('idx_case_status_history_case_changed', 'case_status_history', 'case_id, changed_at, id')
+
+    # Strategy runner: due-step claim order (see strategy_runner.py).
+    m.create_index('idx_case_strategy_due', 'case_strategy', 'next_action_date, case_id',
+                   where='next_action_date IS NOT NULL AND paused = 0')
+
+    # Client dashboard / case list (WHERE client_id = ... ORDER BY open_date DESC)
+    # and the dashboard's recent cases (ORDER BY open_date DESC, id DESC LIMIT 10).
+    m.create_index('idx_cases_client_open_date', 'cases', 'client_id, open_date DESC')
+    m.create_index('idx_cases_open_date', 'cases', 'open_date DESC, id DESC')
+
+    m.execute("ANALYZE cases")
@@ -0,0 +1,120 @@
+"""Store money.amount and money.vat_amount as NUMERIC(14, 2) instead of REAL, online.
+
+REAL keeps about seven significant digits: 12345.67 is stored as
+12345.669921875, and the ::numeric casts the ledger used to sum it gave
+12345.7. The exact values are written into new columns in id batches, with a
+trigger covering rows written meanwhile; the swap itself is one short
+ACCESS EXCLUSIVE transaction. Safe to re-run after an interruption.
+"""
+
+TRANSACTION = False
+
+# Frozen copy of ledger.py's case_balances totals at the time of this migration.
+TOTAL_COLUMNS = (
+    'invoice_total', 'payment_total', 'charge_total',
+    'recoverable_charge_total', 'interest_total', 'balance',
+)
+
+# Signed contribution of a money row (aliased m) to its case balance.
+BALANCE_EXPR = """
+    CASE
+        WHEN m.type IN ('Invoice', 'Interest') THEN m.amount::numeric
+        WHEN m.type = 'Charge' AND m.recoverable <> 0 THEN m.amount::numeric
+        WHEN m.type = 'Payment' THEN -m.amount::numeric
+        ELSE 0
+    END
+"""
+
+# Aggregates over money rows aliased m, in TOTAL_COLUMNS order.
+TOTALS_SELECT = f"""
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Invoice'), 0) AS invoice_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Payment'), 0) AS payment_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Charge'), 0) AS charge_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Charge' AND m.recoverable <> 0), 0) AS recoverable_charge_total,
+    COALESCE(SUM(m.amount::numeric) FILTER (WHERE m.type = 'Interest'), 0) AS interest_total,
+    COALESCE(SUM({BALANCE_EXPR}), 0) AS balance
+"""
+
+# REAL -> float8 -> numeric keeps every digit the float holds; rounding that
+# to pence recovers what was typed in (12345.67, not 12345.7).
+EXACT = "ROUND({column}::float8::numeric, 2)"
+
+
+def _column_type(m, table, column):
+    row = m.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s AND column_name = %s
+    """, (table, column)).fetchone()
+    return row[0] if row else None
+
+
+def up(m):
+    if _column_type(m, 'money', 'amount') == 'numeric':
+        return
+
+    exact_amount = EXACT.format(column='NEW.amount')
+    exact_vat = EXACT.format(column='COALESCE(NEW.vat_amount, 0)')
+    with m.conn.transaction():
+        m.execute("ALTER TABLE money ADD COLUMN IF NOT EXISTS amount_exact NUMERIC(14, 2)")
+        m.execute("ALTER TABLE money ADD COLUMN IF NOT EXISTS vat_amount_exact NUMERIC(14, 2)")
+        m.execute(f"""
+        CREATE OR REPLACE FUNCTION money_exact_sync()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.amount_exact := {exact_amount};
+            NEW.vat_amount_exact := {exact_vat};
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        """)
+        m.execute("DROP TRIGGER IF EXISTS money_exact_sync ON money")
+        m.execute("""
+        CREATE TRIGGER money_exact_sync
+        BEFORE INSERT OR UPDATE ON money
+        FOR EACH ROW EXECUTE FUNCTION money_exact_sync();
+        """)
+        if not m.execute("SELECT 1 FROM pg_constraint WHERE conname = 'money_amount_exact_not_null'").fetchone():
+            m.execute("ALTER TABLE money ADD CONSTRAINT money_amount_exact_not_null "
+                      "CHECK (amount_exact IS NOT NULL) NOT VALID")
+
+    # Each batch also passes through the case_balances trigger; amounts are
+    # unchanged so the totals are too (only updated_at moves).
+    m.backfill('money',
+               f"amount_exact = {EXACT.format(column='amount')}, "
+               f"vat_amount_exact = {EXACT.format(column='COALESCE(vat_amount, 0)')}",
+               where='amount_exact IS NULL')
+    m.execute("ALTER TABLE money VALIDATE CONSTRAINT money_amount_exact_not_null")
+
+    with m.conn.transaction():
+        m.execute("LOCK TABLE money IN ACCESS EXCLUSIVE MODE")
+        # case_balances was summed from amount::numeric; cases where that
+        # differs from the exact value are recomputed below. Found under the
+        # lock so rows written during the backfill are included.
+        drifted = [row[0] for row in m.execute(
+            "SELECT DISTINCT case_id FROM money WHERE amount_exact <> amount::numeric"
+        ).fetchall()]
+        m.execute("DROP TRIGGER money_exact_sync ON money")
+        m.execute("DROP FUNCTION money_exact_sync()")
+        m.execute("ALTER TABLE money DROP COLUMN amount")
+        m.execute("ALTER TABLE money DROP COLUMN vat_amount")
+        m.execute("ALTER TABLE money RENAME COLUMN amount_exact TO amount")
+        m.execute("ALTER TABLE money RENAME COLUMN vat_amount_exact TO vat_amount")
+        # Uses the validated CHECK instead of scanning the table again.
+        m.execute("ALTER TABLE money ALTER COLUMN amount SET NOT NULL")
+        m.execute("ALTER TABLE money DROP CONSTRAINT money_amount_exact_not_null")
+        m.execute("ALTER TABLE money ALTER COLUMN vat_amount SET DEFAULT 0")
+
+        if drifted:
+            m.execute(f"""
+                UPDATE case_balances cb SET
+                    {', '.join(f'{col} = a.{col}' for col in TOTAL_COLUMNS)},
+                    updated_at = CURRENT_TIMESTAMP
+                FROM (
+                    SELECT m.case_id, {TOTALS_SELECT}
+                    FROM money m
+                    WHERE m.case_id = ANY(%s)
+                    GROUP BY m.case_id
+                ) a
+                WHERE cb.case_id = a.case_id
+            """, (drifted,))
+            m.log(f"recomputed case_balances for {len(drifted)} cases")
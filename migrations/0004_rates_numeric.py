@@ -0,0 +1,29 @@
+"""Charge amounts and interest rates as NUMERIC, like the ledger they feed.
+
+charges and clients are small, so the column types are changed in place
+inside the migration's transaction.
+"""
+
+# table -> [(column, precision, scale)]
+COLUMNS = {
+    'charges': [
+        ('default_amount', 14, 2),
+        ('min_amount', 14, 2),
+        ('max_amount', 14, 2),
+        ('percent_rate', 9, 4),
+    ],
+    'clients': [
+        ('default_interest_rate', 9, 4),
+    ],
+}
+
+
+def up(m):
+    for table, columns in COLUMNS.items():
+        changes = ', '.join(
+            f"ALTER COLUMN {column} TYPE NUMERIC({precision}, {scale}) "
+            f"USING ROUND({column}::float8::numeric, {scale})"
+            for column, precision, scale in columns
+        )
+        m.execute(f"ALTER TABLE {table} {changes}")
+    m.execute("ALTER TABLE clients ALTER COLUMN default_interest_rate SET DEFAULT 0")
@@ -0,0 +1,27 @@
+"""interest_accruals: one row per case per accrual period posted by interest_accrual.py.
+
+The (case_id, period_end) key makes a re-run for the same period a no-op,
+and the latest period_end per case is where the next accrual starts.
+Who ran it is on the posted money row (created_by).
+"""
+
+
+def up(m):
+    m.execute("""
+    CREATE TABLE IF NOT EXISTS interest_accruals (
+        case_id INTEGER NOT NULL REFERENCES cases(id) ON DELETE CASCADE,
+        period_start DATE NOT NULL,
+        period_end DATE NOT NULL,
+        method TEXT NOT NULL CHECK (method IN ('simple', 'statutory')),
+        rate NUMERIC(9, 4) NOT NULL,
+        principal_pence_days BIGINT NOT NULL,
+        amount NUMERIC(14, 2) NOT NULL,
+        money_id INTEGER REFERENCES money(id) ON DELETE SET NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (case_id, period_end),
+        CHECK (period_start <= period_end)
+    )
+    """)
+    # Deleting a money row sets money_id NULL here; without this each delete scans the table.
+    m.execute("CREATE INDEX IF NOT EXISTS idx_interest_accruals_money ON interest_accruals (money_id) "
+              "WHERE money_id IS NOT NULL")
@@ -0,0 +1,11 @@
+"""VAT rate and recoverability on charge codes, used by charges.py when applying them.
+
+vat_rate is a percentage (20 = 20%); VAT is recorded in money.vat_amount
+alongside the net amount. recoverable is copied onto the money row, so it
+decides whether the charge counts towards the debtor's balance.
+"""
+
+
+def up(m):
+    m.execute("ALTER TABLE charges ADD COLUMN IF NOT EXISTS vat_rate NUMERIC(5, 2) NOT NULL DEFAULT 0")
+    m.execute("ALTER TABLE charges ADD COLUMN IF NOT EXISTS recoverable INTEGER NOT NULL DEFAULT 1")
@@ -0,0 +1,18 @@
+"""bank_statement_lines: every bank statement line payment_import.py has posted or queued, by content.
+
+line_key hashes the line's date, amount, reference, payer and its
+occurrence number among identical lines in the same file, so a line
+repeated in an overlapping statement export is skipped rather than
+posted twice; two genuinely identical payments in one file still post.
+"""
+
+
+def up(m):
+    m.execute("""
+    CREATE TABLE IF NOT EXISTS bank_statement_lines (
+        line_key TEXT PRIMARY KEY,
+        statement_id INTEGER NOT NULL REFERENCES bank_statements(id),
+        line_no INTEGER NOT NULL
+    )
+    """)
+    m.execute("ALTER TABLE bank_statements ADD COLUMN IF NOT EXISTS duplicates INTEGER")
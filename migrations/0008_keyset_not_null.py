@@ -0,0 +1,39 @@
+"""Make the dashboard's keyset sort columns NOT NULL: money.transaction_date, notes.created_at.
+
+The dashboard pages these lists by (column, id) row comparisons, which a
+NULL never satisfies, and encodes the last row's value in the cursor. Rows
+that predate the column defaults get their case's open_date (today if it
+has none). Each column is backfilled in id batches behind a NOT VALID
+CHECK, so SET NOT NULL does not rescan the table. Safe to re-run.
+"""
+
+TRANSACTION = False
+
+# table, column, fill value for NULL rows (correlated on the row's case)
+COLUMNS = (
+    ('money', 'transaction_date',
+     "COALESCE((SELECT s.open_date FROM cases s WHERE s.id = money.case_id), CURRENT_DATE)"),
+    ('notes', 'created_at',
+     "COALESCE((SELECT s.open_date::timestamp FROM cases s WHERE s.id = notes.case_id), CURRENT_TIMESTAMP)"),
+)
+
+
+def up(m):
+    for table, column, fill in COLUMNS:
+        check = f"{table}_{column}_not_null"
+        nullable = m.execute("""
+            SELECT is_nullable = 'YES' FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s AND column_name = %s
+        """, (table, column)).fetchone()[0]
+        if not nullable:
+            continue
+
+        if not m.execute("SELECT 1 FROM pg_constraint WHERE conname = %s", (check,)).fetchone():
+            m.execute(f"ALTER TABLE {table} ADD CONSTRAINT {check} CHECK ({column} IS NOT NULL) NOT VALID")
+        m.backfill(table, f"{column} = {fill}", where=f"{column} IS NULL")
+        m.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {check}")
+
+        with m.conn.transaction():
+            # Uses the validated CHECK instead of scanning the table again.
+            m.execute(f"ALTER TABLE {table} ALTER COLUMN {column} SET NOT NULL")
+            m.execute(f"ALTER TABLE {table} DROP CONSTRAINT {check}")
@@ -0,0 +1,366 @@
+# =============================================================================
+#  PAYMENT IMPORT - BANK STATEMENT INGESTION AND CASE MATCHING
+#  • Statement lines (CSV / XLSX) are normalized in Python and streamed into
+#    a temp staging table with COPY
+#  • Lines are matched to cases in SQL, one set-based UPDATE per rule, first
+#    unique hit wins (MATCH_RULES, in order). Each line is an index lookup
+#    capped at MAX_CANDIDATES + 1 hits, so a common name never fans out:
+#        reference        case id from the case_id column or a CASE_REFERENCE_PREFIX
+#                         reference ("HBR-004512"), confirmed by payer name,
+#                         postcode or amount = balance; an unconfirmed one is
+#                         queued for review with that case as the candidate
+#        debtor_postcode  payer name + postcode
+#        debtor           payer name (active cases)
+#        postcode_amount  postcode + amount equal to the outstanding balance
+#    Name/postcode lookups are equality on expression indexes
+#    (migrations/0001_baseline.py)
+#  • Matched lines become Payment rows in one INSERT ... SELECT; unmatched or
+#    ambiguous lines go to payment_review_queue for a person to assign
+#  • Each file is recorded in bank_statements by SHA-256, so the same file
+#    can never be posted twice, and each line in bank_statement_lines by
+#    (date, amount, reference, payer, occurrence in the file), so a line
+#    repeated in an overlapping statement is skipped as a duplicate
+#
+#  Columns (header row, case-insensitive, first one present wins):
+#    date / transaction_date, amount / credit, reference / ref,
+#    name / payer / payer_name, postcode, case_id / case
+#
+#  CLI:  python payment_import.py statement.csv [--user system] [--dry-run]
+# =============================================================================
+
+import argparse
+import hashlib
+import io
+import os
+import re
+import sys
+import time
+from collections import Counter
+
+from case_import import read_rows, clean_text, parse_date, parse_amount
+from search import SEARCH_FIELDS
+
+# SEARCH_FIELDS expressions the matcher compares by equality; the baseline
+# migration builds a btree expression index on cases for each of them.
+PAYMENT_MATCH_FIELDS = ('debtor', 'postcode')
+
+COLUMN_ALIASES = {
+    'transaction_date': ('date', 'transaction_date', 'posted', 'value_date'),
+    'amount': ('amount', 'credit', 'paid_in', 'credit_amount'),
+    'reference': ('reference', 'ref'),
+    'payer_name': ('name', 'payer', 'payer_name', 'counterparty'),
+    'postcode': ('postcode', 'post_code'),
+    'case_id': ('case_id', 'case'),
+}
+
+# Prefix debtors are asked to quote before their case number.
+CASE_REFERENCE_PREFIX = os.environ.get('CASE_REFERENCE_PREFIX', 'HBR')
+
+# A reference names a case only as prefix + number ("HBR-004512", "hbr 4512");
+# a bare number could be anything (invoice, account, phone).
+REFERENCE_CASE_RE = re.compile(
+    rf'(?<![A-Z0-9]){re.escape(CASE_REFERENCE_PREFIX)}[ /-]?0*(\d{{1,9}})(?!\d)', re.IGNORECASE)
+
+_DEBTOR = SEARCH_FIELDS['debtor']
+_POSTCODE = SEARCH_FIELDS['postcode']
+
+# What has to agree with the referenced case before a payment is posted to it.
+_REFERENCE_CONFIRMED = (f"({_DEBTOR} = stg.payer_key OR {_POSTCODE} = stg.postcode_key "
+                        f"OR ROUND(cb.balance, 2) = stg.amount)")
+
+MATCH_RULES = (
+    ('reference', f"s.id = stg.case_ref AND {_REFERENCE_CONFIRMED}"),
+    ('debtor_postcode', f"{_DEBTOR} = stg.payer_key AND {_POSTCODE} = stg.postcode_key"),
+    ('debtor', f"{_DEBTOR} = stg.payer_key AND s.lifecycle_state = 'active'"),
+    ('postcode_amount', f"{_POSTCODE} = stg.postcode_key AND ROUND(cb.balance, 2) = stg.amount "
+                        f"AND s.lifecycle_state = 'active'"),
+)
+
+MAX_CANDIDATES = 10
+
+
+def _pick(raw, column):
+    for alias in COLUMN_ALIASES[column]:
+        if raw.get(alias) not in (None, ''):
+            return raw[alias]
+    return None
+
+
+def normalize_line(raw):
+    """Return the staging tuple for one statement line, or raise ValueError with the reason."""
+    transaction_date = parse_date(_pick(raw, 'transaction_date'))
+    if transaction_date is None:
+        raise ValueError("date is required")
+    amount = parse_amount(_pick(raw, 'amount'))
+    if amount is None:
+        raise ValueError("amount is required")
+
+    reference = clean_text(_pick(raw, 'reference'))
+    payer_name = clean_text(_pick(raw, 'payer_name'))
+    postcode = clean_text(_pick(raw, 'postcode'))
+
+    case_ref = clean_text(_pick(raw, 'case_id'))
+    try:
+        case_ref = int(float(case_ref)) if case_ref is not None else None
+    except ValueError:
+        found = REFERENCE_CASE_RE.search(case_ref)
+        case_ref = int(found.group(1)) if found else None
+    if case_ref is None and reference:
+        found = REFERENCE_CASE_RE.search(reference)
+        case_ref = int(found.group(1)) if found else None
+
+    return (
+        transaction_date, amount, reference, payer_name, postcode, case_ref,
+        ' '.join(payer_name.lower().split()) if payer_name else None,
+        ''.join(postcode.upper().split()) if postcode else None,
+    )
+
+
+def line_key(staged, occurrence):
+    """Dedupe key for a normalized line: date, amount, reference, payer and its occurrence in the file."""
+    transaction_date, amount, reference, payer_key = staged[0], staged[1], staged[2], staged[6]
+    reference = ' '.join(reference.lower().split()) if reference else ''
+    key = '|'.join((transaction_date.isoformat(), str(amount), reference, payer_key or '', str(occurrence)))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def import_statement(c, data, filename, user_id, post=True):
+    """Stage, match and post one statement file (bytes). The caller commits.
+
+    Returns {'statement_id', 'duplicate', 'lines', 'duplicates', 'matched', 'queued', 'by_rule',
+    'errors': [(line_no, message)], 'seconds', 'lines_per_sec'}; duplicates counts lines
+    already imported from an earlier statement, which are skipped.
+    """
+    start = time.perf_counter()
+    file_hash = hashlib.sha256(data).hexdigest()
+    c.execute("""
+        INSERT INTO bank_statements (file_hash, filename, imported_by)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (file_hash) DO NOTHING
+        RETURNING id
+    """, (file_hash, filename, user_id))
+    row = c.fetchone()
+    if not row:
+        c.execute("SELECT id FROM bank_statements WHERE file_hash = %s", (file_hash,))
+        return {'statement_id': c.fetchone()['id'], 'duplicate': True}
+    statement_id = row['id']
+
+    c.execute("""
+        CREATE TEMP TABLE payment_import_staging (
+            line_no INTEGER PRIMARY KEY,
+            transaction_date DATE NOT NULL,
+            amount NUMERIC(14, 2) NOT NULL,
+            reference TEXT,
+            payer_name TEXT,
+            postcode TEXT,
+            case_ref INTEGER,
+            payer_key TEXT,
+            postcode_key TEXT,
+            line_key TEXT NOT NULL,
+            case_id INTEGER,
+            match_rule TEXT,
+            candidates INTEGER[],
+            reason TEXT
+        ) ON COMMIT DROP
+    """)
+
+    lines = 0
+    errors = []
+    seen = Counter()
+    with c.copy("""
+        COPY payment_import_staging (line_no, transaction_date, amount, reference, payer_name,
+                                     postcode, case_ref, payer_key, postcode_key, line_key)
+        FROM STDIN
+    """) as copy:
+        for line_no, raw in read_rows(io.BytesIO(data), filename):
+            lines += 1
+            try:
+                staged = normalize_line(raw)
+            except ValueError as e:
+                errors.append((line_no, str(e)))
+                continue
+            identical = line_key(staged, 0)
+            seen[identical] += 1
+            copy.write_row((line_no,) + staged + (line_key(staged, seen[identical]),))
+
+    # Lines an earlier statement already brought in are dropped before matching.
+    c.execute("""
+        WITH recorded AS (
+            INSERT INTO bank_statement_lines (line_key, statement_id, line_no)
+            SELECT line_key, %s, line_no FROM payment_import_staging
+            ON CONFLICT (line_key) DO NOTHING
+            RETURNING line_key
+        )
+        DELETE FROM payment_import_staging stg
+        WHERE NOT EXISTS (SELECT 1 FROM recorded WHERE recorded.line_key = stg.line_key)
+    """, (statement_id,))
+    duplicates = c.rowcount
+    c.execute("ANALYZE payment_import_staging")
+
+    for rule, condition in MATCH_RULES:
+        c.execute(f"""
+            WITH hits AS (
+                SELECT stg.line_no, found.ids
+                FROM payment_import_staging stg
+                CROSS JOIN LATERAL (
+                    SELECT array_agg(hit.id ORDER BY hit.id) AS ids
+                    FROM (
+                        SELECT s.id
+                        FROM cases s
+                        LEFT JOIN case_balances cb ON cb.case_id = s.id
+                        WHERE {condition}
+                        LIMIT %s
+                    ) hit
+                ) found
+                WHERE stg.case_id IS NULL AND stg.reason IS NULL AND found.ids IS NOT NULL
+            )
+            UPDATE payment_import_staging stg SET
+                case_id = CASE WHEN cardinality(hits.ids) = 1 THEN hits.ids[1] END,
+                match_rule = CASE WHEN cardinality(hits.ids) = 1 THEN %s END,
+                candidates = CASE WHEN cardinality(hits.ids) = 1 THEN NULL
+                                  ELSE COALESCE(stg.candidates, hits.ids[1:%s]) END
+            FROM hits
+            WHERE hits.line_no = stg.line_no
+        """, (MAX_CANDIDATES + 1, rule, MAX_CANDIDATES))
+        if rule == 'reference':
+            # A reference nothing else backs up goes to a person, not to another rule.
+            c.execute("""
+                UPDATE payment_import_staging stg
+                SET candidates = ARRAY[s.id], reason = 'unconfirmed reference'
+                FROM cases s
+                WHERE s.id = stg.case_ref AND stg.case_id IS NULL
+            """)
+    c.execute("SELECT match_rule, COUNT(*) AS n FROM payment_import_staging GROUP BY match_rule")
+    counts = {row['match_rule']: row['n'] for row in c.fetchall()}
+    by_rule = {rule: counts.get(rule, 0) for rule, _ in MATCH_RULES}
+
+    matched = queued = 0
+    if post:
+        c.execute("""
+            INSERT INTO money (case_id, type, amount, transaction_date, created_by, description)
+            SELECT case_id, 'Payment', amount, transaction_date, %s,
+                   left('Bank: ' || COALESCE(reference, payer_name, ''), 200)
+            FROM payment_import_staging
+            WHERE case_id IS NOT NULL
+            ORDER BY line_no
+        """, (user_id,))
+        matched = c.rowcount
+
+        c.execute("""
+            INSERT INTO payment_review_queue
+                (statement_id, line_no, transaction_date, amount, reference, payer_name, postcode,
+                 candidate_case_ids, reason)
+            SELECT %s, line_no, transaction_date, amount, reference, payer_name, postcode,
+                   candidates,
+                   COALESCE(reason, CASE WHEN candidates IS NULL THEN 'no match' ELSE 'ambiguous' END)
+            FROM payment_import_staging
+            WHERE case_id IS NULL
+            ORDER BY line_no
+        """, (statement_id,))
+        queued = c.rowcount
+    else:
+        c.execute("""
+            SELECT COUNT(case_id) AS matched, COUNT(*) - COUNT(case_id) AS queued
+            FROM payment_import_staging
+        """)
+        row = c.fetchone()
+        matched, queued = row['matched'], row['queued']
+
+    c.execute("""
+        UPDATE bank_statements SET lines = %s, matched = %s, queued = %s, rejected = %s, duplicates = %s
+        WHERE id = %s
+    """, (lines, matched, queued, len(errors), duplicates, statement_id))
+
+    seconds = time.perf_counter() - start
+    return {
+        'statement_id': statement_id,
+        'duplicate': False,
+        'lines': lines,
+        'duplicates': duplicates,
+        'matched': matched,
+        'queued': queued,
+        'by_rule': by_rule,
+        'errors': errors,
+        'seconds': round(seconds, 3),
+        'lines_per_sec': round(lines / seconds) if seconds else None,
+    }
+
+
+# ----------------------------------------------------------------------
+#  REVIEW QUEUE
+# ----------------------------------------------------------------------
+def assign_review_item(c, item_id, case_id, user_id):
+    """Post an open review item to case_id. Returns the money id, or None if not open / no such case."""
+    c.execute("SELECT 1 FROM cases WHERE id = %s", (case_id,))
+    if not c.fetchone():
+        return None
+    c.execute("""
+        UPDATE payment_review_queue SET status = 'posted', resolved_case_id = %s,
+               resolved_by = %s, resolved_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND status = 'open'
+        RETURNING transaction_date, amount, reference, payer_name
+    """, (case_id, user_id, item_id))
+    item = c.fetchone()
+    if not item:
+        return None
+    c.execute("""
+        INSERT INTO money (case_id, type, amount, transaction_date, created_by, description)
+        VALUES (%s, 'Payment', %s, %s, %s, left('Bank: ' || COALESCE(%s, %s, ''), 200))
+        RETURNING id
+    """, (case_id, item['amount'], item['transaction_date'], user_id, item['reference'], item['payer_name']))
+    money_id = c.fetchone()['id']
+    c.execute("UPDATE payment_review_queue SET money_id = %s WHERE id = %s", (money_id, item_id))
+    return money_id
+
+
+def dismiss_review_item(c, item_id, user_id):
+    c.execute("""
+        UPDATE payment_review_queue SET status = 'dismissed', resolved_by = %s, resolved_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND status = 'open'
+    """, (user_id, item_id))
+    return c.rowcount == 1
+
+
+def main():
+    import psycopg
+    from psycopg.rows import dict_row
+    from extensions import job_user_id
+
+    parser = argparse.ArgumentParser(description="Post a bank statement file as case payments")
+    parser.add_argument('path')
+    parser.add_argument('--user', default=os.environ.get('JOB_USER', 'system'),
+                        help="username recorded on the Payment rows")
+    parser.add_argument('--dry-run', action='store_true', help="match only, then roll back")
+    args = parser.parse_args()
+
+    with open(args.path, 'rb') as f:
+        data = f.read()
+    with psycopg.connect(os.environ['DATABASE_URL'], row_factory=dict_row) as conn:
+        c = conn.cursor()
+        try:
+            user_id = job_user_id(c, args.user)
+        except LookupError as e:
+            parser.error(str(e))
+        result = import_statement(c, data, os.path.basename(args.path), user_id, post=not args.dry_run)
+        if args.dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+
+    if result['duplicate']:
+        print(f"{args.path} was already imported (statement {result['statement_id']})")
+        return 1
+    for line_no, message in result['errors'][:20]:
+        print(f"line {line_no}: {message}")
+    if len(result['errors']) > 20:
+        print(f"... {len(result['errors']) - 20} more")
+    rules = ', '.join(f"{rule} {count}" for rule, count in result['by_rule'].items())
+    print(f"{result['lines']} lines: {result['matched']} {'matched' if args.dry_run else 'posted'} ({rules}), "
+          f"{result['queued']} {'unmatched' if args.dry_run else 'queued for review'}, "
+          f"{result['duplicates']} already imported, {len(result['errors'])} rejected in {result['seconds']:.2f}s "
+          f"({result['lines_per_sec'] or 0:,} lines/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
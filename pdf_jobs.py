@@ -0,0 +1,233 @@
+# =============================================================================
+#  PDF JOBS - CLIENT REPORT PDFs RENDERED OUTSIDE THE REQUEST THREAD
+#  • WeasyPrint runs in a small process pool per gunicorn worker, so a big
+#    render never blocks the worker that took the request
+#  • Job state lives on disk in PDF_CACHE_DIR, so any worker can answer a
+#    status or download request:
+#        <job_id>.pending   render queued/running
+#        <job_id>.pdf       finished (also the cache)
+#        <job_id>.error     render failed (message inside)
+#  • job_id = "<client_id>-<ledger version>"; the version changes whenever
+#    the client's cases or balances change, so finished PDFs are reused
+#    until the ledger moves on
+#  • The limits hold across all gunicorn workers sharing PDF_CACHE_DIR:
+#    at most PDF_RENDER_WORKERS renders run at once (each render takes one
+#    of that many flock'ed slot files first) and at most PDF_MAX_QUEUED
+#    more wait (live .pending files, counted under a lock); beyond that
+#    submit() reports 'busy'
+# =============================================================================
+
+import fcntl
+import glob
+import hashlib
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from ledger import REPORT_COLUMNS, REPORT_TOTALS
+
+PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'harbour_pdf_cache')
+PDF_RENDER_WORKERS = int(os.environ.get('PDF_RENDER_WORKERS', 1))
+PDF_MAX_QUEUED = int(os.environ.get('PDF_MAX_QUEUED', 4))
+PDF_JOB_TIMEOUT = float(os.environ.get('PDF_JOB_TIMEOUT', 600))  # a .pending older than this is abandoned
+
+JOB_ID_RE = re.compile(r'^\d+-[0-9a-f]{12}$')
+
+_SUBMIT_LOCK = '.submit.lock'
+_SLOT_LOCK = '.render-slot-{}.lock'
+
+_executor = None
+_executor_pid = None
+_lock = threading.Lock()
+
+
+def _path(job_id, ext):
+    return os.path.join(PDF_CACHE_DIR, f"{job_id}.{ext}")
+
+
+def ledger_version(c, client_id):
+    """Short hash that changes whenever the client's report content could change."""
+    c.execute("""
+        SELECT cl.business_name,
+               COUNT(s.id) AS case_count,
+               COALESCE(MAX(s.id), 0) AS max_case_id,
+               MAX(cb.updated_at) AS balances_updated_at,
+               MD5(STRING_AGG(COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last, ''), '|' ORDER BY s.id)) AS debtors
+        FROM clients cl
+        LEFT JOIN cases s ON s.client_id = cl.id
+        LEFT JOIN case_balances cb ON cb.case_id = s.id
+        WHERE cl.id = %s
+        GROUP BY cl.business_name
+    """, (client_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    raw = '|'.join(str(row[k]) for k in ('business_name', 'case_count', 'max_case_id', 'balances_updated_at', 'debtors'))
+    return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+
+def job_id_for(client_id, version):
+    return f"{int(client_id)}-{version}"
+
+
+def status(job_id):
+    """'done', 'running', 'failed' or 'unknown' for a job id."""
+    if not JOB_ID_RE.match(job_id or ''):
+        return 'unknown'
+    if os.path.exists(_path(job_id, 'pdf')):
+        return 'done'
+    pending = _path(job_id, 'pending')
+    if os.path.exists(pending) and time.time() - os.path.getmtime(pending) < PDF_JOB_TIMEOUT:
+        return 'running'
+    if os.path.exists(_path(job_id, 'error')):
+        return 'failed'
+    return 'unknown'
+
+
+def error_message(job_id):
+    try:
+        with open(_path(job_id, 'error')) as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def pdf_path(job_id):
+    return _path(job_id, 'pdf') if status(job_id) == 'done' else None
+
+
+def _live_pending():
+    """Jobs queued or rendering in any worker (.pending files that have not timed out)."""
+    now = time.time()
+    live = 0
+    for pending in glob.glob(os.path.join(PDF_CACHE_DIR, '*.pending')):
+        try:
+            if now - os.path.getmtime(pending) < PDF_JOB_TIMEOUT:
+                live += 1
+        except OSError:
+            pass
+    return live
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            # spawn, not fork: the worker has pool/background threads that must not be copied.
+            _executor = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def submit(client_id, version, database_url):
+    """Queue a render unless it is cached, already running or the queue is full. Returns (job_id, status)."""
+    job_id = job_id_for(client_id, version)
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+
+    # Check and claim under a lock shared by every worker, so two workers can
+    # neither both queue the same job nor both take the last free place.
+    with open(os.path.join(PDF_CACHE_DIR, _SUBMIT_LOCK), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        current = status(job_id)
+        if current in ('done', 'running'):
+            return job_id, current
+        if _live_pending() >= PDF_RENDER_WORKERS + PDF_MAX_QUEUED:
+            return job_id, 'busy'
+
+        # Older versions of this client's report can never be served again.
+        for stale in glob.glob(os.path.join(PDF_CACHE_DIR, f"{int(client_id)}-*")):
+            if not os.path.basename(stale).startswith(job_id + '.'):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+
+        if os.path.exists(_path(job_id, 'error')):
+            os.remove(_path(job_id, 'error'))
+        with open(_path(job_id, 'pending'), 'w') as f:
+            f.write(str(os.getpid()))
+
+    try:
+        _get_executor().submit(render_job, job_id, int(client_id), database_url, PDF_CACHE_DIR,
+                               PDF_RENDER_WORKERS)
+    except Exception:
+        os.remove(_path(job_id, 'pending'))
+        raise
+    return job_id, 'running'
+
+
+# ----------------------------------------------------------------------
+#  Everything below runs inside the render process
+# ----------------------------------------------------------------------
+def build_report_html(client, cases, totals):
+    html = f"<h1>Client Report: {client['business_name']} (ID: {client['id']})</h1>"
+    html += "<table border='1' style='width:100%; border-collapse:collapse; font-family:Arial; font-size:12px;'><tr style='background:#ddd;'><th>Case ID</th><th>Debtor</th><th>Invoice</th><th>Payment</th><th>Charge</th><th>Interest</th><th>Balance</th></tr>"
+    html += ''.join(
+        f"<tr><td>{d['case_id']}</td><td>{d['debtor']}</td><td>£{d['invoice']:.2f}</td><td>£{d['payment']:.2f}</td><td>£{d['charge']:.2f}</td><td>£{d['interest']:.2f}</td><td>£{d['balance']:.2f}</td></tr>"
+        for d in cases
+    )
+    html += f"<tr style='font-weight:bold; background:#eee;'><td colspan='2'>TOTALS</td><td>£{totals['invoice']:.2f}</td><td>£{totals['payment']:.2f}</td><td>£{totals['charge']:.2f}</td><td>£{totals['interest']:.2f}</td><td>£{totals['balance']:.2f}</td></tr></table>"
+    return html
+
+
+def _render_slot(cache_dir, slots):
+    """Block until one of `slots` slot files is ours; the flock goes when the file is closed."""
+    while True:
+        for i in range(slots):
+            slot = open(os.path.join(cache_dir, _SLOT_LOCK.format(i)), 'w')
+            try:
+                fcntl.flock(slot, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return slot
+            except BlockingIOError:
+                slot.close()
+        time.sleep(0.1)
+
+
+def render_job(job_id, client_id, database_url, cache_dir, slots=1):
+    pending = os.path.join(cache_dir, f"{job_id}.pending")
+    target = os.path.join(cache_dir, f"{job_id}.pdf")
+    slot = _render_slot(cache_dir, slots)
+    try:
+        import psycopg
+        from psycopg.rows import dict_row
+        from weasyprint import HTML
+
+        with psycopg.connect(database_url, row_factory=dict_row) as conn:
+            c = conn.cursor()
+            c.execute("SELECT id, business_name FROM clients WHERE id = %s", (client_id,))
+            client = c.fetchone()
+            c.execute(f"""
+                SELECT {REPORT_TOTALS}
+                FROM cases s
+                LEFT JOIN case_balances cb ON cb.case_id = s.id
+                WHERE s.client_id = %s
+            """, (client_id,))
+            totals = c.fetchone()
+            c.execute(f"""
+                SELECT {REPORT_COLUMNS}
+                FROM cases s
+                LEFT JOIN case_balances cb ON cb.case_id = s.id
+                WHERE s.client_id = %s
+                ORDER BY s.id
+            """, (client_id,))
+            cases = c.fetchall()
+
+        # Write next to the target and rename, so readers never see half a file.
+        tmp = target + f".{os.getpid()}.tmp"
+        HTML(string=build_report_html(client, cases, totals)).write_pdf(tmp)
+        os.replace(tmp, target)
+    except Exception as e:
+        with open(os.path.join(cache_dir, f"{job_id}.error"), 'w') as f:
+            f.write(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        try:
+            os.remove(pending)
+        except OSError:
+            pass
+        slot.close()
@@ -2,16 +2,27 @@
 #  ADMIN ROUTES
 #  • /db_structure  – shows all tables/columns (useful for debugging)
 #  • API key management (generate, list, revoke)
-#  Only logged-in users can access these
+#  • /api/db_pool_stats – connection pool counters for this worker
+#  • /api/schema/refresh – re-read this worker's schema registry
+#  • /metrics – Prometheus text (request latency, SQL time and query counts)
+#  Only logged-in users can access these (/metrics also takes METRICS_TOKEN)
 # =============================================================================
 
-from flask import Blueprint, render_template, request, jsonify
-from flask_login import login_required
-from extensions import get_db
+from flask import Blueprint, render_template, request, jsonify, Response
+from flask_login import login_required, current_user
+from extensions import get_db, pool_stats
+import hmac
+import metrics
+import os
+import schema
+import strategy_cache
 import uuid
 
 admin_bp = Blueprint('admin', __name__)
 
+# Bearer token for Prometheus, which cannot log in. Unset = logged-in users only.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 
 @admin_bp.route('/db_structure')
 @login_required
@@ -61,51 +72,44 @@ def db_structure():
     return render_template('db_structure.html', structure=structure, links=links)
 
 
+@admin_bp.route('/api/db_pool_stats')
+@login_required
+def db_pool_stats():
+    # Counters are per gunicorn worker (each worker owns its own pool).
+    return jsonify(pool_stats())
+
+
+@admin_bp.route('/metrics')
+def metrics_endpoint():
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not current_user.is_authenticated and not (METRICS_TOKEN and hmac.compare_digest(token, METRICS_TOKEN)):
+        return Response("Unauthorized\n", status=401, mimetype='text/plain')
+    gauges = {f"pool_{name}": value for name, value in pool_stats().items()}
+    return Response(metrics.render(gauges), mimetype='text/plain; version=0.0.4')
+
+
+@admin_bp.route('/api/schema/refresh', methods=['POST'])
+@login_required
+def schema_refresh():
+    # Per worker, like the pool; kill -HUP the gunicorn master to reload them all.
+    return jsonify(schema.refresh().as_dict())
+
+
 @admin_bp.route('/api/db_cleanse', methods=['POST'])
 @login_required
 def db_cleanse():
     """
     One-click DB cleanup/backfill for migration alignment.
     - Drops legacy tables that are no longer used by app code.
-    - Ensures strategy runtime tables exist.
     - Seeds one default strategy if missing.
     - Backfills clients.default_strategy_id and case_strategy rows.
     """
     db = get_db()
     c = db.cursor()
 
-    # Ensure new runtime tables exist even if init migration wasn't run.
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS strategies (
-            id SERIAL PRIMARY KEY,
-            name TEXT NOT NULL UNIQUE,
-            is_active INTEGER DEFAULT 1,
-            definition_json JSONB NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS case_strategy (
-            case_id INTEGER PRIMARY KEY REFERENCES cases(id) ON DELETE CASCADE,
-            strategy_id INTEGER NOT NULL REFERENCES strategies(id),
-            step_index INTEGER DEFAULT 0,
-            next_action_date DATE,
-            last_executed_at TIMESTAMP,
-            paused INTEGER DEFAULT 0,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS client_custom_field_slots (
-            client_id INTEGER REFERENCES clients(id) ON DELETE CASCADE,
-            slot_no INTEGER NOT NULL CHECK (slot_no BETWEEN 1 AND 16),
-            field_id INTEGER NOT NULL REFERENCES custom_field_definitions(id),
-            PRIMARY KEY (client_id, slot_no),
-            UNIQUE (client_id, field_id)
-        )
-    """)
-
-    c.execute("ALTER TABLE clients ADD COLUMN IF NOT EXISTS default_strategy_id INTEGER REFERENCES strategies(id)")
+    # Tables and columns come from migrations (python migrate.py), not from here.
+    if not schema.get().has_table('case_strategy'):
+        return jsonify({'ok': False, 'error': 'Schema is not migrated - run python migrate.py first'}), 409
 
     # Seed a baseline strategy so every case can have a runtime row.
     c.execute("SELECT id FROM strategies ORDER BY id LIMIT 1")
@@ -143,6 +147,8 @@ def db_cleanse():
     c.execute("DROP TABLE IF EXISTS outbound_logs")
 
     db.commit()
+    strategy_cache.invalidate()
+    schema.refresh()
     return jsonify({
         'ok': True,
         'seeded_strategy': seeded_strategy,
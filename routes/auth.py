@@ -4,13 +4,21 @@
 #  • Flask-Login setup
 #  • Login page & validation
 #  • Logout
-#  • User class & user loader
+#  • User class & user loader (cached per worker for USER_CACHE_TTL seconds)
 # =============================================================================
 
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user, LoginManager, UserMixin
 from extensions import get_db
 import bcrypt
+import os
+import threading
+import time
+
+# How long a worker trusts its cached copy of a user. Anything that changes a
+# user's username or role must call invalidate_user(); other workers pick the
+# change up within this many seconds.
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', 30))
 
 # Blueprint for all auth-related routes
 auth_bp = Blueprint('auth', __name__)
@@ -26,16 +34,39 @@ class User(UserMixin):
         self.username = username
         self.role = role
 
-# Tell Flask-Login how to load a user from the session
+_user_cache = {}  # str(user id) -> (User, loaded_at)
+_user_cache_lock = threading.Lock()
+
+
+# Tell Flask-Login how to load a user from the session. This runs on every
+# authenticated request, so the row is cached instead of queried each time.
 @login_manager.user_loader
 def load_user(user_id):
+    key = str(user_id)
+    cached = _user_cache.get(key)
+    if cached and time.monotonic() - cached[1] < USER_CACHE_TTL:
+        return cached[0]
+
     db = get_db()
     c = db.cursor()
     c.execute("SELECT id, username, role FROM users WHERE id = %s", (user_id,))
     row = c.fetchone()
-    if row:
-        return User(row['id'], row['username'], row['role'])
-    return None
+    if not row:
+        invalidate_user(key)
+        return None
+    user = User(row['id'], row['username'], row['role'])
+    with _user_cache_lock:
+        _user_cache[key] = (user, time.monotonic())
+    return user
+
+
+def invalidate_user(user_id=None):
+    """Forget one cached user (or all of them) in this worker."""
+    with _user_cache_lock:
+        if user_id is None:
+            _user_cache.clear()
+        else:
+            _user_cache.pop(str(user_id), None)
 
 # Attach login_manager to the app when the blueprint loads
 @auth_bp.record_once
@@ -56,6 +87,7 @@ def login():
         c.execute("SELECT id, username, password_hash, role FROM users WHERE username = %s", (username,))
         user = c.fetchone()
         if user and bcrypt.checkpw(password.encode(), user['password_hash']):
+            invalidate_user(user['id'])
             login_user(User(user['id'], user['username'], user['role']))
             return redirect(url_for('case.dashboard'))  # main page after login
         flash('Invalid username or password')
@@ -64,5 +96,6 @@ def login():
 @auth_bp.route('/logout')
 @login_required
 def logout():
+    invalidate_user(current_user.id)
     logout_user()
     return redirect(url_for('auth.login'))
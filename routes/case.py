@@ -2,7 +2,9 @@
 # =============================================================================
 #  CASE ROUTES - THE BIG ONE - THIS IS THE ENTIRE APP'S CORE
 #  • Main dashboard ( / and /dashboard )
-#  • Add case, add transaction, add note
+#  • Add case, bulk case import, add transaction, add note
+#  • Bank statement payment import + review queue
+#  • Apply charge codes to one case or many (see charges.py)
 #  • Edit / delete transaction & note
 #  • Update case status
 #  • Search (cases & clients)
@@ -12,29 +14,38 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from extensions import get_db
-from datetime import date
-import psycopg
+from ledger import BALANCE_EXPR, ZERO
+from search import search_cases, search_clients
+import client_index
+import strategy_cache
+import case_import
+import charges
+import payment_import
+import schema
+from contextlib import nullcontext
+from datetime import date, datetime
+import os
 
 case_bp = Blueprint('case', __name__)
 
+# Send the dashboard's queries as one psycopg pipeline (one round trip).
+# DASHBOARD_PIPELINE=0 sends them one by one, e.g. to compare latency.
+DASHBOARD_PIPELINE = os.environ.get('DASHBOARD_PIPELINE', '1') != '0'
 
-def _table_exists(c, table_name):
-    c.execute("SELECT to_regclass(%s) IS NOT NULL AS exists", (f"public.{table_name}",))
-    row = c.fetchone()
-    return bool(row and row['exists'])
+
+# Keyset cursors for the dashboard lists: "<sort value ISO>,<row id>". The
+# sort columns are NOT NULL (migrations/0008), so every row has a position.
+def _encode_cursor(value, row_id):
+    return f"{value.isoformat()},{row_id}"
 
 
-def _strategy_timeline(definition_json, step_index):
-    steps = []
-    if isinstance(definition_json, dict):
-        steps = definition_json.get('steps') or []
-    if not isinstance(steps, list):
-        steps = []
+def _decode_cursor(raw, parse):
     try:
-        idx = max(int(step_index or 0), 0)
-    except (TypeError, ValueError):
-        idx = 0
-    return steps[max(0, idx - 3):idx], steps[idx:idx + 3]
+        value, row_id = raw.rsplit(',', 1)
+        return parse(value), int(row_id)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
 
 # ----------------------------------------------------------------------
 #  SEARCH - global search box + client autocomplete
@@ -42,33 +53,13 @@ def _strategy_timeline(definition_json, step_index):
 @case_bp.route('/search')
 @login_required
 def search():
-    q = request.args.get('q', '').strip().lower()
+    q = request.args.get('q', '').strip()
     if not q:
         return jsonify([])
 
     db = get_db()
     c = db.cursor()
-    like = f"%{q}%"
-
-    sql = """
-        SELECT DISTINCT
-            c.id as client_id, c.business_name as client_name,
-            s.id as case_id,
-            COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last) as debtor_name,
-            s.postcode, s.email, s.phone
-        FROM cases s
-        JOIN clients c ON s.client_id = c.id
-        WHERE LOWER(c.business_name) LIKE %s
-           OR LOWER(COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last)) LIKE %s
-           OR LOWER(s.email || '') LIKE %s
-           OR LOWER(s.phone || '') LIKE %s
-           OR LOWER(s.postcode || '') LIKE %s
-        ORDER BY c.business_name, s.id
-        LIMIT 50
-    """
-    c.execute(sql, (like, like, like, like, like))
-    results = [dict(row) for row in c.fetchall()]
-    return jsonify(results)
+    return jsonify(search_cases(c, q))
 
 
 @case_bp.route('/client_search')
@@ -78,11 +69,10 @@ def client_search():
     if not q:
         return jsonify([])
 
-    db = get_db()
-    c = db.cursor()
-    like = f"%{q.lower()}%"
-    c.execute("SELECT id, business_name as name FROM clients WHERE LOWER(business_name) LIKE %s ORDER BY business_name LIMIT 20", (like,))
-    results = [{'id': r['id'], 'name': r['name']} for r in c.fetchall()]
+    # Served from this worker's in-memory index; the database answers while it warms up.
+    results = client_index.search(q)
+    if results is None:
+        results = search_clients(get_db().cursor(), q)
     return jsonify(results)
 
 
@@ -114,30 +104,180 @@ def add_case():
     c.execute("SELECT default_strategy_id FROM clients WHERE id = %s", (request.form['client_id'],))
     row = c.fetchone()
     default_strategy_id = row['default_strategy_id'] if row else None
-    if default_strategy_id:
-        try:
-            c.execute("""
-                INSERT INTO case_strategy (case_id, strategy_id, step_index, next_action_date)
-                VALUES (%s, %s, 0, %s)
-                ON CONFLICT (case_id) DO NOTHING
-            """, (new_case_id, default_strategy_id, next_action_date or date.today().isoformat()))
-
-            c.execute("SELECT name FROM strategies WHERE id = %s", (default_strategy_id,))
-            strategy_row = c.fetchone()
-            strategy_name = strategy_row['name'] if strategy_row else f"#{default_strategy_id}"
-            c.execute("""
-                INSERT INTO notes (case_id, type, note, created_by)
-                VALUES (%s, 'Strategy', %s, %s)
-            """, (new_case_id, f"Case entered strategy '{strategy_name}' at step 0.", current_user.id))
-        except psycopg.errors.UndefinedTable:
-            # Migration not fully applied yet; allow case creation without strategy runtime row.
-            pass
+    # A partially migrated DB may not have case_strategy yet; the case is still created.
+    if default_strategy_id and schema.get().has_table('case_strategy'):
+        c.execute("""
+            INSERT INTO case_strategy (case_id, strategy_id, step_index, next_action_date)
+            VALUES (%s, %s, 0, %s)
+            ON CONFLICT (case_id) DO NOTHING
+        """, (new_case_id, default_strategy_id, next_action_date or date.today().isoformat()))
+
+        c.execute("SELECT name FROM strategies WHERE id = %s", (default_strategy_id,))
+        strategy_row = c.fetchone()
+        strategy_name = strategy_row['name'] if strategy_row else f"#{default_strategy_id}"
+        c.execute("""
+            INSERT INTO notes (case_id, type, note, created_by)
+            VALUES (%s, 'Strategy', %s, %s)
+        """, (new_case_id, f"Case entered strategy '{strategy_name}' at step 0.", current_user.id))
 
     db.commit()
     flash('Case added')
     return redirect(url_for('case.dashboard', case_id=new_case_id))
 
 
+@case_bp.route('/import_cases', methods=['POST'])
+@login_required
+def import_cases():
+    """Bulk import a CSV/XLSX debtor file (see case_import.py). dry_run=1 validates only."""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'ok': False, 'error': 'No file uploaded'}), 400
+    default_client_id = request.form.get('client_id', type=int)
+    dry_run = request.form.get('dry_run') == '1'
+
+    db = get_db()
+    c = db.cursor()
+    result = case_import.import_cases(c, case_import.read_rows(upload.stream, upload.filename),
+                                      current_user.id, default_client_id, source=upload.filename)
+    if dry_run:
+        db.rollback()
+    else:
+        db.commit()
+    result['errors'] = [{'line': line_no, 'error': message} for line_no, message in result['errors']]
+    return jsonify({'ok': True, 'dry_run': dry_run, **result})
+
+
+# ----------------------------------------------------------------------
+#  BANK STATEMENT PAYMENTS + REVIEW QUEUE (see payment_import.py)
+# ----------------------------------------------------------------------
+@case_bp.route('/import_payments', methods=['POST'])
+@login_required
+def import_payments():
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'ok': False, 'error': 'No file uploaded'}), 400
+    dry_run = request.form.get('dry_run') == '1'
+
+    db = get_db()
+    c = db.cursor()
+    result = payment_import.import_statement(c, upload.read(), upload.filename, current_user.id, post=not dry_run)
+    if dry_run or result['duplicate']:
+        db.rollback()
+    else:
+        db.commit()
+    if result['duplicate']:
+        return jsonify({'ok': False, 'error': 'This statement file was already imported',
+                        'statement_id': result['statement_id']}), 409
+    result['errors'] = [{'line': line_no, 'error': message} for line_no, message in result['errors']]
+    return jsonify({'ok': True, 'dry_run': dry_run, **result})
+
+
+@case_bp.route('/payments/review')
+@login_required
+def payment_review_queue():
+    after_id = request.args.get('after_id', 0, type=int)
+    db = get_db()
+    c = db.cursor()
+    c.execute("""
+        SELECT q.id, q.statement_id, q.line_no, q.transaction_date, q.amount, q.reference,
+               q.payer_name, q.postcode, q.candidate_case_ids, q.reason, b.filename
+        FROM payment_review_queue q
+        JOIN bank_statements b ON b.id = q.statement_id
+        WHERE q.status = 'open' AND q.id > %s
+        ORDER BY q.id
+        LIMIT 200
+    """, (after_id,))
+    items = c.fetchall()
+    for item in items:
+        item['transaction_date'] = item['transaction_date'].isoformat()
+        # JSON clients read amount as a number; flask would send a Decimal as a string.
+        item['amount'] = float(item['amount'])
+    return jsonify(items)
+
+
+@case_bp.route('/payments/review/<int:item_id>/assign', methods=['POST'])
+@login_required
+def assign_payment(item_id):
+    case_id = request.form.get('case_id', type=int)
+    db = get_db()
+    c = db.cursor()
+    money_id = payment_import.assign_review_item(c, item_id, case_id, current_user.id) if case_id else None
+    if not money_id:
+        db.rollback()
+        return jsonify({'ok': False, 'error': 'Item is not open or case does not exist'}), 400
+    db.commit()
+    return jsonify({'ok': True, 'money_id': money_id})
+
+
+@case_bp.route('/payments/review/<int:item_id>/dismiss', methods=['POST'])
+@login_required
+def dismiss_payment(item_id):
+    db = get_db()
+    c = db.cursor()
+    if not payment_import.dismiss_review_item(c, item_id, current_user.id):
+        db.rollback()
+        return jsonify({'ok': False, 'error': 'Item is not open'}), 400
+    db.commit()
+    return jsonify({'ok': True})
+
+
+# ----------------------------------------------------------------------
+#  CHARGE CODES (see charges.py)
+# ----------------------------------------------------------------------
+@case_bp.route('/charges')
+@login_required
+def list_charges():
+    db = get_db()
+    c = db.cursor()
+    c.execute("""
+        SELECT id, code, description, charge_type, default_amount, percent_rate,
+               min_amount, max_amount, vat_rate, recoverable, category
+        FROM charges
+        ORDER BY category, code
+    """)
+    return jsonify(c.fetchall())
+
+
+@case_bp.route('/charges/apply', methods=['POST'])
+@login_required
+def apply_charge():
+    """Apply a charge code to case_ids (repeated or comma separated) and/or every case of client_id.
+
+    preview=1 prices it and returns the totals without posting anything.
+    """
+    db = get_db()
+    c = db.cursor()
+    charge = charges.get_charge(c, request.form.get('charge_id', type=int), request.form.get('code'))
+    if not charge:
+        return jsonify({'ok': False, 'error': 'Unknown charge code'}), 404
+    try:
+        case_ids = [int(i) for raw in request.form.getlist('case_ids') for i in raw.split(',') if i.strip()]
+    except ValueError:
+        return jsonify({'ok': False, 'error': 'case_ids must be case numbers'}), 400
+    client_id = request.form.get('client_id', type=int)
+    if not case_ids and not client_id:
+        return jsonify({'ok': False, 'error': 'No cases selected'}), 400
+    try:
+        amount = case_import.parse_amount(request.form.get('amount'))
+        transaction_date = (date.fromisoformat(request.form['transaction_date'])
+                            if request.form.get('transaction_date') else None)
+    except ValueError as e:
+        return jsonify({'ok': False, 'error': str(e)}), 400
+    preview = request.form.get('preview') == '1'
+
+    result = charges.apply_charge(
+        c, charge['id'], current_user.id, case_ids, client_id,
+        amount=amount,
+        transaction_date=transaction_date,
+        preview=preview,
+    )
+    if preview:
+        db.rollback()
+    else:
+        db.commit()
+    return jsonify({'ok': True, 'charge': charge, **result})
+
+
 @case_bp.route('/add_transaction', methods=['POST'])
 @login_required
 def add_transaction():
@@ -430,39 +570,23 @@ def set_case_mode():
 @login_required
 def dashboard():
     db = get_db()
-    c = db.cursor()
-
-    # All clients for the sidebar
-    c.execute("SELECT id, business_name FROM clients ORDER BY business_name")
-    clients = c.fetchall()
-
-    # Recent cases
-    c.execute("""
-        SELECT c.id as client_id, c.business_name, s.id as case_id,
-               COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last) as debtor,
-               s.open_date
-        FROM cases s
-        JOIN clients c ON s.client_id = c.id
-        ORDER BY s.open_date DESC, s.id DESC
-        LIMIT 10
-    """)
-    recent_cases = c.fetchall()
 
     selected_case = None
     case_client = None
     client_cases = []
     notes = []
     transactions = []
-    status_history = []
     custom_fields = [] # NEW
     derived_step_number = None
     case_strategy_runtime = None
     strategy_last_steps = []
     strategy_next_steps = []
-    balance = 0.0
-    totals = {'Invoice': 0, 'Payment': 0, 'Charge': 0, 'Interest': 0}
-    page = int(request.args.get('page', 1))
+    balance = ZERO
+    totals = {'Invoice': ZERO, 'Payment': ZERO, 'Charge': ZERO, 'Interest': ZERO}
     per_page = 15
+    notes_next = trans_next = None
+    notes_before = _decode_cursor(request.args.get('notes_before'), datetime.fromisoformat)
+    trans_after = _decode_cursor(request.args.get('trans_after'), date.fromisoformat)
 
     case_id = request.args.get('case_id')
     if case_id:
@@ -471,49 +595,59 @@ def dashboard():
         except:
             case_id = None
 
-        c.execute("SELECT * FROM cases WHERE id = %s", (case_id,))
-        selected_case = c.fetchone()
-        if selected_case:
-            c.execute("SELECT * FROM clients WHERE id = %s", (selected_case['client_id'],))
-            case_client = c.fetchone()
+    # Tables a partially migrated DB may lack decide which statements to send.
+    caps = schema.get()
+
+    # Every statement below is independent (the case's client is resolved in
+    # SQL), so they go to Postgres as one pipelined batch: one round trip.
+    q = {}
+
+    def send(name, sql, params=()):
+        q[name] = db.cursor()
+        q[name].execute(sql, params)
+
+    with db.pipeline() if DASHBOARD_PIPELINE else nullcontext():
+        # All clients for the sidebar
+        send('clients', "SELECT id, business_name FROM clients ORDER BY business_name")
+
+        # Recent cases
+        send('recent_cases', """
+            SELECT c.id as client_id, c.business_name, s.id as case_id,
+                   COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last) as debtor,
+                   s.open_date
+            FROM cases s
+            JOIN clients c ON s.client_id = c.id
+            ORDER BY s.open_date DESC, s.id DESC
+            LIMIT 10
+        """)
+
+        if case_id:
+            client_of_case = "(SELECT client_id FROM cases WHERE id = %s)"
+
+            send('case', "SELECT * FROM cases WHERE id = %s", (case_id,))
+            send('client', f"SELECT * FROM clients WHERE id = {client_of_case}", (case_id,))
 
             # Fetch custom fields with compatibility fallback when slot table is not deployed yet.
-            try:
-                if _table_exists(c, 'client_custom_field_slots'):
-                    c.execute("""
-                        SELECT
-                            fd.id AS field_id,
-                            fd.field_name,
-                            fd.field_type,
-                            cv.field_value,
-                            slots.slot_no
-                        FROM custom_field_definitions fd
-                        LEFT JOIN client_custom_field_slots slots
-                            ON slots.field_id = fd.id AND slots.client_id = %s
-                        LEFT JOIN client_custom_field_link link
-                            ON link.field_id = fd.id AND link.client_id = %s
-                        LEFT JOIN case_custom_values cv
-                            ON (cv.field_id = fd.id AND cv.case_id = %s)
-                        WHERE slots.client_id IS NOT NULL OR link.client_id IS NOT NULL
-                        ORDER BY COALESCE(slots.slot_no, 999), fd.field_name
-                    """, (selected_case['client_id'], selected_case['client_id'], case_id))
-                else:
-                    c.execute("""
-                        SELECT
-                            fd.id AS field_id,
-                            fd.field_name,
-                            fd.field_type,
-                            cv.field_value,
-                            NULL::INTEGER AS slot_no
-                        FROM client_custom_field_link link
-                        JOIN custom_field_definitions fd ON link.field_id = fd.id
-                        LEFT JOIN case_custom_values cv ON (cv.field_id = fd.id AND cv.case_id = %s)
-                        WHERE link.client_id = %s
-                        ORDER BY fd.field_name
-                    """, (case_id, selected_case['client_id']))
-            except psycopg.errors.UndefinedTable:
-                # Production safety: if migration did not run yet, hard-fallback to legacy table.
-                c.execute("""
+            if caps.has_table('client_custom_field_slots'):
+                send('custom_fields', f"""
+                    SELECT
+                        fd.id AS field_id,
+                        fd.field_name,
+                        fd.field_type,
+                        cv.field_value,
+                        slots.slot_no
+                    FROM custom_field_definitions fd
+                    LEFT JOIN client_custom_field_slots slots
+                        ON slots.field_id = fd.id AND slots.client_id = {client_of_case}
+                    LEFT JOIN client_custom_field_link link
+                        ON link.field_id = fd.id AND link.client_id = {client_of_case}
+                    LEFT JOIN case_custom_values cv
+                        ON (cv.field_id = fd.id AND cv.case_id = %s)
+                    WHERE slots.client_id IS NOT NULL OR link.client_id IS NOT NULL
+                    ORDER BY COALESCE(slots.slot_no, 999), fd.field_name
+                """, (case_id, case_id, case_id))
+            else:
+                send('custom_fields', f"""
                     SELECT
                         fd.id AS field_id,
                         fd.field_name,
@@ -523,84 +657,103 @@ def dashboard():
                     FROM client_custom_field_link link
                     JOIN custom_field_definitions fd ON link.field_id = fd.id
                     LEFT JOIN case_custom_values cv ON (cv.field_id = fd.id AND cv.case_id = %s)
-                    WHERE link.client_id = %s
+                    WHERE link.client_id = {client_of_case}
                     ORDER BY fd.field_name
-                """, (case_id, selected_case['client_id']))
-            custom_fields = c.fetchall()
-
-
-
-
-
-            
-            # Load all cases for this client
-            c.execute("SELECT id, debtor_business_name, debtor_first, debtor_last FROM cases WHERE client_id = %s ORDER BY id", (selected_case['client_id'],))
-            client_cases_raw = c.fetchall()
-            client_cases = []
-            for case in client_cases_raw:
-                case_dict = dict(case)
-                c.execute("SELECT type, amount, recoverable FROM money WHERE case_id = %s", (case['id'],))
-                money_rows = c.fetchall()
-                case_balance = 0.0
-                for m in money_rows:
-                    amt = float(m['amount'])
-                    if m['type'] == 'Payment':
-                        case_balance -= amt
-                    elif m['type'] in ['Invoice', 'Interest']:
-                        case_balance += amt
-                    elif m['type'] == 'Charge' and m['recoverable']:
-                        case_balance += amt
-                case_dict['balance'] = round(case_balance, 2)
-                client_cases.append(case_dict)
-
-            offset = (page - 1) * per_page
-            c.execute('''
-                SELECT n.*, u.username FROM notes n JOIN users u ON n.created_by = u.id 
-                WHERE n.case_id = %s ORDER BY n.created_at DESC LIMIT %s OFFSET %s
-            ''', (case_id, per_page, offset))
-            notes = c.fetchall()
-
-            c.execute('''
-                SELECT m.*, u.username FROM money m JOIN users u ON m.created_by = u.id 
-                WHERE m.case_id = %s ORDER BY m.transaction_date ASC, m.id ASC LIMIT %s OFFSET %s
-            ''', (case_id, per_page, offset))
-            transactions = c.fetchall()
-
-            c.execute('''
-                SELECT h.*, u.username FROM case_status_history h 
-                JOIN users u ON h.changed_by = u.id 
-                WHERE h.case_id = %s ORDER BY h.changed_at DESC
-            ''', (case_id,))
-            status_history = c.fetchall()
-            derived_step_number = len(status_history) + 1
-
-            for t in transactions:
-                amt = float(t['amount'])
-                typ = t['type']
-                if typ == 'Payment':
-                    balance -= amt
-                elif typ in ['Invoice', 'Interest']:
-                    balance += amt
-                elif typ == 'Charge' and t['recoverable']:
-                    balance += amt
-                totals[typ] = totals.get(typ, 0) + amt
-
-            try:
-                c.execute("""
-                    SELECT cs.step_index, cs.next_action_date, cs.paused, s.name AS strategy_name, s.definition_json
+                """, (case_id, case_id))
+
+            # All cases for this client with their balances
+            send('client_cases', f"""
+                SELECT s.id, s.debtor_business_name, s.debtor_first, s.debtor_last,
+                       COALESCE(ROUND(cb.balance, 2), 0) AS balance
+                FROM cases s
+                LEFT JOIN case_balances cb ON cb.case_id = s.id
+                WHERE s.client_id = {client_of_case}
+                ORDER BY s.id
+            """, (case_id,))
+
+            # Lists are keyset-paged (one extra row tells us whether there is a next page).
+            send('notes', f'''
+                SELECT n.*, u.username FROM notes n JOIN users u ON n.created_by = u.id
+                WHERE n.case_id = %s {'AND (n.created_at, n.id) < (%s, %s)' if notes_before else ''}
+                ORDER BY n.created_at DESC, n.id DESC LIMIT %s
+            ''', (case_id, *(notes_before or ()), per_page + 1))
+
+            # Running balance = everything before this page + a window sum over the page.
+            send('transactions', f'''
+                WITH opening AS (
+                    SELECT COALESCE(SUM({BALANCE_EXPR}), 0) AS balance
+                    FROM money m
+                    WHERE m.case_id = %s {'AND (m.transaction_date, m.id) <= (%s, %s)' if trans_after else 'AND FALSE'}
+                )
+                SELECT m.*, u.username,
+                       ROUND(opening.balance + SUM({BALANCE_EXPR}) OVER (
+                           ORDER BY m.transaction_date, m.id ROWS UNBOUNDED PRECEDING), 2) AS running_balance
+                FROM money m
+                JOIN users u ON m.created_by = u.id
+                CROSS JOIN opening
+                WHERE m.case_id = %s {'AND (m.transaction_date, m.id) > (%s, %s)' if trans_after else ''}
+                ORDER BY m.transaction_date, m.id LIMIT %s
+            ''', (case_id, *(trans_after or ()), case_id, *(trans_after or ()), per_page + 1))
+
+            send('history_count', "SELECT COUNT(*) AS n FROM case_status_history WHERE case_id = %s", (case_id,))
+
+            # Headline figures cover the whole ledger (case_balances summary row).
+            send('summary', """
+                SELECT ROUND(invoice_total, 2) AS invoice_total, ROUND(payment_total, 2) AS payment_total,
+                       ROUND(charge_total, 2) AS charge_total, ROUND(interest_total, 2) AS interest_total,
+                       ROUND(balance, 2) AS balance
+                FROM case_balances WHERE case_id = %s
+            """, (case_id,))
+
+            if caps.has_table('case_strategy'):
+                send('case_strategy', """
+                    SELECT cs.step_index, cs.next_action_date, cs.paused, cs.strategy_id,
+                           s.name AS strategy_name, s.version AS strategy_version
                     FROM case_strategy cs
                     JOIN strategies s ON s.id = cs.strategy_id
                     WHERE cs.case_id = %s
                 """, (case_id,))
-                case_strategy_runtime = c.fetchone()
-            except psycopg.errors.UndefinedTable:
-                case_strategy_runtime = None
-
-            if case_strategy_runtime:
-                strategy_last_steps, strategy_next_steps = _strategy_timeline(
-                    case_strategy_runtime.get('definition_json'),
-                    case_strategy_runtime.get('step_index')
-                )
+
+    clients = q['clients'].fetchall()
+    recent_cases = q['recent_cases'].fetchall()
+
+    if case_id:
+        selected_case = q['case'].fetchone()
+    if selected_case:
+        case_client = q['client'].fetchone()
+        custom_fields = q['custom_fields'].fetchall()
+
+        client_cases = q['client_cases'].fetchall()
+
+        notes = q['notes'].fetchall()
+        if len(notes) > per_page:
+            notes = notes[:per_page]
+            notes_next = _encode_cursor(notes[-1]['created_at'], notes[-1]['id'])
+
+        transactions = q['transactions'].fetchall()
+        if len(transactions) > per_page:
+            transactions = transactions[:per_page]
+            trans_next = _encode_cursor(transactions[-1]['transaction_date'], transactions[-1]['id'])
+
+        derived_step_number = q['history_count'].fetchone()['n'] + 1
+
+        summary = q['summary'].fetchone()
+        if summary:
+            totals = {
+                'Invoice': summary['invoice_total'],
+                'Payment': summary['payment_total'],
+                'Charge': summary['charge_total'],
+                'Interest': summary['interest_total'],
+            }
+            balance = summary['balance']
+
+        if 'case_strategy' in q:
+            case_strategy_runtime = q['case_strategy'].fetchone()
+        if case_strategy_runtime:
+            strategy = strategy_cache.get(db.cursor(), case_strategy_runtime['strategy_id'],
+                                          case_strategy_runtime['strategy_version'])
+            if strategy:
+                strategy_last_steps, strategy_next_steps = strategy.timeline(case_strategy_runtime['step_index'])
 
     today_str = date.today().isoformat()
 
@@ -612,16 +765,16 @@ def dashboard():
                            client_cases=client_cases,
                            notes=notes,
                            transactions=transactions,
-                           status_history=status_history,
                            custom_fields=custom_fields,
                            derived_step_number=derived_step_number,
                            case_strategy_runtime=case_strategy_runtime,
                            strategy_last_steps=strategy_last_steps,
                            strategy_next_steps=strategy_next_steps,
-                           balance=round(balance, 2),
-                           totals={k: round(v, 2) for k, v in totals.items()},
+                           balance=balance,
+                           totals=totals,
                            today_str=today_str,
-                           page=page)
+                           notes_next=notes_next,
+                           trans_next=trans_next)
 
 @case_bp.route('/update_custom_field', methods=['POST'])
 @login_required
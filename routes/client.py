@@ -2,31 +2,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required
 from extensions import get_db
-import psycopg
+from ledger import attach_balances
+import client_index
+import schema
 
 client_bp = Blueprint('client', __name__, url_prefix='/client')
 
 
-def _table_exists(c, table_name):
-    c.execute("SELECT to_regclass(%s) IS NOT NULL AS exists", (f"public.{table_name}",))
-    row = c.fetchone()
-    return bool(row and row['exists'])
-
-
-def _calculate_case_balance(c, case_id):
-    c.execute("SELECT type, amount, recoverable FROM money WHERE case_id = %s", (case_id,))
-    balance = 0.0
-    for t in c.fetchall():
-        amt = float(t['amount'] or 0)
-        if t['type'] == 'Payment':
-            balance -= amt
-        elif t['type'] in ['Invoice', 'Interest']:
-            balance += amt
-        elif t['type'] == 'Charge' and t['recoverable']:
-            balance += amt
-    return round(balance, 2)
-
-
 @client_bp.route('/<int:client_id>')
 @login_required
 def client_dashboard(client_id):
@@ -45,22 +27,16 @@ def client_dashboard(client_id):
         WHERE s.client_id = %s
         ORDER BY s.open_date DESC
     """, (client_id,))
-    cases = c.fetchall()
-
-    for case in cases:
-        case['balance'] = _calculate_case_balance(c, case['id'])
+    cases = attach_balances(c, c.fetchall())
 
     c.execute("SELECT * FROM custom_field_definitions ORDER BY field_name")
     all_fields = c.fetchall()
 
     # Prefer deterministic slot mapping table; fallback to legacy link table.
     linked_field_ids = []
-    try:
-        if _table_exists(c, 'client_custom_field_slots'):
-            c.execute("SELECT field_id FROM client_custom_field_slots WHERE client_id = %s ORDER BY slot_no", (client_id,))
-            linked_field_ids = [row['field_id'] for row in c.fetchall()]
-    except psycopg.errors.UndefinedTable:
-        linked_field_ids = []
+    if schema.get().has_table('client_custom_field_slots'):
+        c.execute("SELECT field_id FROM client_custom_field_slots WHERE client_id = %s ORDER BY slot_no", (client_id,))
+        linked_field_ids = [row['field_id'] for row in c.fetchall()]
 
     if not linked_field_ids:
         c.execute("SELECT field_id FROM client_custom_field_link WHERE client_id = %s", (client_id,))
@@ -87,14 +63,11 @@ def update_fields():
         flash("You can only select up to 16 custom fields for a client.")
         return redirect(url_for('client.client_dashboard', client_id=client_id))
 
-    slots_table_exists = _table_exists(c, 'client_custom_field_slots')
+    slots_table_exists = schema.get().has_table('client_custom_field_slots')
 
     c.execute("DELETE FROM client_custom_field_link WHERE client_id = %s", (client_id,))
     if slots_table_exists:
-        try:
-            c.execute("DELETE FROM client_custom_field_slots WHERE client_id = %s", (client_id,))
-        except psycopg.errors.UndefinedTable:
-            slots_table_exists = False
+        c.execute("DELETE FROM client_custom_field_slots WHERE client_id = %s", (client_id,))
 
     for idx, f_id in enumerate(selected_field_ids, start=1):
         c.execute("""
@@ -103,13 +76,10 @@ def update_fields():
             ON CONFLICT DO NOTHING
         """, (client_id, f_id))
         if slots_table_exists:
-            try:
-                c.execute("""
-                    INSERT INTO client_custom_field_slots (client_id, slot_no, field_id)
-                    VALUES (%s, %s, %s)
-                """, (client_id, idx, f_id))
-            except psycopg.errors.UndefinedTable:
-                slots_table_exists = False
+            c.execute("""
+                INSERT INTO client_custom_field_slots (client_id, slot_no, field_id)
+                VALUES (%s, %s, %s)
+            """, (client_id, idx, f_id))
 
     db.commit()
     flash("Client custom fields updated")
@@ -136,6 +106,7 @@ def add_client():
         request.form.get('default_interest_rate', 0)
     ))
     db.commit()
+    client_index.invalidate()
     flash('Client added')
     return redirect(url_for('case.dashboard'))
 
@@ -158,10 +129,7 @@ def client_cases(client_id):
         WHERE client_id = %s
         ORDER BY open_date DESC
     """, (client_id,))
-    cases = c.fetchall()
-
-    for case in cases:
-        case['balance'] = _calculate_case_balance(c, case['id'])
+    cases = attach_balances(c, c.fetchall())
 
     return render_template('client_cases.html', client=client, cases=cases)
 
@@ -177,4 +145,5 @@ def rename_client():
     if client_id and new_name:
         c.execute("UPDATE clients SET business_name = %s WHERE id = %s", (new_name, client_id))
         db.commit()
+        client_index.invalidate()
     return redirect(url_for('case.dashboard', case_id=case_id))
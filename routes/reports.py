@@ -1,15 +1,30 @@
 # =============================================================================
 # REPORTS ROUTES – FINAL VERSION (NO CODE COLUMN NEEDED)
 # =============================================================================
-from flask import Blueprint, request, send_file, make_response, render_template
+from flask import Blueprint, request, send_file, render_template, Response, stream_with_context, redirect, url_for, jsonify
 from flask_login import login_required
-from extensions import get_db
-import pandas as pd
-from io import BytesIO
-from weasyprint import HTML
+from extensions import get_db, DATABASE_URL
+from ledger import REPORT_COLUMNS, REPORT_TOTALS
+from snapshots import SNAPSHOT_COLUMNS
+import client_index
+import pdf_jobs
+import json
+import tempfile
+from datetime import date
+from openpyxl import Workbook
 
 reports_bp = Blueprint('reports', __name__)
 
+# Rows fetched per round trip by the server-side cursors used for exports.
+EXPORT_BATCH_ROWS = 2000
+
+REPORT_PAGE_SIZE = 100
+REPORT_SORTS = {
+    'case_id': 's.id',
+    'debtor': "lower(COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last))",
+    'balance': 'balance',
+}
+
 
 # ----------------------------------------------------------------------
 # 1. The main report page – live client search (works even without 'code' column)
@@ -24,12 +39,16 @@ def report_page():
     db = get_db()
     c = db.cursor()
 
-    # Load ALL clients – no reference to 'code' column at all
-    c.execute("SELECT id, business_name FROM clients ORDER BY business_name")
-    all_clients = c.fetchall()
+    # Load ALL clients for the picker – from the in-memory index when it is warm
+    all_clients = client_index.all_clients()
+    if all_clients is None:
+        c.execute("SELECT id, business_name FROM clients ORDER BY business_name")
+        all_clients = [(row['id'], row['business_name']) for row in c.fetchall()]
 
     selected_client = None
-    report_html = ""
+    report_rows = []
+    report_totals = None
+    sort, direction, page = 'case_id', 'asc', 1
 
     # Backwards compatibility: old ?client_code= links
     if not client_id and client_code:
@@ -44,78 +63,133 @@ def report_page():
         if client_row:
             selected_client = client_row
 
-            c.execute("""
-                SELECT s.id as case_id,
-                       COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last) as debtor,
-                       m.type, m.amount
+            sort = request.args.get('sort', 'case_id')
+            if sort not in REPORT_SORTS:
+                sort = 'case_id'
+            direction = 'desc' if request.args.get('dir') == 'desc' else 'asc'
+            try:
+                page = max(int(request.args.get('page', 1)), 1)
+            except ValueError:
+                page = 1
+
+            c.execute(f"""
+                SELECT {REPORT_TOTALS}
                 FROM cases s
-                LEFT JOIN money m ON s.id = m.case_id
+                LEFT JOIN case_balances cb ON cb.case_id = s.id
                 WHERE s.client_id = %s
             """, (client_id,))
-            rows = c.fetchall()
+            report_totals = c.fetchone()
 
-            cases = {}
-            for r in rows:
-                case_id = r['case_id']
-                if case_id not in cases:
-                    cases[case_id] = {
-                        'debtor': r['debtor'],
-                        'Invoice': 0.0, 'Payment': 0.0, 'Charge': 0.0, 'Interest': 0.0
-                    }
-                if r['type']:
-                    cases[case_id][r['type']] += float(r['amount'] or 0)
-
-            report_html = """
-            <table border='1' style='width:100%; border-collapse:collapse; font-family:Arial; font-size:14px; margin-top:20px;'>
-                <tr style='background:#ddd;'>
-                    <th>Case ID</th><th>Debtor</th><th>Invoice</th><th>Payment</th><th>Charge</th><th>Interest</th><th>Balance</th>
-                </tr>
-            """
-            for case_id, d in cases.items():
-                balance = d['Invoice'] + d['Charge'] + d['Interest'] - d['Payment']
-                color = "red" if balance > 0 else "green"
-                report_html += f"""
-                <tr>
-                    <td>{case_id}</td><td>{d['debtor']}</td>
-                    <td>£{d['Invoice']:.2f}</td><td>£{d['Payment']:.2f}</td>
-                    <td>£{d['Charge']:.2f}</td><td>£{d['Interest']:.2f}</td>
-                    <td style='font-weight:bold; color:{color};'>£{balance:.2f}</td>
-                </tr>
-                """
-
-            grand = {t: sum(c[t] for c in cases.values()) for t in ['Invoice','Payment','Charge','Interest']}
-            grand_balance = grand['Invoice'] + grand['Charge'] + grand['Interest'] - grand['Payment']
-            report_html += f"""
-            <tr style='font-weight:bold; background:#eee;'>
-                <td colspan='2'>TOTALS</td>
-                <td>£{grand['Invoice']:.2f}</td><td>£{grand['Payment']:.2f}</td>
-                <td>£{grand['Charge']:.2f}</td><td>£{grand['Interest']:.2f}</td>
-                <td>£{grand_balance:.2f}</td>
-            </tr></table>
-            """
+            c.execute(f"""
+                SELECT {REPORT_COLUMNS}
+                FROM cases s
+                LEFT JOIN case_balances cb ON cb.case_id = s.id
+                WHERE s.client_id = %s
+                ORDER BY {REPORT_SORTS[sort]} {direction}, s.id {direction}
+                LIMIT %s OFFSET %s
+            """, (client_id, REPORT_PAGE_SIZE, (page - 1) * REPORT_PAGE_SIZE))
+            report_rows = c.fetchall()
 
     return render_template(
         'report.html',
         clients_json=[{
-            'id': str(row['id']),
-            'business_name': row['business_name'],
+            'id': str(cid),
+            'business_name': name,
             'code': ''  # no code column → just empty
-        } for row in all_clients],
+        } for cid, name in all_clients],
         selected_client=selected_client,
-        report_html=report_html,
+        report_rows=report_rows,
+        report_totals=report_totals,
+        sort=sort,
+        direction=direction,
+        page=page,
+        page_count=max(1, -(-report_totals['case_count'] // REPORT_PAGE_SIZE)) if report_totals else 1,
         query=query
     )
 
 
+# ----------------------------------------------------------------------
+# 1b. Portfolio – cross-client totals, read only from the daily snapshots
+#     written by snapshots.py (cost does not grow with the client count)
+# ----------------------------------------------------------------------
+PORTFOLIO_TOP_CLIENTS = 50
+
+
+@reports_bp.route('/portfolio')
+@login_required
+def portfolio():
+    db = get_db()
+    c = db.cursor()
+    c.execute("SELECT * FROM portfolio_daily_snapshots ORDER BY snapshot_date DESC LIMIT 1")
+    latest = c.fetchone()
+
+    top_clients = []
+    if latest:
+        c.execute("""
+            SELECT snap.*, cl.business_name
+            FROM client_daily_snapshots snap
+            JOIN clients cl ON cl.id = snap.client_id
+            WHERE snap.snapshot_date = %s
+            ORDER BY snap.outstanding DESC
+            LIMIT %s
+        """, (latest['snapshot_date'], PORTFOLIO_TOP_CLIENTS))
+        top_clients = c.fetchall()
+
+    return render_template('portfolio.html', latest=latest, top_clients=top_clients)
+
+
+@reports_bp.route('/portfolio/series')
+@login_required
+def portfolio_series():
+    """Daily totals as JSON: whole portfolio, or one client with ?client_id=."""
+    try:
+        days = min(max(int(request.args.get('days', 90)), 1), 3660)
+        client_id = int(request.args['client_id']) if request.args.get('client_id') else None
+    except ValueError:
+        return jsonify({'error': 'Invalid days or client_id'}), 400
+
+    db = get_db()
+    c = db.cursor()
+    if client_id is None:
+        c.execute("""
+            SELECT snapshot_date, client_count, invoiced, collected, charges, interest, outstanding
+            FROM portfolio_daily_snapshots
+            WHERE snapshot_date > CURRENT_DATE - %s
+            ORDER BY snapshot_date
+        """, (days,))
+    else:
+        c.execute("""
+            SELECT snapshot_date, invoiced, collected, charges, interest, outstanding
+            FROM client_daily_snapshots
+            WHERE client_id = %s AND snapshot_date > CURRENT_DATE - %s
+            ORDER BY snapshot_date
+        """, (client_id, days))
+    series = []
+    for row in c.fetchall():
+        point = dict(row)
+        point['snapshot_date'] = row['snapshot_date'].isoformat()
+        for col in SNAPSHOT_COLUMNS:
+            point[col] = float(row[col])
+        series.append(point)
+    return jsonify(series)
+
+
 # ----------------------------------------------------------------------
 # 2. Excel export
 # ----------------------------------------------------------------------
 @reports_bp.route('/export_excel')
 @login_required
 def export_excel():
+    """Stream the client report as XLSX with bounded memory.
+
+    Rows come from server-side cursors and go straight into a write-only
+    workbook spooled on disk, which is then streamed back in chunks.
+    ?detail=1 adds a per-transaction sheet.
+    """
     client_id = request.args.get('client_id') or request.args.get('client_code')
     if not client_id:
         return "No client specified", 400
+    with_detail = request.args.get('detail') in ('1', 'true', 'yes')
 
     db = get_db()
     c = db.cursor()
@@ -124,31 +198,44 @@ def export_excel():
     if not client:
         return "Client not found", 404
 
-    c.execute("""
-        SELECT s.id as case_id,
-               COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last) as debtor,
-               m.type, m.amount
-        FROM cases s
-        LEFT JOIN money m ON s.id = m.case_id
-        WHERE s.client_id = %s
-    """, (client_id,))
-    rows = c.fetchall()
-
-    cases = {}
-    for r in rows:
-        case_id = r['case_id']
-        if case_id not in cases:
-            cases[case_id] = {'debtor': r['debtor'], 'Invoice': 0, 'Payment': 0, 'Charge': 0, 'Interest': 0}
-        if r['type']:
-            cases[case_id][r['type']] += r['amount']
-
-    df = pd.DataFrame.from_dict(cases, orient='index')
-    df = df.reset_index().rename(columns={'index': 'Case ID', 'debtor': 'Debtor'})
-    df['Balance'] = df['Invoice'] + df['Charge'] + df['Interest'] - df['Payment']
-
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='Client Report')
+    wb = Workbook(write_only=True)
+
+    summary = wb.create_sheet('Client Report')
+    summary.append(['Case ID', 'Debtor', 'Invoice', 'Payment', 'Charge', 'Interest', 'Balance'])
+    with db.cursor(name='export_excel_summary') as rows:
+        rows.itersize = EXPORT_BATCH_ROWS
+        rows.execute(f"""
+            SELECT {REPORT_COLUMNS}
+            FROM cases s
+            LEFT JOIN case_balances cb ON cb.case_id = s.id
+            WHERE s.client_id = %s
+            ORDER BY s.id
+        """, (client_id,))
+        for r in rows:
+            summary.append([r['case_id'], r['debtor'], r['invoice'], r['payment'],
+                            r['charge'], r['interest'], r['balance']])
+
+    if with_detail:
+        detail = wb.create_sheet('Transactions')
+        detail.append(['Case ID', 'Transaction ID', 'Date', 'Type', 'Amount', 'VAT',
+                       'Recoverable', 'Billable', 'Billed', 'Description'])
+        with db.cursor(name='export_excel_detail') as rows:
+            rows.itersize = EXPORT_BATCH_ROWS
+            rows.execute("""
+                SELECT m.case_id, m.id, m.transaction_date, m.type, m.amount, m.vat_amount,
+                       m.recoverable, m.billable, m.billed, m.description
+                FROM money m
+                JOIN cases s ON s.id = m.case_id
+                WHERE s.client_id = %s
+                ORDER BY m.case_id, m.transaction_date, m.id
+            """, (client_id,))
+            for r in rows:
+                detail.append([r['case_id'], r['id'], r['transaction_date'], r['type'], r['amount'],
+                               r['vat_amount'], bool(r['recoverable']), bool(r['billable']),
+                               bool(r['billed']), r['description']])
+
+    output = tempfile.TemporaryFile()
+    wb.save(output)
     output.seek(0)
 
     return send_file(
@@ -160,51 +247,161 @@ def export_excel():
 
 
 # ----------------------------------------------------------------------
-# 3. PDF export
+# 3. Raw ledger export – CSV / NDJSON streamed straight from Postgres
+# ----------------------------------------------------------------------
+LEDGER_EXPORT_COLUMNS = """
+    m.id, m.case_id, s.client_id, m.transaction_date, m.type, m.amount, m.vat_amount,
+    m.recoverable, m.billable, m.billed, m.billeddate, m.charge_id, m.created_by, m.description
+"""
+
+
+def _ledger_export_filters(args):
+    """Build the WHERE clause for /export_ledger; raises ValueError on bad input."""
+    where, params = [], []
+    for arg, column in (('client_id', 's.client_id'), ('case_id', 'm.case_id')):
+        if args.get(arg):
+            where.append(f"{column} = %s")
+            params.append(int(args[arg]))
+    types = [t.strip() for t in args.get('type', '').split(',') if t.strip()]
+    if types:
+        where.append("m.type = ANY(%s)")
+        params.append(types)
+    if args.get('billed') not in (None, ''):
+        where.append("COALESCE(m.billed, 0) = %s")
+        params.append(1 if args['billed'] in ('1', 'true', 'yes') else 0)
+    if args.get('date_from'):
+        where.append("m.transaction_date >= %s")
+        params.append(date.fromisoformat(args['date_from']))
+    if args.get('date_to'):
+        where.append("m.transaction_date <= %s")
+        params.append(date.fromisoformat(args['date_to']))
+    return (" AND ".join(where) or "TRUE"), params
+
+
+@reports_bp.route('/export_ledger')
+@login_required
+def export_ledger():
+    """Stream money rows as CSV (via COPY) or NDJSON (via a server-side cursor).
+
+    Filters: client_id, case_id, type (comma separated), billed (0/1),
+    date_from / date_to (YYYY-MM-DD). Nothing is buffered beyond one chunk.
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if fmt not in ('csv', 'ndjson'):
+        return "format must be csv or ndjson", 400
+    try:
+        where, params = _ledger_export_filters(request.args)
+    except ValueError:
+        return "Invalid filter value", 400
+
+    query = f"""
+        SELECT {LEDGER_EXPORT_COLUMNS}
+        FROM money m
+        JOIN cases s ON s.id = m.case_id
+        WHERE {where}
+        ORDER BY m.case_id, m.transaction_date, m.id
+    """
+    db = get_db()
+
+    def generate_csv():
+        c = db.cursor()
+        with c.copy(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", params) as copy:
+            for chunk in copy:
+                yield bytes(chunk)
+
+    def generate_ndjson():
+        with db.cursor(name='export_ledger') as rows:
+            rows.itersize = EXPORT_BATCH_ROWS
+            rows.execute(query, params)
+            batch = []
+            for r in rows:
+                batch.append(json.dumps(r, default=str))
+                if len(batch) >= EXPORT_BATCH_ROWS:
+                    yield "\n".join(batch) + "\n"
+                    batch = []
+            if batch:
+                yield "\n".join(batch) + "\n"
+
+    if fmt == 'csv':
+        body, mimetype = generate_csv(), 'text/csv'
+    else:
+        body, mimetype = generate_ndjson(), 'application/x-ndjson'
+
+    # No Content-Length: the server sends it with chunked transfer encoding.
+    response = Response(stream_with_context(body), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=ledger_export.{fmt}'
+    return response
+
+
+# ----------------------------------------------------------------------
+# 4. PDF export – rendered by background jobs (see pdf_jobs.py)
 # ----------------------------------------------------------------------
+def _job_urls(job_id):
+    return {
+        'job_id': job_id,
+        'status_url': url_for('reports.pdf_job_status', job_id=job_id),
+        'download_url': url_for('reports.pdf_job_download', job_id=job_id),
+    }
+
+
+def _submit_pdf_job(client_id):
+    """Returns (job_id, status) or (None, None) when the client does not exist."""
+    c = get_db().cursor()
+    version = pdf_jobs.ledger_version(c, client_id)
+    if version is None:
+        return None, None
+    return pdf_jobs.submit(client_id, version, DATABASE_URL)
+
+
 @reports_bp.route('/export_pdf')
 @login_required
 def export_pdf():
+    """Send the cached PDF if it is current, otherwise start a render and show a waiting page."""
     client_id = request.args.get('client_id') or request.args.get('client_code')
-    if not client_id:
+    if not client_id or not client_id.isdigit():
         return "No client specified", 400
 
-    db = get_db()
-    c = db.cursor()
-    c.execute("SELECT id, business_name FROM clients WHERE id = %s", (client_id,))
-    client = c.fetchone()
-    if not client:
+    job_id, status = _submit_pdf_job(client_id)
+    if job_id is None:
         return "Client not found", 404
+    if status == 'done':
+        return redirect(url_for('reports.pdf_job_download', job_id=job_id))
+    if status == 'busy':
+        return "Too many PDF reports are being prepared, please try again shortly", 503
+    return render_template('pdf_job.html', **_job_urls(job_id)), 202
 
-    c.execute("""
-        SELECT s.id as case_id, s.debtor_business_name, s.debtor_first, s.debtor_last,
-               m.type, m.amount
-        FROM cases s
-        LEFT JOIN money m ON s.id = m.case_id
-        WHERE s.client_id = %s
-    """, (client_id,))
-    rows = c.fetchall()
-
-    cases = {}
-    for r in rows:
-        case_id = r['case_id']
-        if case_id not in cases:
-            debtor = r['debtor_business_name'] or f"{r['debtor_first']} {r['debtor_last']}"
-            cases[case_id] = {'debtor': debtor, 'Invoice': 0.0, 'Payment': 0.0, 'Charge': 0.0, 'Interest': 0.0}
-        if r['type']:
-            cases[case_id][r['type']] += float(r['amount'] or 0)
-
-    html = f"<h1>Client Report: {client['business_name']} (ID: {client['id']})</h1>"
-    html += "<table border='1' style='width:100%; border-collapse:collapse; font-family:Arial; font-size:12px;'><tr style='background:#ddd;'><th>Case ID</th><th>Debtor</th><th>Invoice</th><th>Payment</th><th>Charge</th><th>Interest</th><th>Balance</th></tr>"
-    for case_id, d in cases.items():
-        balance = d['Invoice'] + d['Charge'] + d['Interest'] - d['Payment']
-        html += f"<tr><td>{case_id}</td><td>{d['debtor']}</td><td>£{d['Invoice']:.2f}</td><td>£{d['Payment']:.2f}</td><td>£{d['Charge']:.2f}</td><td>£{d['Interest']:.2f}</td><td>£{balance:.2f}</td></tr>"
-    grand = {t: sum(c[t] for c in cases.values()) for t in ['Invoice','Payment','Charge','Interest']}
-    grand_balance = grand['Invoice'] + grand['Charge'] + grand['Interest'] - grand['Payment']
-    html += f"<tr style='font-weight:bold; background:#eee;'><td colspan='2'>TOTALS</td><td>£{grand['Invoice']:.2f}</td><td>£{grand['Payment']:.2f}</td><td>£{grand['Charge']:.2f}</td><td>£{grand['Interest']:.2f}</td><td>£{grand_balance:.2f}</td></tr></table>"
-
-    pdf = HTML(string=html).write_pdf()
-    response = make_response(pdf)
-    response.headers['Content-Type'] = 'application/pdf'
-    response.headers['Content-Disposition'] = f'attachment; filename=report_client_{client_id}.pdf'
-    return response
+
+@reports_bp.route('/export_pdf/jobs', methods=['POST'])
+@login_required
+def submit_pdf_job():
+    client_id = request.values.get('client_id', '')
+    if not client_id.isdigit():
+        return jsonify({'error': 'No client specified'}), 400
+
+    job_id, status = _submit_pdf_job(client_id)
+    if job_id is None:
+        return jsonify({'error': 'Client not found'}), 404
+    if status == 'busy':
+        return jsonify({'status': 'busy'}), 503
+    return jsonify({'status': status, **_job_urls(job_id)}), (200 if status == 'done' else 202)
+
+
+@reports_bp.route('/export_pdf/jobs/<job_id>')
+@login_required
+def pdf_job_status(job_id):
+    status = pdf_jobs.status(job_id)
+    body = {'status': status, **_job_urls(job_id)}
+    if status == 'failed':
+        body['error'] = pdf_jobs.error_message(job_id)
+    return jsonify(body), (404 if status == 'unknown' else 200)
+
+
+@reports_bp.route('/export_pdf/jobs/<job_id>/download')
+@login_required
+def pdf_job_download(job_id):
+    path = pdf_jobs.pdf_path(job_id)
+    if path is None:
+        return "PDF is not ready", 404
+    client_id = job_id.split('-')[0]
+    return send_file(path, as_attachment=True, download_name=f"report_client_{client_id}.pdf",
+                     mimetype='application/pdf')
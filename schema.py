@@ -0,0 +1,100 @@
+# =============================================================================
+#  SCHEMA - WHAT THIS DATABASE ACTUALLY HAS (TABLES / COLUMNS / INDEXES)
+#  • Read once per gunicorn worker (on first use) with a single catalog
+#    query, so routes pick their query variant for a partially migrated
+#    database from memory instead of probing with to_regclass per request
+#    or catching UndefinedTable half way through a transaction
+#  • Refresh:  POST /api/schema/refresh  reloads the calling worker;
+#    kill -HUP <gunicorn master> restarts every worker, and each one
+#    reloads on its first request. db_cleanse refreshes after its DDL.
+# =============================================================================
+
+import os
+import threading
+
+from extensions import get_pool
+
+CAPABILITIES_SQL = """
+    SELECT 'table' AS kind, c.relname AS name, NULL AS detail
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm')
+    UNION ALL
+    SELECT 'column', c.relname, a.attname
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p', 'v', 'm')
+      AND a.attnum > 0 AND NOT a.attisdropped
+    UNION ALL
+    SELECT 'index', indexname, tablename FROM pg_indexes WHERE schemaname = 'public'
+    UNION ALL
+    SELECT 'extension', extname, NULL FROM pg_extension
+"""
+
+
+class SchemaCapabilities:
+    def __init__(self, rows):
+        self.tables = set()
+        self.columns = {}
+        self.indexes = {}
+        self.extensions = set()
+        for row in rows:
+            kind, name, detail = row['kind'], row['name'], row['detail']
+            if kind == 'table':
+                self.tables.add(name)
+            elif kind == 'column':
+                self.columns.setdefault(name, set()).add(detail)
+            elif kind == 'index':
+                self.indexes[name] = detail
+            else:
+                self.extensions.add(name)
+
+    def has_table(self, table):
+        return table in self.tables
+
+    def has_column(self, table, column):
+        return column in self.columns.get(table, ())
+
+    def has_index(self, index):
+        return index in self.indexes
+
+    def has_extension(self, extension):
+        return extension in self.extensions
+
+    def as_dict(self):
+        return {
+            'tables': sorted(self.tables),
+            'indexes': sorted(self.indexes),
+            'extensions': sorted(self.extensions),
+        }
+
+
+_caps = None
+_caps_pid = None
+_lock = threading.Lock()
+
+
+def load(c):
+    c.execute(CAPABILITIES_SQL)
+    return SchemaCapabilities(c.fetchall())
+
+
+def get():
+    """This worker's capabilities, loaded on first use (and again after fork)."""
+    global _caps, _caps_pid
+    if _caps is None or _caps_pid != os.getpid():
+        with _lock:
+            if _caps is None or _caps_pid != os.getpid():
+                with get_pool().connection() as conn:
+                    _caps = load(conn.cursor())
+                _caps_pid = os.getpid()
+    return _caps
+
+
+def refresh():
+    """Drop this worker's copy; the next get() reads the catalog again."""
+    global _caps
+    with _lock:
+        _caps = None
+    return get()
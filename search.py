@@ -0,0 +1,137 @@
+# =============================================================================
+#  SEARCH - RANKED CASE / CLIENT LOOKUP FOR /search AND /client_search
+#  • Each searchable field is a fixed SQL expression; the baseline migration
+#    builds a trigram (pg_trgm) GIN index on exactly the same expression, so
+#    every LIKE '%q%' below is an index scan instead of a full table scan.
+#  • Matches are collected per field (best CANDIDATES_PER_FIELD by the same
+#    ranking), then ranked across fields:
+#      exact match > prefix match > substring match, plus trigram similarity
+#  • Each result says which fields matched.
+#  • If pg_trgm is not installed the same queries still work (unindexed, and
+#    ranked by match tier only).
+# =============================================================================
+
+import re
+
+# Searchable case/client fields: name -> SQL expression (s = cases, c = clients).
+# Keep these in sync with the indexes: migrations/0001_baseline.py builds them from this dict.
+SEARCH_FIELDS = {
+    'debtor': "lower(COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last))",
+    'client': "lower(c.business_name)",
+    'email': "lower(s.email)",
+    'phone': "regexp_replace(s.phone, '[^0-9]', '', 'g')",
+    'postcode': "upper(regexp_replace(s.postcode, '\\s', '', 'g'))",
+}
+
+# Rows collected per field before ranking; keeps latency flat on huge tables.
+CANDIDATES_PER_FIELD = 200
+
+
+def trigram_available():
+    # From the worker's schema registry; pg_trgm is only needed for similarity ranking.
+    # Imported here so payment_import can use SEARCH_FIELDS without a pool.
+    import schema
+    return schema.get().has_extension('pg_trgm')
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _search_terms(q):
+    """Normalise the raw query into one term per field (None = skip that field)."""
+    text = q.strip().lower()
+    digits = re.sub(r'[^0-9]', '', q)
+    postcode = re.sub(r'\s', '', q).upper()
+    return {
+        'debtor': text,
+        'client': text,
+        'email': text,
+        # Only treat the query as a phone number when it looks like one.
+        'phone': digits if len(digits) >= 3 and re.fullmatch(r'[0-9\s+()-]+', q.strip()) else None,
+        'postcode': postcode if len(postcode) >= 2 and postcode.isalnum() else None,
+    }
+
+
+def _rank_expr(field, use_trgm):
+    expr = SEARCH_FIELDS[field]
+    tier = f"""CASE
+                WHEN {expr} = %({field}_term)s THEN 3
+                WHEN {expr} LIKE %({field}_prefix)s THEN 2
+                WHEN {expr} LIKE %({field}_like)s THEN 1
+                ELSE 0 END"""
+    if use_trgm:
+        return f"({tier} + similarity({expr}, %({field}_term)s))"
+    return f"({tier})"
+
+
+def search_cases(c, q, limit=50):
+    """Ranked case search across debtor name, client name, email, phone and postcode."""
+    terms = {field: term for field, term in _search_terms(q).items() if term}
+    if not terms:
+        return []
+    use_trgm = trigram_available()
+
+    params = {'cap': CANDIDATES_PER_FIELD, 'limit': limit}
+    branches = []
+    for field, term in terms.items():
+        params[f'{field}_term'] = term
+        params[f'{field}_prefix'] = _escape_like(term) + '%'
+        params[f'{field}_like'] = '%' + _escape_like(term) + '%'
+        join = "JOIN clients c ON c.id = s.client_id" if field == 'client' else ""
+        # Best first within the field, so the cap never drops an exact or prefix hit
+        # in favour of an arbitrary substring one.
+        branches.append(f"""
+            (SELECT s.id FROM cases s {join}
+             WHERE {SEARCH_FIELDS[field]} LIKE %({field}_like)s
+             ORDER BY {_rank_expr(field, use_trgm)} DESC, s.id
+             LIMIT %(cap)s)""")
+
+    matched = ",\n               ".join(
+        f"COALESCE({SEARCH_FIELDS[field]} LIKE %({field}_like)s, FALSE) AS match_{field}" for field in terms
+    )
+    score = ", ".join(_rank_expr(field, use_trgm) for field in terms)
+    c.execute(f"""
+        WITH candidates AS ({' UNION '.join(branches)})
+        SELECT c.id AS client_id, c.business_name AS client_name,
+               s.id AS case_id,
+               COALESCE(s.debtor_business_name, s.debtor_first || ' ' || s.debtor_last) AS debtor_name,
+               s.postcode, s.email, s.phone,
+               {matched},
+               GREATEST({score}) AS score
+        FROM candidates hit
+        JOIN cases s ON s.id = hit.id
+        JOIN clients c ON c.id = s.client_id
+        ORDER BY score DESC, c.business_name, s.id
+        LIMIT %(limit)s
+    """, params)
+
+    results = []
+    for row in c.fetchall():
+        result = {k: v for k, v in row.items() if not k.startswith('match_')}
+        result['score'] = round(float(result['score'] or 0), 3)
+        result['matched'] = [field for field in terms if row[f'match_{field}']]
+        results.append(result)
+    return results
+
+
+def search_clients(c, q, limit=20):
+    """Ranked client name search used by the client autocomplete."""
+    term = q.strip().lower()
+    if not term:
+        return []
+    use_trgm = trigram_available()
+    params = {
+        'client_term': term,
+        'client_prefix': _escape_like(term) + '%',
+        'client_like': '%' + _escape_like(term) + '%',
+        'limit': limit,
+    }
+    c.execute(f"""
+        SELECT c.id, c.business_name AS name
+        FROM clients c
+        WHERE {SEARCH_FIELDS['client']} LIKE %(client_like)s
+        ORDER BY {_rank_expr('client', use_trgm)} DESC, c.business_name
+        LIMIT %(limit)s
+    """, params)
+    return [{'id': r['id'], 'name': r['name']} for r in c.fetchall()]
@@ -0,0 +1,181 @@
+# =============================================================================
+#  SNAPSHOTS - DAILY PORTFOLIO TOTALS PER CLIENT
+#  • client_daily_snapshots: invoiced / collected / charges / interest /
+#    outstanding per client per day (cumulative position at that date)
+#  • portfolio_daily_snapshots: the same totals rolled up across clients,
+#    one row per day, so portfolio views never touch money or cases
+#  • Incremental: only clients with case_balances rows touched since the
+#    previous run are recomputed; everyone else is carried forward
+#  • A past --date is rebuilt for every client from money rows with
+#    transaction_date <= that date (case_balances only knows today) and
+#    leaves the incremental watermark alone; future dates are refused
+#
+#  CLI (nightly cron):  python snapshots.py [--date YYYY-MM-DD] [--full]
+# =============================================================================
+
+import argparse
+import os
+import sys
+import time
+from datetime import date
+
+from ledger import BALANCE_EXPR
+
+SNAPSHOT_COLUMNS = ('invoiced', 'collected', 'charges', 'interest', 'outstanding')
+
+# Transactions that started before a run but committed after it carry an older
+# updated_at; re-checking this window on the next run catches them.
+WATERMARK_OVERLAP = '10 minutes'
+
+# Arbitrary constant for pg_advisory_xact_lock so only one run happens at a time.
+SNAPSHOT_LOCK_KEY = 7301001
+
+# SNAPSHOT_COLUMNS over money rows aliased m, for backfilling past dates.
+MONEY_TOTALS = f"""
+    COALESCE(SUM(m.amount) FILTER (WHERE m.type = 'Invoice'), 0),
+    COALESCE(SUM(m.amount) FILTER (WHERE m.type = 'Payment'), 0),
+    COALESCE(SUM(m.amount) FILTER (WHERE m.type = 'Charge'), 0),
+    COALESCE(SUM(m.amount) FILTER (WHERE m.type = 'Interest'), 0),
+    COALESCE(SUM({BALANCE_EXPR}), 0)
+"""
+
+
+def run_snapshot(c, snapshot_date=None, full=False):
+    """Write client and portfolio snapshots for snapshot_date (default today).
+
+    Returns a dict describing the run. The caller commits.
+    """
+    today = date.today()
+    snapshot_date = snapshot_date or today
+    if snapshot_date > today:
+        raise ValueError(f"Cannot snapshot a future date ({snapshot_date})")
+
+    c.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (SNAPSHOT_LOCK_KEY,))
+    if not c.fetchone()['locked']:
+        raise RuntimeError("Another snapshot run is in progress")
+
+    c.execute("SELECT CURRENT_TIMESTAMP AS started_at")
+    started_at = c.fetchone()['started_at']
+
+    c.execute("SELECT MAX(watermark) AS watermark FROM snapshot_runs")
+    last_watermark = c.fetchone()['watermark']
+    c.execute("SELECT MAX(snapshot_date) AS previous FROM client_daily_snapshots WHERE snapshot_date < %s",
+              (snapshot_date,))
+    previous_date = c.fetchone()['previous']
+    full = full or last_watermark is None or previous_date is None
+
+    columns = ', '.join(SNAPSHOT_COLUMNS)
+    totals = """
+        COALESCE(SUM(cb.invoice_total), 0),
+        COALESCE(SUM(cb.payment_total), 0),
+        COALESCE(SUM(cb.charge_total), 0),
+        COALESCE(SUM(cb.interest_total), 0),
+        COALESCE(SUM(cb.balance), 0)
+    """
+    upsert = ', '.join(f"{col} = EXCLUDED.{col}" for col in SNAPSHOT_COLUMNS)
+    backfill = snapshot_date < today
+
+    if backfill:
+        c.execute(f"""
+            INSERT INTO client_daily_snapshots (snapshot_date, client_id, {columns})
+            SELECT %(date)s, cl.id, {MONEY_TOTALS}
+            FROM clients cl
+            LEFT JOIN cases s ON s.client_id = cl.id
+            LEFT JOIN money m ON m.case_id = s.id AND m.transaction_date <= %(date)s
+            GROUP BY cl.id
+            ON CONFLICT (snapshot_date, client_id) DO UPDATE SET {upsert}
+        """, {'date': snapshot_date})
+        refreshed = c.rowcount
+        full = True
+    elif full:
+        c.execute(f"""
+            INSERT INTO client_daily_snapshots (snapshot_date, client_id, {columns})
+            SELECT %s, cl.id, {totals}
+            FROM clients cl
+            LEFT JOIN cases s ON s.client_id = cl.id
+            LEFT JOIN case_balances cb ON cb.case_id = s.id
+            GROUP BY cl.id
+            ON CONFLICT (snapshot_date, client_id) DO UPDATE SET {upsert}
+        """, (snapshot_date,))
+        refreshed = c.rowcount
+    else:
+        # Unchanged clients keep yesterday's figures...
+        c.execute(f"""
+            INSERT INTO client_daily_snapshots (snapshot_date, client_id, {columns})
+            SELECT %s, client_id, {columns}
+            FROM client_daily_snapshots
+            WHERE snapshot_date = %s
+            ON CONFLICT (snapshot_date, client_id) DO NOTHING
+        """, (snapshot_date, previous_date))
+
+        # ...and only clients with ledger activity (or new clients) are recomputed.
+        c.execute(f"""
+            WITH changed AS (
+                SELECT DISTINCT s.client_id
+                FROM case_balances cb
+                JOIN cases s ON s.id = cb.case_id
+                WHERE cb.updated_at > %s::timestamp - INTERVAL '{WATERMARK_OVERLAP}'
+                UNION
+                SELECT cl.id
+                FROM clients cl
+                LEFT JOIN client_daily_snapshots snap
+                    ON snap.client_id = cl.id AND snap.snapshot_date = %s
+                WHERE snap.client_id IS NULL
+            )
+            INSERT INTO client_daily_snapshots (snapshot_date, client_id, {columns})
+            SELECT %s, changed.client_id, {totals}
+            FROM changed
+            LEFT JOIN cases s ON s.client_id = changed.client_id
+            LEFT JOIN case_balances cb ON cb.case_id = s.id
+            GROUP BY changed.client_id
+            ON CONFLICT (snapshot_date, client_id) DO UPDATE SET {upsert}
+        """, (last_watermark, snapshot_date, snapshot_date))
+        refreshed = c.rowcount
+
+    c.execute(f"""
+        INSERT INTO portfolio_daily_snapshots (snapshot_date, client_count, {columns}, refreshed_at)
+        SELECT %s, COUNT(*), {', '.join(f'COALESCE(SUM({col}), 0)' for col in SNAPSHOT_COLUMNS)}, CURRENT_TIMESTAMP
+        FROM client_daily_snapshots
+        WHERE snapshot_date = %s
+        ON CONFLICT (snapshot_date) DO UPDATE SET
+            client_count = EXCLUDED.client_count, {upsert},
+            refreshed_at = EXCLUDED.refreshed_at
+    """, (snapshot_date, snapshot_date))
+
+    # A backfill says nothing about case_balances changes up to now, so it must
+    # not move the watermark the next incremental run starts from.
+    if not backfill:
+        c.execute("""
+            INSERT INTO snapshot_runs (snapshot_date, watermark, full_run, clients_refreshed)
+            VALUES (%s, %s, %s, %s)
+        """, (snapshot_date, started_at, full, refreshed))
+
+    return {'snapshot_date': snapshot_date, 'full': full, 'backfill': backfill,
+            'clients_refreshed': refreshed}
+
+
+def main():
+    import psycopg
+    from psycopg.rows import dict_row
+
+    parser = argparse.ArgumentParser(description="Write daily client/portfolio ledger snapshots")
+    parser.add_argument('--date', type=date.fromisoformat,
+                        help="snapshot date (default today); a past date is rebuilt from money")
+    parser.add_argument('--full', action='store_true', help="recompute every client, not just changed ones")
+    args = parser.parse_args()
+
+    if args.date and args.date > date.today():
+        parser.error("--date cannot be in the future")
+
+    start = time.perf_counter()
+    with psycopg.connect(os.environ['DATABASE_URL'], row_factory=dict_row) as conn:
+        result = run_snapshot(conn.cursor(), args.date, args.full)
+        conn.commit()
+    kind = 'backfill from money' if result['backfill'] else 'full' if result['full'] else 'incremental'
+    print(f"Snapshot {result['snapshot_date']} ({kind}): "
+          f"{result['clients_refreshed']} clients recomputed in {time.perf_counter() - start:.2f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# =============================================================================
+#  STRATEGY CACHE - PARSED STRATEGY DEFINITIONS, ONE COPY PER WORKER
+#  • Keyed by (strategy id, version); strategies.version is bumped by a
+#    trigger whenever the name or definition_json changes (see
+#    migrations/0001_baseline.py), so a stale entry is simply never asked
+#    for again
+#  • Callers select s.id / s.version (cheap) and get back a CompiledStrategy
+#    with the step list, lookup by code and cumulative offsets precomputed -
+#    definition_json is only fetched and parsed on a cache miss
+# =============================================================================
+
+import json
+import threading
+
+_cache = {}   # strategy_id -> CompiledStrategy (latest version seen)
+_lock = threading.Lock()
+
+
+class CompiledStrategy:
+    def __init__(self, strategy_id, version, name, definition):
+        self.id = strategy_id
+        self.version = version
+        self.name = name
+
+        steps = definition.get('steps') if isinstance(definition, dict) else None
+        self.steps = tuple(step for step in steps if isinstance(step, dict)) if isinstance(steps, list) else ()
+        self.start_status = definition.get('start_status') if isinstance(definition, dict) else None
+
+        # by_code: step code -> index into steps
+        self.by_code = {}
+        for idx, step in enumerate(self.steps):
+            if step.get('code'):
+                self.by_code.setdefault(step['code'], idx)
+
+        # cumulative_offsets[i]: days from entering the strategy until step i is due
+        # (each step's offset_days counts from the step before it).
+        self.cumulative_offsets = []
+        total = 0
+        for step in self.steps:
+            try:
+                total += int(step.get('offset_days') or 0)
+            except (TypeError, ValueError):
+                pass
+            self.cumulative_offsets.append(total)
+        self.cumulative_offsets = tuple(self.cumulative_offsets)
+
+    def step(self, step_index):
+        """Step dict at step_index, or None past the end."""
+        idx = _index(step_index)
+        return self.steps[idx] if idx < len(self.steps) else None
+
+    def step_by_code(self, code):
+        idx = self.by_code.get(code)
+        return None if idx is None else self.steps[idx]
+
+    def timeline(self, step_index, window=3):
+        """(last `window` executed steps, next `window` steps) around step_index."""
+        idx = _index(step_index)
+        return list(self.steps[max(0, idx - window):idx]), list(self.steps[idx:idx + window])
+
+
+def _index(step_index):
+    try:
+        return max(int(step_index or 0), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def get(c, strategy_id, version):
+    """CompiledStrategy for (strategy_id, version), loading it on a miss. None if it no longer exists."""
+    compiled = _cache.get(strategy_id)
+    if compiled is not None and compiled.version == version:
+        return compiled
+
+    c.execute("SELECT id, name, version, definition_json FROM strategies WHERE id = %s", (strategy_id,))
+    row = c.fetchone()
+    if not row:
+        return None
+    definition = row['definition_json']
+    if isinstance(definition, str):
+        definition = json.loads(definition)
+    compiled = CompiledStrategy(row['id'], row['version'], row['name'], definition)
+    with _lock:
+        current = _cache.get(strategy_id)
+        if current is None or current.version <= compiled.version:
+            _cache[strategy_id] = compiled
+    return compiled
+
+
+def invalidate(strategy_id=None):
+    """Drop one strategy (or everything) from this worker's cache."""
+    with _lock:
+        if strategy_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(strategy_id, None)
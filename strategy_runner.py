@@ -0,0 +1,194 @@
+# =============================================================================
+#  STRATEGY RUNNER - EXECUTES DUE case_strategy STEPS IN BATCHES
+#  See docs/minimal-strategy-schema.md for the data model. For each due case
+#  (next_action_date <= today, not paused, case mode 'automated', active):
+#  • apply steps[step_index].status / substatus to the case (with history)
+#  • write a 'Strategy' note
+#  • advance step_index and set next_action_date = today + offset_days of
+#    the following step (NULL once the last step has run)
+#  Each batch is claimed with FOR UPDATE SKIP LOCKED and executed by one
+#  set-based statement, so any number of runner processes can share the
+#  backlog without executing a case twice.
+#
+#  CLI:  python strategy_runner.py [--batch-size 1000] [--processes 4]
+#                                  [--date YYYY-MM-DD] [--user system]
+# =============================================================================
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+from datetime import date
+
+EXECUTE_BATCH_SQL = """
+    WITH due AS (
+        SELECT cs.case_id, cs.strategy_id, cs.step_index
+        FROM case_strategy cs
+        JOIN cases s ON s.id = cs.case_id
+        WHERE cs.next_action_date <= %(today)s
+          AND cs.paused = 0
+          AND s.mode = 'automated'
+          AND s.lifecycle_state = 'active'
+        ORDER BY cs.next_action_date, cs.case_id
+        LIMIT %(batch_size)s
+        FOR UPDATE OF cs SKIP LOCKED
+    ),
+    plan AS (
+        SELECT due.case_id,
+               COALESCE(due.step_index, 0) AS step_index,
+               st.name AS strategy_name,
+               st.definition_json -> 'steps' -> COALESCE(due.step_index, 0) AS step,
+               st.definition_json -> 'steps' -> (COALESCE(due.step_index, 0) + 1) AS next_step,
+               s.status AS old_status,
+               s.substatus AS old_substatus,
+               CASE WHEN s.next_action_date ~ '^\\d{4}-\\d{2}-\\d{2}$'
+                    THEN s.next_action_date::date END AS old_next_action_date
+        FROM due
+        JOIN strategies st ON st.id = due.strategy_id
+        JOIN cases s ON s.id = due.case_id
+    ),
+    advanced AS (
+        UPDATE case_strategy cs SET
+            step_index = CASE WHEN plan.step IS NULL THEN plan.step_index ELSE plan.step_index + 1 END,
+            next_action_date = CASE
+                WHEN plan.step IS NULL OR plan.next_step IS NULL THEN NULL
+                ELSE %(today)s::date + COALESCE((plan.next_step ->> 'offset_days')::int, 0)
+            END,
+            last_executed_at = CURRENT_TIMESTAMP,
+            updated_at = CURRENT_TIMESTAMP
+        FROM plan
+        WHERE cs.case_id = plan.case_id
+        RETURNING cs.case_id, cs.next_action_date
+    ),
+    case_updates AS (
+        UPDATE cases s SET
+            status = COALESCE(plan.step ->> 'status', s.status),
+            substatus = COALESCE(plan.step ->> 'substatus', s.substatus),
+            next_action_date = advanced.next_action_date::text
+        FROM plan
+        JOIN advanced ON advanced.case_id = plan.case_id
+        WHERE s.id = plan.case_id AND plan.step IS NOT NULL
+        RETURNING s.id
+    ),
+    history AS (
+        INSERT INTO case_status_history
+            (case_id, old_status, old_substatus, new_status, new_substatus, changed_by, old_next_action_date)
+        SELECT plan.case_id, plan.old_status, plan.old_substatus,
+               COALESCE(plan.step ->> 'status', plan.old_status),
+               COALESCE(plan.step ->> 'substatus', plan.old_substatus),
+               %(user_id)s, plan.old_next_action_date
+        FROM plan
+        WHERE plan.step IS NOT NULL
+        RETURNING case_id
+    ),
+    logged AS (
+        INSERT INTO notes (case_id, type, note, created_by)
+        SELECT plan.case_id, 'Strategy',
+               CASE
+                   WHEN plan.step IS NULL THEN
+                       format('Strategy ''%%s'' has no step %%s; strategy completed.',
+                              plan.strategy_name, plan.step_index)
+                   ELSE
+                       format('Strategy ''%%s'' executed step %%s (%%s): %%s / %%s.%%s',
+                              plan.strategy_name, plan.step_index,
+                              COALESCE(plan.step ->> 'code', '?'),
+                              COALESCE(plan.step ->> 'status', plan.old_status, ''),
+                              COALESCE(plan.step ->> 'substatus', plan.old_substatus, ''),
+                              CASE WHEN plan.next_step IS NULL THEN ' Strategy completed.'
+                                   ELSE format(' Next step %%s due %%s.',
+                                               COALESCE(plan.next_step ->> 'code', '?'),
+                                               advanced.next_action_date)
+                              END)
+               END,
+               %(user_id)s
+        FROM plan
+        JOIN advanced ON advanced.case_id = plan.case_id
+        RETURNING case_id
+    )
+    SELECT COUNT(*) FILTER (WHERE plan.step IS NOT NULL) AS executed,
+           COUNT(*) FILTER (WHERE plan.step IS NULL) AS completed,
+           (SELECT COUNT(*) FROM logged) AS notes
+    FROM plan
+"""
+
+
+def execute_batch(c, user_id, today=None, batch_size=1000):
+    """Claim and execute one batch of due steps. Returns (executed, completed); caller commits."""
+    c.execute(EXECUTE_BATCH_SQL, {
+        'today': today or date.today(),
+        'batch_size': batch_size,
+        'user_id': user_id,
+    })
+    row = c.fetchone()
+    return row['executed'], row['completed']
+
+
+def run(database_url, username, today=None, batch_size=1000, quiet=False):
+    """Drain the due backlog one committed batch at a time. Returns (cases, seconds)."""
+    import psycopg
+    from psycopg.rows import dict_row
+    from extensions import job_user_id
+
+    total = 0
+    start = time.perf_counter()
+    with psycopg.connect(database_url, row_factory=dict_row) as conn:
+        c = conn.cursor()
+        user_id = job_user_id(c, username)
+        while True:
+            batch_start = time.perf_counter()
+            executed, completed = execute_batch(c, user_id, today, batch_size)
+            conn.commit()
+            claimed = executed + completed
+            if not claimed:
+                break
+            total += claimed
+            if not quiet:
+                elapsed = time.perf_counter() - batch_start
+                print(f"[pid {os.getpid()}] batch: {executed} executed, {completed} completed "
+                      f"({claimed / elapsed:,.0f} cases/s)")
+    return total, time.perf_counter() - start
+
+
+def _run_process(args):
+    return run(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Execute due strategy steps")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=1, help="runner processes sharing the backlog")
+    parser.add_argument('--date', type=date.fromisoformat, help="treat this as today (default today)")
+    parser.add_argument('--user', default=os.environ.get('JOB_USER', 'system'),
+                        help="username recorded on notes and status history")
+    parser.add_argument('--quiet', action='store_true', help="only print the final summary")
+    args = parser.parse_args()
+
+    database_url = os.environ['DATABASE_URL']
+    # Check the user once up front rather than in every runner process.
+    import psycopg
+    from psycopg.rows import dict_row
+    from extensions import job_user_id
+    with psycopg.connect(database_url, row_factory=dict_row) as conn:
+        try:
+            job_user_id(conn.cursor(), args.user)
+        except LookupError as e:
+            parser.error(str(e))
+
+    job = (database_url, args.user, args.date, args.batch_size, args.quiet)
+    start = time.perf_counter()
+    if args.processes > 1:
+        with multiprocessing.Pool(args.processes) as pool:
+            results = pool.map(_run_process, [job] * args.processes)
+    else:
+        results = [run(*job)]
+    elapsed = time.perf_counter() - start
+
+    total = sum(count for count, _ in results)
+    print(f"Processed {total} due cases with {args.processes} process(es) in {elapsed:.2f}s "
+          f"({total / elapsed if elapsed else 0:,.0f} cases/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+"""Shared fixtures.
+
+Pure tests always run. Tests that need Postgres take the `c` / `make_case`
+fixtures and run against TEST_DATABASE_URL, a scratch database the suite
+migrates and writes to (never point it at real data); without it they are
+skipped.
+"""
+
+import os
+import sys
+import uuid
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TEST_DATABASE_URL = os.environ.get('TEST_DATABASE_URL')
+if TEST_DATABASE_URL:
+    # extensions.py reads DATABASE_URL on import (app / route tests).
+    os.environ['DATABASE_URL'] = TEST_DATABASE_URL
+
+TEST_USERNAME = 'pytest'
+TEST_PASSWORD = 'pytest'
+
+
+@pytest.fixture(scope='session')
+def database_url():
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    import migrate
+    migrate.migrate(TEST_DATABASE_URL, quiet=True)
+    return TEST_DATABASE_URL
+
+
+@pytest.fixture
+def conn(database_url):
+    import psycopg
+    from psycopg.rows import dict_row
+    with psycopg.connect(database_url, row_factory=dict_row) as conn:
+        yield conn
+
+
+@pytest.fixture
+def c(conn):
+    return conn.cursor()
+
+
+@pytest.fixture
+def user_id(conn, c):
+    import bcrypt
+    c.execute("SELECT id FROM users WHERE username = %s", (TEST_USERNAME,))
+    row = c.fetchone()
+    if not row:
+        c.execute("INSERT INTO users (username, password_hash) VALUES (%s, %s) RETURNING id",
+                  (TEST_USERNAME, bcrypt.hashpw(TEST_PASSWORD.encode(), bcrypt.gensalt())))
+        row = c.fetchone()
+        conn.commit()
+    return row['id']
+
+
+@pytest.fixture
+def make_case(c, user_id):
+    """make_case(**options) -> case dict (id, client_id, name, postcode) with its own client.
+
+    Names and postcodes are unique per call, so matching never hits rows
+    left behind by earlier runs. invoice= posts an opening Invoice.
+    """
+    def make(rate=0, open_date=date(2025, 1, 1), invoice=None, lifecycle_state='active', client_id=None):
+        tag = uuid.uuid4().hex[:10]
+        if client_id is None:
+            c.execute("""
+                INSERT INTO clients (business_type, business_name, default_interest_rate)
+                VALUES ('Ltd', %s, %s) RETURNING id
+            """, (f"Pytest client {tag}", rate))
+            client_id = c.fetchone()['id']
+        c.execute("""
+            INSERT INTO cases (client_id, debtor_first, debtor_last, postcode, open_date, lifecycle_state)
+            VALUES (%s, 'Pytest', %s, %s, %s, %s) RETURNING id
+        """, (client_id, tag, f"PT{tag}", open_date, lifecycle_state))
+        case = {'id': c.fetchone()['id'], 'client_id': client_id,
+                'name': f"Pytest {tag}", 'postcode': f"PT{tag}"}
+        if invoice is not None:
+            c.execute("""
+                INSERT INTO money (case_id, type, amount, transaction_date, created_by)
+                VALUES (%s, 'Invoice', %s, %s, %s)
+            """, (case['id'], invoice, open_date, user_id))
+        return case
+    return make
+
+
+@pytest.fixture
+def client(database_url, user_id):
+    """Flask test client logged in as the pytest user."""
+    from app import app
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        response = client.post('/login', data={'username': TEST_USERNAME, 'password': TEST_PASSWORD})
+        assert response.status_code == 302
+        yield client
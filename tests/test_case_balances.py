@@ -0,0 +1,71 @@
+from datetime import date
+from decimal import Decimal
+
+from ledger import TOTAL_COLUMNS, TOTALS_SELECT
+
+
+def _stored(c, case_id):
+    c.execute(f"SELECT {', '.join(TOTAL_COLUMNS)}, last_transaction_date FROM case_balances WHERE case_id = %s",
+              (case_id,))
+    return c.fetchone()
+
+
+def _recomputed(c, case_id):
+    c.execute(f"""
+        SELECT {TOTALS_SELECT}, MAX(m.transaction_date) AS last_transaction_date
+        FROM money m WHERE m.case_id = %s
+    """, (case_id,))
+    return c.fetchone()
+
+
+def _post(c, user_id, case_id, rows):
+    """Insert (type, amount, recoverable, date) rows in one statement; returns their ids."""
+    c.execute("""
+        INSERT INTO money (case_id, type, amount, recoverable, transaction_date, created_by)
+        SELECT %s, r.type, r.amount, r.recoverable, r.day, %s
+        FROM unnest(%s::text[], %s::numeric[], %s::int[], %s::date[]) AS r(type, amount, recoverable, day)
+        RETURNING id
+    """, (case_id, user_id, *map(list, zip(*rows))))
+    return [row['id'] for row in c.fetchall()]
+
+
+def test_insert_update_delete_keep_totals_in_step(c, user_id, make_case):
+    case_id = make_case()['id']
+    invoice_id, payment_id, *_ = _post(c, user_id, case_id, [
+        ('Invoice', Decimal('100.10'), 1, date(2025, 1, 1)),
+        ('Payment', Decimal('30.00'), 1, date(2025, 1, 5)),
+        ('Charge', Decimal('20.00'), 1, date(2025, 1, 3)),
+        ('Charge', Decimal('5.00'), 0, date(2025, 1, 3)),
+        ('Interest', Decimal('1.23'), 1, date(2025, 1, 4)),
+    ])
+    assert _stored(c, case_id) == {
+        'invoice_total': Decimal('100.10'), 'payment_total': Decimal('30.00'),
+        'charge_total': Decimal('25.00'), 'recoverable_charge_total': Decimal('20.00'),
+        'interest_total': Decimal('1.23'), 'balance': Decimal('91.33'),
+        'last_transaction_date': date(2025, 1, 5),
+    }
+
+    c.execute("UPDATE money SET amount = 40, transaction_date = '2025-01-02' WHERE id = %s", (payment_id,))
+    stored = _stored(c, case_id)
+    assert (stored['payment_total'], stored['balance']) == (Decimal('40.00'), Decimal('81.33'))
+    assert stored['last_transaction_date'] == date(2025, 1, 4)
+
+    c.execute("DELETE FROM money WHERE id = %s", (invoice_id,))
+    stored = _stored(c, case_id)
+    assert (stored['invoice_total'], stored['balance']) == (Decimal('0.00'), Decimal('-18.77'))
+    assert stored == _recomputed(c, case_id)
+
+
+def test_one_statement_across_cases(c, user_id, make_case):
+    first, second = make_case()['id'], make_case()['id']
+    c.execute("""
+        INSERT INTO money (case_id, type, amount, transaction_date, created_by)
+        VALUES (%s, 'Invoice', 10, '2025-01-01', %s), (%s, 'Invoice', 20, '2025-01-02', %s),
+               (%s, 'Payment', 5, '2025-01-03', %s)
+    """, (first, user_id, second, user_id, first, user_id))
+    assert _stored(c, first)['balance'] == Decimal('5.00')
+    assert _stored(c, second)['balance'] == Decimal('20.00')
+
+    c.execute("UPDATE money SET amount = amount * 2 WHERE case_id IN (%s, %s)", (first, second))
+    for case_id in (first, second):
+        assert _stored(c, case_id) == _recomputed(c, case_id)
@@ -0,0 +1,81 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from case_import import import_cases, normalize_row, parse_amount, parse_date, read_rows
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('2025-03-01', date(2025, 3, 1)),
+    ('01/03/2025', date(2025, 3, 1)),
+    ('01-03-2025', date(2025, 3, 1)),
+    ('01/03/25', date(2025, 3, 1)),
+    ('', None),
+])
+def test_parse_date(value, expected):
+    assert parse_date(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('1,234.50', Decimal('1234.50')),
+    ('£12', Decimal('12.00')),
+    ('40.005', Decimal('40.01')),   # half up, like Postgres ROUND
+    ('999999999999.99', Decimal('999999999999.99')),
+    ('', None),
+])
+def test_parse_amount(value, expected):
+    assert parse_amount(value) == expected
+
+
+@pytest.mark.parametrize('value', ['abc', 'NaN', 'Infinity', '-inf', '0', '-5', '0.001', '1e20', '1e30'])
+def test_parse_amount_rejects(value):
+    with pytest.raises(ValueError):
+        parse_amount(value)
+
+
+def test_normalize_row():
+    row = normalize_row({'debtor_first': ' Jo ', 'debtor_last': 'Bloggs', 'email': 'JO@Example.com',
+                         'postcode': 'sw1a  1aa', 'invoice_amount': '10.5'}, {7}, default_client_id=7)
+    assert row[0] == 7
+    assert row[3:5] == ('Jo', 'Bloggs')
+    assert row[6:8] == ('jo@example.com', 'SW1A 1AA')
+    assert row[9] == Decimal('10.50')
+
+
+@pytest.mark.parametrize('raw, message', [
+    ({'debtor_first': 'Jo'}, 'client_id is required'),
+    ({'client_id': '8', 'debtor_first': 'Jo'}, 'does not exist'),
+    ({'client_id': '7'}, 'is required'),
+    ({'client_id': '7', 'debtor_first': 'Jo', 'email': 'nope'}, 'not valid'),
+    ({'client_id': '7', 'debtor_first': 'Jo', 'invoice_date': '31/31/2025'}, 'not a date'),
+])
+def test_normalize_row_rejects(raw, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_row(raw, {7})
+
+
+def test_import_cases(c, user_id, make_case):
+    client_id = make_case()['client_id']
+    csv = (
+        "Debtor First,Debtor Last,Postcode,Invoice Amount,Invoice Date\n"
+        "Ann,One,AB1 2CD,100.00,2025-01-02\n"
+        "Bob,Two,,,\n"
+        ",,,,\n"
+        "Cy,Three,,-5,\n"
+    ).encode()
+    result = import_cases(c, read_rows(io.BytesIO(csv), 'cases.csv'), user_id, client_id)
+    assert (result['rows'], result['imported'], result['invoices']) == (3, 2, 1)
+    assert [line for line, _ in result['errors']] == [5]
+
+    c.execute("""
+        SELECT s.debtor_first, cb.balance, cb.last_transaction_date
+        FROM cases s LEFT JOIN case_balances cb ON cb.case_id = s.id
+        WHERE s.client_id = %s AND s.debtor_first IN ('Ann', 'Bob')
+        ORDER BY s.debtor_first
+    """, (client_id,))
+    assert [tuple(row.values()) for row in c.fetchall()] == [
+        ('Ann', Decimal('100.00'), date(2025, 1, 2)),
+        ('Bob', None, None),
+    ]
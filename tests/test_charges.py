@@ -0,0 +1,99 @@
+import uuid
+from decimal import Decimal
+
+import pytest
+
+from charges import apply_charge, get_charge
+
+
+@pytest.fixture
+def make_charge(c):
+    def make(charge_type='flat', default_amount=None, percent_rate=None, min_amount=None, max_amount=None,
+             vat_rate=0, recoverable=1):
+        c.execute("""
+            INSERT INTO charges (code, description, charge_type, default_amount, percent_rate,
+                                 min_amount, max_amount, vat_rate, recoverable, category)
+            VALUES (%s, 'Pytest charge', %s, %s, %s, %s, %s, %s, %s, 'Ancillary')
+            RETURNING id, code
+        """, (f"PT{uuid.uuid4().hex[:8]}", charge_type, default_amount, percent_rate,
+              min_amount, max_amount, vat_rate, recoverable))
+        return c.fetchone()
+    return make
+
+
+def _charges_on(c, case_id):
+    c.execute("SELECT amount, vat_amount FROM money WHERE case_id = %s AND type = 'Charge'", (case_id,))
+    return [(row['amount'], row['vat_amount']) for row in c.fetchall()]
+
+
+def test_percent_charge_clamped_to_min_and_max(c, user_id, make_case, make_charge):
+    charge = make_charge('percent', percent_rate=10, min_amount=5, max_amount=50, vat_rate=20)
+    low = make_case(invoice=Decimal('20.00'))
+    client_id = low['client_id']
+    high = make_case(invoice=Decimal('10000.00'), client_id=client_id)
+    middle = make_case(invoice=Decimal('300.00'), client_id=client_id)
+    empty = make_case(client_id=client_id)
+    closed = make_case(invoice=Decimal('300.00'), lifecycle_state='closed', client_id=client_id)
+
+    expected = {'cases': 5, 'charged': 3, 'skipped': 2, 'total_amount': Decimal('85.00'),
+                'total_vat': Decimal('17.00'), 'min_charge': Decimal('5.00'), 'max_charge': Decimal('50.00')}
+    preview = apply_charge(c, charge['id'], user_id, client_id=client_id, preview=True)
+    assert {key: preview[key] for key in expected} == expected
+    assert _charges_on(c, low['id']) == []
+
+    applied = apply_charge(c, charge['id'], user_id, client_id=client_id)
+    assert {key: applied[key] for key in expected} == expected
+    assert _charges_on(c, low['id']) == [(Decimal('5.00'), Decimal('1.00'))]
+    assert _charges_on(c, high['id']) == [(Decimal('50.00'), Decimal('10.00'))]
+    assert _charges_on(c, middle['id']) == [(Decimal('30.00'), Decimal('6.00'))]
+    assert _charges_on(c, empty['id']) == _charges_on(c, closed['id']) == []
+    c.execute("SELECT balance FROM case_balances WHERE case_id = %s", (low['id'],))
+    assert c.fetchone()['balance'] == Decimal('25.00')
+
+
+def test_flat_charge_amount_override(c, user_id, make_case, make_charge):
+    charge = make_charge(default_amount=15)
+    first = make_case()
+    second = make_case()
+    result = apply_charge(c, charge['id'], user_id, case_ids=[first['id'], second['id']])
+    assert (result['charged'], result['total_amount']) == (2, Decimal('30.00'))
+    apply_charge(c, charge['id'], user_id, case_ids=[first['id']], amount=Decimal('40.01'))
+    assert sorted(_charges_on(c, first['id'])) == [(Decimal('15.00'), Decimal('0.00')),
+                                                  (Decimal('40.01'), Decimal('0.00'))]
+
+
+def test_get_charge_by_id_or_code(c, make_charge):
+    first, second = make_charge(default_amount=1), make_charge(default_amount=2)
+    assert get_charge(c, charge_id=first['id'], code=second['code'])['id'] == first['id']
+    assert get_charge(c, code=second['code'])['id'] == second['id']
+    assert get_charge(c, code='no such code') is None
+
+
+@pytest.mark.parametrize('form, error', [
+    ({'amount': 'NaN'}, 'positive'),
+    ({'amount': 'Infinity'}, 'positive'),
+    ({'amount': '-1'}, 'positive'),
+    ({'amount': '0'}, 'positive'),
+    ({'amount': '0.001'}, 'rounds to 0.00'),
+    ({'amount': '1e20'}, 'more than'),
+    ({'amount': 'abc'}, 'not an amount'),
+    ({'transaction_date': '31/12/2025'}, 'isoformat'),
+])
+def test_apply_route_rejects_bad_input(conn, make_case, make_charge, client, form, error):
+    charge = make_charge(default_amount=15)
+    case = make_case()
+    conn.commit()
+    response = client.post('/charges/apply', data={'code': charge['code'], 'case_ids': str(case['id']), **form})
+    assert response.status_code == 400
+    assert error in response.get_json()['error']
+
+
+def test_apply_route_preview_rounds_half_up(conn, make_case, make_charge, client):
+    charge = make_charge(default_amount=15)
+    case = make_case()
+    conn.commit()
+    response = client.post('/charges/apply', data={
+        'charge_id': charge['id'], 'case_ids': str(case['id']), 'amount': '40.005',
+        'transaction_date': '2025-06-30', 'preview': '1'})
+    assert response.status_code == 200
+    assert Decimal(response.get_json()['total_amount']) == Decimal('40.01')
@@ -0,0 +1,101 @@
+from datetime import date
+from decimal import Decimal
+
+import pandas as pd
+
+from interest_accrual import EPOCH, compute_interest, run_accrual
+
+FIRST = date(2025, 1, 1)
+RATE_8 = 80_000  # 8% in ten-thousandths of a percent
+
+
+def _day(d):
+    return (d - EPOCH).days
+
+
+def _interest(ledger_rows, end, rate_e4=RATE_8, first=FIRST):
+    """compute_interest for one case (id 1); ledger_rows are (date, delta pence)."""
+    targets = pd.DataFrame({'case_id': [1], 'first_day': [_day(first)], 'rate_e4': [rate_e4]}, dtype='int64')
+    ledger = pd.DataFrame({
+        'case_id': [1] * len(ledger_rows),
+        'day': [_day(d) for d, _ in ledger_rows],
+        'delta': [delta for _, delta in ledger_rows],
+    }, dtype='int64')
+    row = compute_interest(targets, ledger, _day(end)).iloc[0]
+    return int(row['pence_days']), int(row['amount_pence'])
+
+
+def test_opening_balance_on_first_day_earns_for_whole_period():
+    # LEDGER_COPY_SQL collapses everything before the period onto first_day.
+    pence_days, amount = _interest([(FIRST, 100_000)], date(2025, 1, 10))
+    assert pence_days == 100_000 * 10
+    assert amount == 219  # 1000.00 x 8% x 10 / 365 = 219.2p
+
+
+def test_period_end_is_inclusive():
+    assert _interest([(FIRST, 100_000)], FIRST) == (100_000, 22)
+
+
+def test_movements_change_principal_from_their_day():
+    pence_days, _ = _interest([(FIRST, 100_000), (date(2025, 1, 4), -40_000)], date(2025, 1, 10))
+    assert pence_days == 100_000 * 3 + 60_000 * 7
+
+
+def test_principal_floored_at_zero_after_overpayment():
+    pence_days, _ = _interest([
+        (FIRST, 10_000),
+        (date(2025, 1, 3), -15_000),   # overpaid: -50.00 earns nothing
+        (date(2025, 1, 6), 10_000),    # new invoice: principal back to 50.00
+    ], date(2025, 1, 10))
+    assert pence_days == 10_000 * 2 + 0 * 3 + 5_000 * 5
+
+
+def test_rounds_half_pence_up():
+    # At 1% (rate_e4 10 000) a penny takes 36 500 pence-days: 18 250 is exactly
+    # 0.5p and 91 250 is 2.5p (which banker's rounding would take down to 2p).
+    assert _interest([(FIRST, 1_825)], date(2025, 1, 10), rate_e4=10_000)[1] == 1
+    assert _interest([(FIRST, 9_125)], date(2025, 1, 10), rate_e4=10_000)[1] == 3
+    assert _interest([(FIRST, 9_124)], date(2025, 1, 10), rate_e4=10_000)[1] == 2
+
+
+def test_case_without_ledger_rows_earns_nothing():
+    targets = pd.DataFrame({'case_id': [1, 2], 'first_day': [_day(FIRST)] * 2, 'rate_e4': [RATE_8] * 2},
+                           dtype='int64')
+    ledger = pd.DataFrame({'case_id': [1], 'day': [_day(FIRST)], 'delta': [100_000]}, dtype='int64')
+    result = compute_interest(targets, ledger, _day(FIRST)).set_index('case_id')
+    assert result.loc[2, 'pence_days'] == 0
+    assert result.loc[2, 'amount_pence'] == 0
+
+
+def _interest_rows(c, case_id):
+    c.execute("""
+        SELECT amount, transaction_date FROM money
+        WHERE case_id = %s AND type = 'Interest'
+        ORDER BY transaction_date
+    """, (case_id,))
+    return [(row['amount'], row['transaction_date']) for row in c.fetchall()]
+
+
+def test_rerun_for_same_period_posts_nothing(conn, c, user_id, make_case):
+    case = make_case(rate=8, open_date=FIRST, invoice=Decimal('1000.00'))
+    conn.commit()
+
+    january = date(2025, 1, 31)
+    run_accrual(c, user_id, january)
+    conn.commit()
+    assert _interest_rows(c, case['id']) == [(Decimal('6.79'), january)]  # 1000 x 8% x 31 / 365
+
+    run_accrual(c, user_id, january)
+    conn.commit()
+    assert _interest_rows(c, case['id']) == [(Decimal('6.79'), january)]
+    c.execute("SELECT COUNT(*) AS n FROM interest_accruals WHERE case_id = %s", (case['id'],))
+    assert c.fetchone()['n'] == 1
+
+    # The next period starts the day after and ignores the Interest already posted.
+    february = date(2025, 2, 28)
+    run_accrual(c, user_id, february)
+    conn.commit()
+    assert _interest_rows(c, case['id'])[-1] == (Decimal('6.14'), february)  # 1000 x 8% x 28 / 365
+    c.execute("SELECT period_start FROM interest_accruals WHERE case_id = %s AND period_end = %s",
+              (case['id'], february))
+    assert c.fetchone()['period_start'] == date(2025, 2, 1)
@@ -0,0 +1,109 @@
+import uuid
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from payment_import import import_statement, normalize_line
+
+
+def _case_ref(raw):
+    return normalize_line({'date': '2025-03-01', 'amount': '10', **raw})[5]
+
+
+@pytest.mark.parametrize('raw, expected', [
+    ({'reference': 'HBR-004512'}, 4512),
+    ({'reference': 'paid hbr 4512 thanks'}, 4512),
+    ({'reference': 'HBR/4512'}, 4512),
+    ({'ref': 'HBR4512'}, 4512),
+    ({'case_id': '4512'}, 4512),
+    ({'case': 'HBR-004512'}, 4512),
+    ({'reference': '004512'}, None),            # a bare number could be anything
+    ({'reference': 'Invoice 4512'}, None),
+    ({'reference': 'XHBR-4512'}, None),
+    ({'description': 'HBR-004512'}, None),      # free-text columns are not references
+    ({'narrative': 'HBR-004512'}, None),
+    ({'account': '4512'}, None),
+])
+def test_case_reference(raw, expected):
+    assert _case_ref(raw) == expected
+
+
+def test_normalize_line_keys():
+    line = normalize_line({'date': '01/03/2025', 'credit': '£1,000', 'name': ' Jo   BLOGGS ', 'postcode': 'sw1a 1aa'})
+    assert line[:2] == (date(2025, 3, 1), Decimal('1000.00'))
+    assert line[6:] == ('jo bloggs', 'SW1A1AA')
+
+
+@pytest.mark.parametrize('raw, message', [
+    ({'amount': '10'}, 'date'),
+    ({'date': '2025-03-01'}, 'amount'),
+    ({'date': '2025-03-01', 'amount': 'NaN'}, 'positive'),
+])
+def test_normalize_line_rejects(raw, message):
+    with pytest.raises(ValueError, match=message):
+        normalize_line(raw)
+
+
+def _statement(lines):
+    # A unique first line keeps the file hash unique across runs.
+    rows = [f"2025-03-01,0.01,{uuid.uuid4().hex},,"] + lines
+    return ("Date,Amount,Reference,Name,Postcode\n" + "\n".join(rows) + "\n").encode()
+
+
+def _posted(c, case_id):
+    c.execute("SELECT amount FROM money WHERE case_id = %s AND type = 'Payment' ORDER BY id", (case_id,))
+    return [row['amount'] for row in c.fetchall()]
+
+
+def test_matching_rules(conn, c, user_id, make_case):
+    case = make_case(invoice=Decimal('50.00'))
+    other = make_case(invoice=Decimal('80.00'))
+    ref = f"HBR-{case['id']:06d}"
+    data = _statement([
+        f"2025-03-02,1.00,{ref},{case['name']},",         # 3 reference + payer name
+        f"2025-03-02,2.00,{ref},,{case['postcode']}",      # 4 reference + postcode
+        f"2025-03-02,50.00,{ref},,",                       # 5 reference + amount = balance
+        f"2025-03-02,3.00,{ref},{other['name']},",         # 6 reference nothing backs up
+        f"2025-03-02,4.00,{case['id']},,",                 # 7 bare number
+        f"2025-03-02,5.00,,{other['name']},{other['postcode']}",  # 8 name + postcode
+        f"2025-03-02,6.00,,{other['name']},",              # 9 name only
+        "2025-03-02,nope,,,",                              # 10 rejected
+    ])
+    result = import_statement(c, data, 'statement.csv', user_id)
+    conn.commit()
+
+    assert result['by_rule'] == {'reference': 3, 'debtor_postcode': 1, 'debtor': 1, 'postcode_amount': 0}
+    assert (result['matched'], result['queued'], result['duplicates']) == (5, 3, 0)
+    assert [line for line, _ in result['errors']] == [10]
+    assert _posted(c, case['id']) == [Decimal('1.00'), Decimal('2.00'), Decimal('50.00')]
+    assert _posted(c, other['id']) == [Decimal('5.00'), Decimal('6.00')]
+
+    c.execute("""
+        SELECT line_no, reason, candidate_case_ids FROM payment_review_queue
+        WHERE statement_id = %s AND line_no > 2 ORDER BY line_no
+    """, (result['statement_id'],))
+    assert [tuple(row.values()) for row in c.fetchall()] == [
+        (6, 'unconfirmed reference', [case['id']]),
+        (7, 'no match', None),
+    ]
+
+
+def test_statement_and_line_dedupe(conn, c, user_id, make_case):
+    case = make_case(invoice=Decimal('50.00'))
+    line = f"2025-03-03,7.00,HBR-{case['id']},{case['name']},"
+    data = _statement([line, line])
+    first = import_statement(c, data, 'statement.csv', user_id)
+    conn.commit()
+    assert (first['matched'], first['queued']) == (2, 1)  # the unique first line matches nothing
+    assert _posted(c, case['id']) == [Decimal('7.00')] * 2  # identical lines in one file both post
+
+    again = import_statement(c, data, 'statement.csv', user_id)
+    conn.rollback()
+    assert again['duplicate']
+
+    # An overlapping statement: the two lines already seen are skipped, a third copy posts.
+    overlap = import_statement(c, _statement([line, line, line]), 'overlap.csv', user_id)
+    conn.commit()
+    assert (overlap['duplicates'], overlap['matched']) == (2, 1)
+    assert _posted(c, case['id']) == [Decimal('7.00')] * 3